@@ -0,0 +1,59 @@
+'''
+Compare two sets of benchmark/pipeline.py results, e.g. from two commits.
+
+For every size and stage found in both files, the latest result of each is
+compared; a stage is a regression when it got slower by more than the
+threshold. Results are printed as CSV on STDOUT, and the exit status is 1 if
+there is any regression.
+
+Usage (from pipeline/):
+    python3 -m benchmark.compare baseline.jsonl results.jsonl [--threshold 0.1]
+'''
+
+import sys
+import json
+import argparse
+
+
+def _read(path):
+    # {(rows, stage): seconds}, keeping the last line of each pair.
+    results = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            result = json.loads(line)
+            if result.get("seconds") is not None:
+                results[(result["rows"], result["stage"])] = result["seconds"]
+    return results
+
+
+def compare(baseline, results, threshold):
+    # Returns a list of (rows, stage, baseline_seconds, seconds, ratio, regressed).
+    rows = []
+    for key in sorted(set(baseline) & set(results)):
+        before, after = baseline[key], results[key]
+        ratio = after / before if before else float("inf")
+        rows.append((key[0], key[1], before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Slowdown tolerated before a regression (default: 0.1, i.e. 10%%).")
+    args = parser.parse_args(args)
+
+    rows = compare(_read(args.baseline), _read(args.results), args.threshold)
+    print("rows,stage,baseline_seconds,seconds,ratio,regression")
+    for row in rows:
+        print("{},{},{:.3f},{:.3f},{:.2f},{}".format(*row))
+
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
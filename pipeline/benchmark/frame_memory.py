@@ -0,0 +1,54 @@
+'''
+Benchmark of the memory used by a queried ctran_data frame: the object
+columns Table._query_table used to produce against CTran_Data's typed read
+path.
+
+The rows of assets/ctran_ete_test.csv are repeated up to a full day of data,
+so this does not need a database.
+
+Usage (from pipeline/):
+    python3 -m benchmark.frame_memory
+    python3 -m benchmark.frame_memory --rows 1000000
+'''
+
+import sys
+import argparse
+import numpy
+import pandas
+
+from src.tables import CTran_Data
+
+SAMPLE = "assets/ctran_ete_test.csv"
+
+
+def _make_frame(count):
+    sample = pandas.read_csv(SAMPLE, parse_dates=["service_date"])
+    repeats = numpy.resize(numpy.arange(len(sample)), count)
+    df = sample.iloc[repeats].reset_index(drop=True)
+    df.index.name = "row_id"
+    return df
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000,
+                        help="Rows in a full day of data (default: 500000).")
+    args = parser.parse_args(args)
+
+    # The engine is never connected to; only the column types are used.
+    ctran = CTran_Data(engine="postgresql://benchmark@localhost/benchmark")
+    df = _make_frame(args.rows)
+
+    frames = [
+        ("object", df.where(df.notnull(), None)),
+        ("typed", ctran._convert_types(df)),
+    ]
+
+    print("rows,path,bytes_per_row,megabytes")
+    for name, frame in frames:
+        total = frame.memory_usage(deep=True).sum()
+        print("{},{},{:.1f},{:.1f}".format(args.rows, name, total / args.rows, total / 2**20))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,200 @@
+'''
+Synthetic C-Tran data following the ctran_data schema, for benchmarking the
+pipeline at sizes the sample files cannot reach.
+
+Each service date runs a fixed network of routes, each with its own sequence
+of stops; trips run a route in either direction, producing one row per stop
+in order, arriving at each stop no earlier than at the one before. Nulls,
+duplicated rows, zero-door stops, stops far from their location and arrive
+time regressions are injected at configurable rates. Rows are produced in chunks, so
+tens of millions of them never need to be held in memory at once.
+
+Usage (from pipeline/):
+    python3 -m benchmark.generator --rows 100000 --output output/synthetic.csv
+'''
+
+import sys
+import argparse
+import numpy
+import pandas
+from datetime import date, timedelta
+
+from src.tables import CTran_Data
+
+COLUMNS = CTran_Data(engine="postgresql://benchmark@localhost/benchmark")._expected_cols
+
+START_DATE = date(2020, 1, 1)
+ROWS_PER_DAY = 500000
+ROUTE_COUNT = 60
+STOP_COUNT = 3000
+
+# Columns that never get injected nulls: without a service_date, a row cannot
+# be queried by date range at all.
+NOT_NULL = ["service_date"]
+
+
+class _Network():
+    # The routes shared by every service date: route numbers, and the
+    # location_id, cumulative pattern_distance and coordinates of their stops.
+    def __init__(self, rng):
+        self.route_numbers = numpy.sort(rng.choice(numpy.arange(1, 200), ROUTE_COUNT, replace=False))
+        stop_x = rng.uniform(1080000, 1180000, STOP_COUNT)
+        stop_y = rng.uniform(90000, 160000, STOP_COUNT)
+        self.stops = []
+        for _ in range(ROUTE_COUNT):
+            locations = rng.choice(STOP_COUNT, rng.integers(20, 61), replace=False)
+            gaps = rng.gamma(4.0, 300.0, len(locations))
+            gaps[0] = 0.0
+            self.stops.append((locations + 1, numpy.cumsum(gaps),
+                               stop_x[locations], stop_y[locations]))
+
+
+def generate_chunks(rows, chunksize=250000, seed=0, start_date=START_DATE,
+                    rows_per_day=ROWS_PER_DAY, null_rate=0.001,
+                    duplicate_rate=0.001, zero_door_rate=0.2, far_stop_rate=0.05,
+                    regression_rate=0.001):
+    # Generator of DataFrames of at most chunksize rows with the columns of
+    # ctran_data (but row_id), rows in total, rows_per_day per service date.
+    # Duplicated rows always share the chunk of the row they copy.
+    rng = numpy.random.default_rng(seed)
+    network = _Network(rng)
+    rates = (null_rate, duplicate_rate, zero_door_rate, far_stop_rate, regression_rate)
+
+    trip_id = 0
+    service_date = start_date
+    day_rows = 0
+    while rows > 0:
+        count = min(chunksize, rows, rows_per_day - day_rows)
+        df = _make_rows(rng, network, service_date, count, trip_id, rates)
+        trip_id = int(df["trip_id"].max())
+        yield df
+
+        rows -= count
+        day_rows += count
+        if day_rows >= rows_per_day:
+            service_date += timedelta(days=1)
+            day_rows = 0
+
+
+def _make_rows(rng, network, service_date, count, first_trip_id, rates):
+    null_rate, duplicate_rate, zero_door_rate, far_stop_rate, regression_rate = rates
+    originals = count - int(count * duplicate_rate)
+
+    # Whole trips, truncated to the number of rows wanted.
+    blocks = []
+    total = 0
+    trip_id = first_trip_id
+    while total < originals:
+        trip_id += 1
+        route = int(rng.integers(ROUTE_COUNT))
+        locations, distances, x, y = network.stops[route]
+        direction = int(rng.integers(2))
+        if direction:
+            locations, x, y = locations[::-1], x[::-1], y[::-1]
+            distances = distances[-1] - distances[::-1]
+        blocks.append((trip_id, route, direction, locations, distances, x, y))
+        total += len(locations)
+
+    stops = numpy.array([len(block[3]) for block in blocks])
+    trip_ids = numpy.repeat([block[0] for block in blocks], stops)
+    routes = numpy.repeat([block[1] for block in blocks], stops)
+    directions = numpy.repeat([block[2] for block in blocks], stops)
+    locations = numpy.concatenate([block[3] for block in blocks])
+    pattern_distance = numpy.concatenate([block[4] for block in blocks])
+    x = numpy.concatenate([block[5] for block in blocks])
+    y = numpy.concatenate([block[6] for block in blocks])
+
+    # Trips leave between 5:00 and 23:00, at about 30 mph between stops.
+    # A trip starts up to 2 minutes early or 3 late and only falls further
+    # behind its stop_time from stop to stop, so arrive_time never goes back
+    # within a trip but where a regression is injected.
+    trip_count = len(blocks)
+    leave_time = numpy.repeat(rng.integers(5 * 3600, 23 * 3600, trip_count), stops)
+    stop_time = leave_time + (pattern_distance / 44.0).astype(int)
+    starts = numpy.cumsum(stops) - stops
+    delay = numpy.cumsum(rng.exponential(5, total))
+    delay -= numpy.repeat(delay[starts], stops)
+    arrive_time = (stop_time + numpy.repeat(rng.integers(-120, 180, trip_count), stops)
+                   + delay.astype(int))
+    regressed = rng.random(total) < regression_rate
+    regressed[starts] = False
+    arrive_time[regressed] = arrive_time[numpy.flatnonzero(regressed) - 1] \
+        - rng.integers(1, 120, int(regressed.sum()))
+    dwell = rng.exponential(15, total).astype(int)
+
+    door = rng.poisson(2, total) + 1
+    door[rng.random(total) < zero_door_rate] = 0
+    ons = numpy.where(door > 0, rng.poisson(2, total), 0)
+    offs = numpy.where(door > 0, rng.poisson(2, total), 0)
+
+    location_distance = rng.exponential(10, total)
+    far = rng.random(total) < far_stop_rate
+    location_distance[far] = rng.uniform(50, 1000, int(far.sum()))
+
+    weekday = service_date.weekday()
+    service_key = "W" if weekday < 5 else ("S" if weekday == 5 else "U")
+
+    df = pandas.DataFrame({
+        "service_date": pandas.Timestamp(service_date),
+        "vehicle_number": 2000 + trip_ids % 400,
+        "leave_time": leave_time,
+        "train": trip_ids % 400,
+        "route_number": network.route_numbers[routes],
+        "direction": directions,
+        "service_key": service_key,
+        "trip_number": leave_time // 60 * 10 + directions,
+        "stop_time": stop_time,
+        "arrive_time": arrive_time,
+        "dwell": dwell,
+        "location_id": locations,
+        "door": door,
+        "lift": (rng.random(total) < 0.01).astype(int),
+        "ons": ons,
+        "offs": offs,
+        "estimated_load": rng.poisson(12, total),
+        "maximum_speed": rng.integers(0, 60, total),
+        "train_mileage": numpy.round(pattern_distance / 5280.0, 3),
+        "pattern_distance": numpy.round(pattern_distance, 1),
+        "location_distance": numpy.round(location_distance, 1),
+        "x_coordinate": numpy.round(x + rng.normal(0, 5, total), 1),
+        "y_coordinate": numpy.round(y + rng.normal(0, 5, total), 1),
+        "data_source": rng.integers(0, 5, total),
+        "schedule_status": rng.integers(0, 7, total),
+        "trip_id": trip_ids,
+    }, columns=COLUMNS)
+    df = df.iloc[:originals]
+
+    # Scatter nulls over every nullable column, keeping the integer columns
+    # as nullable integers.
+    for col in COLUMNS:
+        if col in NOT_NULL:
+            continue
+        nulls = rng.random(len(df)) < null_rate
+        if nulls.any():
+            if df[col].dtype.kind == "i":
+                df[col] = df[col].astype("Int64")
+            df.loc[nulls, col] = None
+
+    # Duplicates are copies of random rows.
+    duplicates = df.iloc[rng.integers(0, len(df), count - originals)]
+    return pandas.concat([df, duplicates], ignore_index=True)
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="Number of rows to generate (default: 100000).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True,
+                        help="CSV file to write, loadable by CTran_Data.create_table.")
+    args = parser.parse_args(args)
+
+    header = True
+    for df in generate_chunks(args.rows, seed=args.seed):
+        df.to_csv(args.output, mode="w" if header else "a", header=header,
+                  index=False, date_format="%Y-%m-%d")
+        header = False
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
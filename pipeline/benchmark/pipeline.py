@@ -0,0 +1,211 @@
+'''
+End-to-end throughput benchmark of the pipeline, over synthetic C-Tran data
+(see benchmark/generator.py).
+
+For every size, the synthetic rows are loaded into a fresh ctran_data table,
+and then processed chunk by chunk the way _Client._process_range does it,
+timing each stage separately: reading the chunks from Portal, resolving their
+service periods, flagging them, and writing the flags to Hive.
+
+This needs a live PostgreSQL instance, which stands in for both Portal and
+Hive: the Hive credentials are read from assets/config.json (or the
+environment), and all tables are created in the scratch schema "benchmark",
+which is dropped afterwards.
+
+With --staged, the whole range is also processed end to end by
+_Client._process_range, once sequentially and once in the staged mode (see
+src/stages), as the stages "sequential" and "staged".
+
+Results are printed as JSON lines, one per size and stage, tagged with the
+current git commit; with --output they are also appended to a file, which
+benchmark/compare.py can compare against the results of another commit.
+
+Usage (from pipeline/):
+    python3 -m benchmark.pipeline
+    python3 -m benchmark.pipeline --rows 100000 1000000 10000000 --output output/bench.jsonl
+    python3 -m benchmark.pipeline --rows 1000000 --staged
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timedelta
+
+from src.config import config
+from src.client import _Client
+from src.tables import Table
+from benchmark.generator import generate_chunks, START_DATE, ROWS_PER_DAY
+
+SCHEMA = "benchmark"
+STAGES = ["read", "resolve", "flag", "write"]
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _make_client():
+    # Point both of the client's databases at the Hive credentials, in the
+    # scratch schema.
+    config.load(read_env_data=True)
+    for name in ["user", "passwd", "hostname", "db_name"]:
+        value = str(config.get_value("pipeline_" + name))
+        os.environ["PORTAL_" + name.upper()] = value
+        os.environ["PIPELINE_" + name.upper()] = value
+    os.environ["PORTAL_SCHEMA"] = SCHEMA
+    os.environ["PIPELINE_SCHEMA"] = SCHEMA
+    client = _Client(read_env_data=True)
+    # Only the database writes are timed.
+    client._output_type = "aperture"
+    return client
+
+
+def _load(client, rows, chunksize, seed):
+    client.ctran.delete_schema()
+    # Table.create_table creates the empty ctran_data table, where
+    # CTran_Data.create_table would load a sample file into it.
+    if not Table.create_table(client.ctran):
+        return None
+    client.create_hive()
+
+    elapsed = 0.0
+    for df in generate_chunks(rows, chunksize, seed=seed):
+        start = time.perf_counter()
+        if not client.ctran.write_table(df):
+            return None
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+# Marks the end of the chunks; a None chunk is a read error.
+_END = object()
+
+
+def _process(client, rows, chunksize):
+    # Mirrors _Client._process_chunk, with a timer around every stage.
+    # Returns None if a chunk cannot be read or its flags written, so that a
+    # partial run is not reported as a timing.
+    timings = dict.fromkeys(STAGES, 0.0)
+    flag_rows = 0
+    end_date = START_DATE + timedelta(days=(rows - 1) // ROWS_PER_DAY)
+    client.service_periods.clear_cache()
+
+    chunks = client.ctran.query_date_range_chunks(START_DATE, end_date, chunksize)
+    while True:
+        start = time.perf_counter()
+        ctran_df = next(chunks, _END)
+        timings["read"] += time.perf_counter() - start
+        if ctran_df is _END:
+            break
+        if ctran_df is None:
+            return None
+
+        start = time.perf_counter()
+        service_keys = client.service_periods.resolve(ctran_df["service_date"])
+        timings["resolve"] += time.perf_counter() - start
+        skipped = service_keys.isna()
+        ctran_df = ctran_df[~skipped]
+        service_keys = service_keys[~skipped]
+
+        start = time.perf_counter()
+        flagged_rows, duplicate = client._flag_data(ctran_df, service_keys)
+        fingerprints = None
+        if duplicate is not None:
+            duplicate_rows, fingerprints = client._flag_duplicates(ctran_df, duplicate)
+            flagged_rows.extend(duplicate_rows)
+        timings["flag"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if flagged_rows or fingerprints is not None:
+            if not client._save_output(flagged_rows, [], append=True, fingerprints=fingerprints):
+                return None
+        timings["write"] += time.perf_counter() - start
+        flag_rows += len(flagged_rows)
+
+    return timings, flag_rows
+
+
+def _end_to_end(client, rows, staged):
+    # Wall time of _Client._process_range over the whole range, starting from
+    # an empty flags table; None if the range failed.
+    config.set_value("staged_pipeline", staged)
+    end_date = START_DATE + timedelta(days=(rows - 1) // ROWS_PER_DAY)
+    client.flagged.delete_date_range(START_DATE, end_date)
+    client.checkpoints.delete_date_range(START_DATE, end_date)
+
+    start = time.perf_counter()
+    chunk_count = client._process_range(START_DATE, end_date, False, client._save_output)
+    elapsed = time.perf_counter() - start
+    if chunk_count is None:
+        return None
+    if staged and client.stage_stats is not None:
+        print(json.dumps({"rows": rows, "stage_stats": client.stage_stats}), file=sys.stderr)
+    return elapsed
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000],
+                        help="Number of ctran_data rows to process (default: 100k and 1M).")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Rows per chunk (default: chunksize in assets/config.json).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="File the JSON lines are also appended to.")
+    parser.add_argument("--staged", action="store_true",
+                        help="Also time the whole range sequentially and in the staged mode.")
+    args = parser.parse_args(args)
+
+    client = _make_client()
+    chunksize = args.chunksize or config.get_value("chunksize") or 250000
+    commit = _commit()
+    output = open(args.output, "a") if args.output else None
+
+    try:
+        for rows in args.rows:
+            results = {"load": _load(client, rows, chunksize, args.seed)}
+            if results["load"] is None:
+                print(json.dumps({"commit": commit, "rows": rows, "stage": "load", "seconds": None}))
+                continue
+
+            processed = _process(client, rows, chunksize)
+            if processed is None:
+                print(json.dumps({"commit": commit, "rows": rows, "stage": "process", "seconds": None}))
+                continue
+            timings, flag_rows = processed
+            results.update(timings)
+            results["total"] = sum(timings.values())
+            if args.staged:
+                results["sequential"] = _end_to_end(client, rows, False)
+                results["staged"] = _end_to_end(client, rows, True)
+
+            for stage, seconds in results.items():
+                line = json.dumps({
+                    "commit": commit,
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "rows": rows,
+                    "chunksize": chunksize,
+                    "flag_rows": flag_rows,
+                    "stage": stage,
+                    "seconds": round(seconds, 3) if seconds is not None else None,
+                    "rows_per_second": round(rows / seconds) if seconds else None,
+                })
+                print(line)
+                if output is not None:
+                    output.write(line + "\n")
+    finally:
+        if output is not None:
+            output.close()
+        client.ctran.delete_schema()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+'''
+Benchmark of Flagged_Data.write_table: the COPY bulk loader against the
+single INSERT statement it replaced.
+
+This needs a live PostgreSQL instance; the Hive credentials are read from
+assets/config.json, and all tables are created in the scratch schema
+"benchmark", which is dropped afterwards.
+
+Usage (from pipeline/):
+    python3 -m benchmark.write_table
+    python3 -m benchmark.write_table --rows 1000000 --skip-insert
+'''
+
+import sys
+import time
+import argparse
+import numpy
+from datetime import datetime
+
+from src.config import config
+from src.tables import Flagged_Data
+from src.tables import Flags
+from src.tables import Service_Periods
+
+SCHEMA = "benchmark"
+SERVICE_DATE = "2020/1/1"
+
+
+def _make_rows(count, service_key):
+    # Flag rows shaped like process_data output: a handful of flags per row_id.
+    flag_count = 30
+    row_ids = numpy.arange(count) // flag_count
+    flag_ids = numpy.arange(count) % flag_count + 1
+    return [[int(row_id), service_key, int(flag_id), SERVICE_DATE]
+            for row_id, flag_id in zip(row_ids, flag_ids)]
+
+
+def _time_write(flagged, rows, use_copy):
+    flagged.delete_date_range(SERVICE_DATE)
+    start = time.perf_counter()
+    status = flagged.write_table(rows, use_copy=use_copy)
+    elapsed = time.perf_counter() - start
+    return status, elapsed
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000],
+                        help="Number of flag rows to write (default: 1M and 10M).")
+    parser.add_argument("--skip-insert", action="store_true",
+                        help="Only time the COPY loader.")
+    args = parser.parse_args(args)
+
+    config.load()
+    credentials = [config.get_value("pipeline_user"),
+                   config.get_value("pipeline_passwd"),
+                   config.get_value("pipeline_hostname"),
+                   config.get_value("pipeline_db_name")]
+
+    flagged = Flagged_Data(*credentials, SCHEMA)
+    engine_url = flagged.get_engine().url
+    flags = Flags(schema=SCHEMA, engine=engine_url)
+    service_periods = Service_Periods(schema=SCHEMA, engine=engine_url)
+    flags.create_table()
+    service_periods.create_table()
+    flagged.create_table()
+    service_key = service_periods.query_or_insert(
+        datetime.strptime(SERVICE_DATE, "%Y/%m/%d"))
+
+    print("rows,method,seconds,rows_per_second")
+    try:
+        for count in args.rows:
+            rows = _make_rows(count, service_key)
+            methods = [("copy", True)]
+            if not args.skip_insert:
+                methods.append(("insert", False))
+            for name, use_copy in methods:
+                status, elapsed = _time_write(flagged, rows, use_copy)
+                if not status:
+                    print("{},{},failed,".format(count, name))
+                    continue
+                print("{},{},{:.3f},{:.0f}".format(count, name, elapsed, count / elapsed))
+    finally:
+        flags.delete_schema()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -10,12 +10,26 @@ from .flagger import Flagger, Flags, flaggers
 class Boiler(Flagger):
   # Name is used for testing, but must be overwritten.
   name = 'Boilerplate'
+  # Optional: bump the version when the checks change, and list the config
+  # values they read, so that reprocess redoes the days they flagged.
+  version = 1
+  config_keys = []
   def flag(self, data, config):
 
     # ...
 
     # Must return a list of flags. Flags are defined in flagger.py
     return [Flags.ROW_ID_NULL, Flags.DIRECTION_NULL]
+
+  # Optional, but strongly recommended: the frame-level version of flag.
+  # data is the whole queried pandas.DataFrame. Must return a dict mapping
+  # each flag to a boolean pandas.Series aligned with data's index.
+  # If this is not overwritten, flag will be called once per row instead.
+  def flag_frame(self, data, config):
+
+    # ...
+
+    return {Flags.ROW_ID_NULL: data['row_id'].isna()}
      
 # Append an instance of your flagger to this list.
 # Change Boiler to be your class.
@@ -0,0 +1,90 @@
+from .flagger import Flagger, Flags, flaggers
+from src.config import BoundsResult
+import pandas
+
+#Class that implements bounds check:
+#That is if a value is outside of the bounds set for its column in the "columns" section of the config
+class Bounds(Flagger):
+	name = 'Bounds'
+	config_keys = ['columns']
+
+	def flag(self, data, config):
+		"""
+		Checks every column with bounds in the config against its min and max.
+
+		Args:
+			data (Object): data row from full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns: 
+			list: containing BELOW_MIN and/or ABOVE_MAX Flags, or empty
+		"""
+
+		flags = set()
+
+		for column in config.bounded_columns():
+			if (column in data) and not pandas.isna(data[column]):
+				result = config.check_bounds(column, data[column])
+				if result == BoundsResult.MIN_ERROR:
+					flags.add(Flags.BELOW_MIN)
+				elif result == BoundsResult.MAX_ERROR:
+					flags.add(Flags.ABOVE_MAX)
+
+		return list(flags)
+
+	def flag_frame(self, data, config):
+		"""
+		Frame-level version of flag(): marks every row of data with a value
+		below the min, or above the max, of its column.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns:
+			dict: {BELOW_MIN: boolean pandas.Series, ABOVE_MAX: boolean pandas.Series}, aligned with data
+		"""
+
+		below = pandas.Series(False, index=data.index)
+		above = pandas.Series(False, index=data.index)
+
+		for column in config.bounded_columns():
+			if not column in data:
+				continue
+			masks = config.check_bounds_frame(column, data[column])
+			if BoundsResult.MIN_ERROR in masks:
+				below |= masks[BoundsResult.MIN_ERROR].values
+			if BoundsResult.MAX_ERROR in masks:
+				above |= masks[BoundsResult.MAX_ERROR].values
+
+		return {Flags.BELOW_MIN: below, Flags.ABOVE_MAX: above}
+
+	def sql_flags(self, config):
+		# A column name can't be sanitized like a value; only push down the
+		# bounds when every column is a plain identifier.
+		if not all(column.isidentifier() for column in config.bounded_columns()):
+			return None
+
+		below = []
+		above = []
+		for column in config.bounded_columns():
+			bounds = config.get_compiled_bounds(column)
+			if bounds.min is not None:
+				below.append("{} < {}".format(column, self._sql_value(bounds.min, bounds.is_date)))
+			if bounds.max is not None:
+				above.append("{} > {}".format(column, self._sql_value(bounds.max, bounds.is_date)))
+
+		flags = {}
+		if below:
+			flags[Flags.BELOW_MIN] = "(" + " OR ".join(below) + ")"
+		if above:
+			flags[Flags.ABOVE_MAX] = "(" + " OR ".join(above) + ")"
+		return flags
+
+	def _sql_value(self, value, is_date):
+		# float() and strftime keep anything but a number or date out of the statement.
+		if is_date:
+			return "'{}'".format(value.strftime("%Y-%m-%d %H:%M:%S"))
+		return float(value)
+
+flaggers.append(Bounds())
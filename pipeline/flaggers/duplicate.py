@@ -1,10 +1,12 @@
-from .flagger import Flagger, Flags, flaggers
+from .flagger import Flagger, flaggers
+import pandas
 
 # Class implements duplicate check
 class Duplicate(Flagger):
     name = 'Duplicate'
+    config_keys = ['duplicate_index']
 
-    def flag(self, data, config):
+    def flag(self, data, config, fingerprints=None):
         """
         Due to this flag being an oddity, this method will return a DataFrame
         of service_dates that are duplicates. It is the responsibility of the
@@ -14,6 +16,8 @@ class Duplicate(Flagger):
             data (Pandas.DataFrame): The dataset to find duplicates in. This
                     must have a 'service_date' field, otherwise an ValueError
                     is thrown.
+            fingerprints (pandas.Series): Optional, the result of
+                    fingerprint(data), if it was already computed.
 
         Returns: 
             pandas.DataFrame: The DF with index row_id and field service_date
@@ -23,11 +27,31 @@ class Duplicate(Flagger):
             ValueError: When the input pandas.DataFrame lacks a 'service_date' field.
         """
 
-        duplicates = data[data.duplicated(keep=False)]
-        try:
-            duplicates = duplicates['service_date'].to_frame()
-        except KeyError:
+        if 'service_date' not in data:
             raise ValueError('Duplicate.flag() received a pandas.DataFrame without a "service_date" field.')
-        return duplicates
+
+        if fingerprints is None:
+            fingerprints = self.fingerprint(data)
+        duplicates = data[fingerprints.duplicated(keep=False).values]
+        return duplicates['service_date'].to_frame()
+
+    def fingerprint(self, data):
+        """
+        Hashes every row of data, index excluded, into one 64 bit fingerprint,
+        so that rows can be compared (and remembered across runs) through
+        their fingerprints rather than all of their columns.
+
+        The hashes depend on the column dtypes, so rows are only comparable
+        if they were read with the same types (see CTran_Data._dtypes).
+
+        Args:
+            data (Pandas.DataFrame): The dataset to hash.
+
+        Returns:
+            pandas.Series: uint64 fingerprints, with the index of data.
+        """
+
+        columns = sorted(data.columns)
+        return pandas.util.hash_pandas_object(data[columns], index=False)
 
 flaggers.append(Duplicate())
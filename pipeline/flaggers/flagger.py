@@ -1,5 +1,9 @@
 import abc
+import hashlib
+import json
 from enum import IntEnum, auto
+import numpy
+import pandas
 
 class Flags(IntEnum):
   ###################################################
@@ -44,17 +48,154 @@ class Flags(IntEnum):
   #Duplicate flag
   DUPLICATE = auto()
 
+  #Bounds flags
+  BELOW_MIN = auto()
+  ABOVE_MAX = auto()
+
+  #Trip sequence flags
+  ARRIVE_TIME_REGRESSION = auto()
+  IMPLIED_SPEED = auto()
+  MILEAGE_REGRESSION = auto()
+
+  #Spatial flags
+  GPS_OUTLIER = auto()
+
 class Flagger(abc.ABC):
   # Name must be overwritten
   @property
   def name(self):
     raise NotImplementedError
 
+  # Bump version whenever the checks of a flagger change, and list in
+  # config_keys the config values they depend on: both go into
+  # flagger_version(), so days flagged by other checks are not skipped as
+  # unchanged by reprocess.
+  version = 1
+  config_keys = []
+
+  # A digest of the reference data the checks read besides the rows and the
+  # config, e.g. the location references; it goes into flagger_version() too.
+  def references(self):
+    return None
+
   @abc.abstractmethod
   def flag(self, data):
     # Child classes must return a lit of flags.
     pass
 
+  def flag_frame(self, data, config):
+    # Optional frame-level counterpart of flag(). data is the whole queried
+    # pandas.DataFrame (indexed by row_id); child classes that override this
+    # must return a dict of {Flags: boolean pandas.Series aligned with
+    # data.index}, one mask per flag they raise.
+    # Returning None means the flagger only supports the row-wise flag(), and
+    # the client will fall back to calling flag() on every row.
+    return None
+
+  def sql_flags(self, config):
+    # Optional SQL pushdown of the check. Flaggers whose checks are simple
+    # predicates over ctran_data's columns may return a dict of
+    # {Flags: SQL boolean expression}, using the bare column names; rows for
+    # which the expression is true get the flag. When pushdown is enabled,
+    # these flaggers are evaluated in the database instead of in Python.
+    # Returning None means the flagger cannot be pushed down.
+    return None
+
+
+class SequenceFlagger(Flagger):
+  # Base of the flaggers comparing each stop with the previous stop of its
+  # trip. Instead of flag_frame, child classes implement flag_sequence, which
+  # receives the rows as Trips: sorted once per chunk by the client and
+  # shared by every sequence flagger.
+
+  def flag(self, data, config):
+    # A single row has no previous stop to compare with.
+    return []
+
+  def flag_frame(self, data, config):
+    # Standalone use; the client shares one Trips between the flaggers.
+    return Trips(data).apply(self, config)
+
+  @abc.abstractmethod
+  def flag_sequence(self, trips, config):
+    # Child classes must return a dict of {Flags: boolean numpy array}, in
+    # the order of trips (see Trips), one mask per flag they raise.
+    pass
+
+
+class Trips():
+  # The rows of a DataFrame in trip order: sorted by service_date,
+  # vehicle_number, trip_id, then stop_time. Rows missing any of these, or
+  # a DataFrame missing any of these columns, are left out of the trips.
+  # Columns are handed out as float64 numpy arrays in that order, with NaN
+  # for nulls, so that every comparison against a null is False.
+
+  keys = ["service_date", "vehicle_number", "trip_id"]
+  order = keys + ["stop_time"]
+
+  def __init__(self, data):
+    self._data = data
+    # positions[i] is the position in data of the i-th row in trip order.
+    self.positions = numpy.empty(0, dtype=numpy.int64)
+    if all(column in data for column in self.order):
+      columns = [self._numeric(data[column], column == "service_date") for column in self.order]
+      valid = ~numpy.isnan(numpy.vstack(columns)).any(axis=0)
+      positions = numpy.flatnonzero(valid)
+      # lexsort sorts by its last key first; a stable sort.
+      ordering = numpy.lexsort([column[positions] for column in reversed(columns)])
+      self.positions = positions[ordering]
+
+    # first[i] is True if the i-th row starts a trip.
+    self.first = numpy.ones(len(self.positions), dtype=bool)
+    if len(self.positions) > 1:
+      keys = [self._numeric(data[key], key == "service_date")[self.positions] for key in self.keys]
+      self.first[1:] = numpy.any([key[1:] != key[:-1] for key in keys], axis=0)
+    self._columns = {}
+
+  def __len__(self):
+    return len(self.positions)
+
+  def column(self, name):
+    # The values of a column in trip order; all NaN if there is no such column.
+    if name not in self._columns:
+      if name in self._data:
+        self._columns[name] = self._numeric(self._data[name], name == "service_date")[self.positions]
+      else:
+        self._columns[name] = numpy.full(len(self.positions), numpy.nan)
+    return self._columns[name]
+
+  def previous(self, name):
+    # The value of the previous stop of the trip; NaN on its first stop.
+    values = numpy.roll(self.column(name), 1)
+    values[self.first] = numpy.nan
+    return values
+
+  def diff(self, name):
+    # The change from the previous stop of the trip; NaN on its first stop.
+    return self.column(name) - self.previous(name)
+
+  def to_index(self, mask):
+    # A boolean mask in trip order, as a pandas.Series aligned with data.
+    flagged = numpy.zeros(len(self._data.index), dtype=bool)
+    flagged[self.positions[numpy.asarray(mask, dtype=bool)]] = True
+    return pandas.Series(flagged, index=self._data.index)
+
+  def apply(self, flagger, config):
+    # Run a SequenceFlagger, returning its masks aligned with data, like
+    # Flagger.flag_frame.
+    if len(self.positions) == 0:
+      return {}
+    masks = flagger.flag_sequence(self, config)
+    return dict((flag, self.to_index(mask)) for flag, mask in masks.items())
+
+  def _numeric(self, series, dates=False):
+    if dates:
+      values = pandas.to_datetime(series, errors="coerce")
+      numbers = values.to_numpy(dtype="datetime64[ns]").astype("int64").astype("float64")
+      numbers[values.isna().to_numpy()] = numpy.nan
+      return numbers
+    return pandas.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=numpy.nan)
+
 
 class FlagInfo:
     def __init__(self, name="", desc=""):
@@ -93,6 +234,24 @@ flag_descriptions = {
   Flags.UNOBSERVED_STOP: FlagInfo("unobserved-stop", "UNOBSERVED_STOP"),
   Flags.UNOPENED_DOOR: FlagInfo("unopened-door", "UNOPENED_DOOR"),
   Flags.DUPLICATE: FlagInfo("duplicate", "DUPLICATE"),
+  Flags.BELOW_MIN: FlagInfo("below-min", "BELOW_MIN"),
+  Flags.ABOVE_MAX: FlagInfo("above-max", "ABOVE_MAX"),
+  Flags.ARRIVE_TIME_REGRESSION: FlagInfo("arrive-time-regression", "ARRIVE_TIME_REGRESSION"),
+  Flags.IMPLIED_SPEED: FlagInfo("implied-speed", "IMPLIED_SPEED"),
+  Flags.MILEAGE_REGRESSION: FlagInfo("mileage-regression", "MILEAGE_REGRESSION"),
+  Flags.GPS_OUTLIER: FlagInfo("gps-outlier", "GPS_OUTLIER"),
 }
 
+
+def flagger_version(flagger_list, config):
+  # A digest of the flaggers, their versions, config values and reference
+  # data, and the flags; it changes whenever the flags of unchanged rows may.
+  state = {
+    "flaggers": sorted([f.name, f.version, [[key, config.get_value(key)] for key in f.config_keys],
+                        f.references()]
+                       for f in flagger_list),
+    "flags": sorted([flag.name, int(flag)] for flag in Flags),
+  }
+  return hashlib.md5(json.dumps(state, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 flaggers = []
@@ -0,0 +1,72 @@
+from .flagger import Flagger, Flags, flaggers
+from src.spatial import locations
+import numpy
+import pandas
+
+#Class that implements GPS outlier check:
+#That is if a stop event was recorded far from where its location_id usually is, its GPS fix is suspect.
+class GpsOutlier(Flagger):
+	name = 'GPS Outlier'
+	config_keys = ['gps_outlier_distance', 'gps_coordinate_units']
+
+	def references(self):
+		return locations.digest()
+
+	def flag(self, data, config):
+		"""
+		Checks if the stop was recorded farther than gps_outlier_distance
+		(in feet, 1000 by default) from the reference position of its
+		location_id (see src.spatial).
+
+		Args:
+			data (Object): data row from full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns:
+			list: either empty or containing GPS_OUTLIER Flag
+		"""
+
+		columns = ['location_id', 'x_coordinate', 'y_coordinate']
+		if not all(column in data for column in columns):
+			return []
+
+		row = pandas.DataFrame([[data[column] for column in columns]], columns=columns)
+		return [Flags.GPS_OUTLIER] if self._outliers(row, config)[0] else []
+
+	def flag_frame(self, data, config):
+		"""
+		Frame-level version of flag(): marks every row of data recorded
+		farther than gps_outlier_distance from the reference of its
+		location_id. A row whose location has no reference yet is never
+		marked: there is no evidence against it.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns:
+			dict: {GPS_OUTLIER: boolean pandas.Series aligned with data}
+		"""
+
+		if not all(column in data for column in ['location_id', 'x_coordinate', 'y_coordinate']):
+			return {}
+
+		return {Flags.GPS_OUTLIER: pandas.Series(self._outliers(data, config), index=data.index)}
+
+	def _outliers(self, data, config):
+		max_distance = config.get_value("gps_outlier_distance")
+		if max_distance == None: max_distance = 1000
+
+		# Without references, which is the case until they are built, there is
+		# nothing to compare with.
+		if not len(locations):
+			return numpy.zeros(len(data.index), dtype=bool)
+
+		distance = locations.reference_distance(
+			data['location_id'], data['x_coordinate'], data['y_coordinate'])
+
+		# NaN, for a missing coordinate or a location without a reference,
+		# is never flagged.
+		return distance > float(max_distance)
+
+flaggers.append(GpsOutlier())
@@ -38,9 +38,20 @@ class Null(Flagger):
     #all null flags will be appended to the list
     null_flags = []
     for col in self.columns_flag_dict:
-      if (col in data) and ((data[col] is None) or data[col] is pd.NaT):
+      if (col in data) and pd.isna(data[col]):
         null_flags.append(self.columns_flag_dict[col])
 
     return null_flags
+
+  def flag_frame(self, data, config):
+    masks = {}
+    for col in self.columns_flag_dict:
+      if col in data:
+        masks[self.columns_flag_dict[col]] = data[col].isna()
+
+    return masks
+
+  def sql_flags(self, config):
+    return {flag: col + " IS NULL" for col, flag in self.columns_flag_dict.items()}
      
 flaggers.append(Null())
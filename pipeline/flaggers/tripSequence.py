@@ -0,0 +1,74 @@
+from .flagger import SequenceFlagger, Flags, flaggers
+import numpy
+
+#Classes that implement checks between consecutive stops of the same trip.
+#Times are in seconds after midnight, pattern_distance in feet and train_mileage in miles.
+
+#The bus arrived at a stop before it arrived at the stop scheduled before it
+class ArriveTimeRegression(SequenceFlagger):
+	name = 'Arrive Time Regression'
+
+	def flag_sequence(self, trips, config):
+		"""
+		Marks the stops whose arrive_time is earlier than the previous stop's.
+
+		Args:
+			trips (Trips): the rows in trip order
+			config (Object): contains config vars
+
+		Returns:
+			dict: {ARRIVE_TIME_REGRESSION: boolean numpy array in trip order}
+		"""
+
+		return {Flags.ARRIVE_TIME_REGRESSION: trips.diff('arrive_time') < 0}
+
+#The distance covered since the previous stop implies an impossible speed
+class ImpliedSpeed(SequenceFlagger):
+	name = 'Implied Speed'
+	config_keys = ['max_implied_speed']
+
+	def flag_sequence(self, trips, config):
+		"""
+		Marks the stops reached from the previous stop at an average speed,
+		pattern_distance covered over arrive_time elapsed, above
+		max_implied_speed (in miles per hour, 80 by default). Stops arrived at
+		no later than the previous one are left to ArriveTimeRegression.
+
+		Args:
+			trips (Trips): the rows in trip order
+			config (Object): contains config vars
+
+		Returns:
+			dict: {IMPLIED_SPEED: boolean numpy array in trip order}
+		"""
+
+		max_speed = config.get_value("max_implied_speed")
+		if max_speed == None: max_speed = 80
+
+		feet = trips.diff('pattern_distance')
+		seconds = trips.diff('arrive_time')
+		with numpy.errstate(divide='ignore', invalid='ignore'):
+			mph = feet / seconds * 3600 / 5280
+		return {Flags.IMPLIED_SPEED: (seconds > 0) & (mph > float(max_speed))}
+
+#The vehicle's odometer went backwards since the previous stop
+class MileageRegression(SequenceFlagger):
+	name = 'Mileage Regression'
+
+	def flag_sequence(self, trips, config):
+		"""
+		Marks the stops whose train_mileage is lower than the previous stop's.
+
+		Args:
+			trips (Trips): the rows in trip order
+			config (Object): contains config vars
+
+		Returns:
+			dict: {MILEAGE_REGRESSION: boolean numpy array in trip order}
+		"""
+
+		return {Flags.MILEAGE_REGRESSION: trips.diff('train_mileage') < 0}
+
+flaggers.append(ArriveTimeRegression())
+flaggers.append(ImpliedSpeed())
+flaggers.append(MileageRegression())
@@ -1,9 +1,11 @@
 from .flagger import Flagger, Flags, flaggers
+import pandas
 
 #Class that implements unobserved stop check:
 #That is is bus stops at a certain distance away from the stop, we mark it as an unobserved stop.
 class UnobservedStop(Flagger):
 	name = 'Unobserved Stop'
+	config_keys = ['unobserved_stop_distance']
 
 	def flag(self, data, config):
 		"""
@@ -29,9 +31,40 @@ class UnobservedStop(Flagger):
 
 		flag = []
 
-		if ('location_distance' in data) and (data['location_distance'] != None) and (data['location_distance'] > max_distance):
+		if ('location_distance' in data) and not pandas.isna(data['location_distance']) and (data['location_distance'] > max_distance):
 			flag.append(Flags.UNOBSERVED_STOP);
 
 		return flag
 
+	def flag_frame(self, data, config):
+		"""
+		Frame-level version of flag(): marks every row of data whose location
+		distance is above the configured threshold.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns:
+			dict: {UNOBSERVED_STOP: boolean pandas.Series aligned with data}
+
+		"""
+
+		max_distance = config.get_value("unobserved_stop_distance")
+		if max_distance == None: max_distance = 50
+
+		if not 'location_distance' in data:
+			return {}
+
+		# Nulls become NaN (or pandas.NA), which are never flagged.
+		distance = pandas.to_numeric(data['location_distance'], errors='coerce')
+		return {Flags.UNOBSERVED_STOP: (distance > max_distance).fillna(False).astype(bool)}
+
+	def sql_flags(self, config):
+		max_distance = config.get_value("unobserved_stop_distance")
+		if max_distance == None: max_distance = 50
+
+		# float() keeps anything but a number out of the statement.
+		return {Flags.UNOBSERVED_STOP: "location_distance > {}".format(float(max_distance))}
+
 flaggers.append(UnobservedStop())
\ No newline at end of file
@@ -1,4 +1,5 @@
 from .flagger import Flagger, Flags, flaggers
+import pandas
 
 #Class that implements unopened door check:
 #That is if the bus stopped but door hasn't been opened
@@ -20,9 +21,30 @@ class UnopenedDoor(Flagger):
 
 		flag = []
 
-		if('door' in data) and (data['door'] == 0):
+		if('door' in data) and not pandas.isna(data['door']) and (data['door'] == 0):
 			flag.append(Flags.UNOPENED_DOOR)
 
 		return flag
 
+	def flag_frame(self, data, config):
+		"""
+		Frame-level version of flag(): marks every row of data where the door
+		was never opened.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+
+		Returns:
+			dict: {UNOPENED_DOOR: boolean pandas.Series aligned with data}
+		"""
+
+		if not 'door' in data:
+			return {}
+
+		# Nulls (None or pandas.NA) are never flagged.
+		return {Flags.UNOPENED_DOOR: (data['door'] == 0).fillna(False).astype(bool)}
+
+	def sql_flags(self, config):
+		return {Flags.UNOPENED_DOOR: "door = 0"}
+
 flaggers.append(UnopenedDoor())
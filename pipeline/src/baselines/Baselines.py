@@ -0,0 +1,286 @@
+import math
+from collections import namedtuple
+import numpy
+import pandas
+
+from ..ios import ios
+
+
+# The statistics of one metric of one key; std is the population standard
+# deviation.
+Baseline = namedtuple("Baseline", ["count", "mean", "std"])
+
+# The statistics of some ctran_data rows (see Baselines.summarize): stats has
+# the columns of reference_stats, and days is the sorted datetime64[D] array of
+# the service dates they count.
+Summary = namedtuple("Summary", ["stats", "days"])
+
+
+""" Baselines
+Reference statistics of the stop events: for every location_id and every
+route_number, the count, mean, variance and a quantile sketch of their dwell,
+ons, offs and estimated_load. They live in Hive's reference_stats table (see
+src/tables/reference_stats.py), which the client adds the rows of every
+processed range to, and flaggers read them from the snapshot loaded here: a
+baseline costs a hash lookup rather than a scan of months of ctran_data.
+
+The variance is kept as m2, the sum of squared deviations from the mean, so
+that statistics merge exactly (Chan et al.). The sketch is a histogram over
+buckets each _GAMMA times wider than the last, so quantiles are within about
+5% of their value, whatever the distribution, and sketches merge by adding
+their counts.
+The service dates counted are kept with them, so that a day is counted once,
+whatever the order days are processed in.
+For more, see docs/baselines.md
+"""
+class Baselines():
+
+    keys = ["location_id", "route_number"]
+    metrics = ["dwell", "ons", "offs", "estimated_load"]
+    # The columns of reference_stats, and of the frames of summarize().
+    columns = ["key_type", "key_value", "metric", "observations", "mean", "m2",
+               "sketch", "last_date"]
+
+    # Bucket 0 holds the values below 1; bucket i > 0 those from
+    # _GAMMA ** (i - 1) up to _GAMMA ** i. The last bucket also holds
+    # everything above, from about 150000 on.
+    _GAMMA = 1.1
+    _BUCKETS = 128
+
+    def __init__(self):
+        self._ios = ios
+        self.clear()
+
+    #######################################################
+
+    def clear(self):
+        self.loaded = False
+        # (key_type, metric): DataFrame of observations, mean, std and
+        # last_date, indexed by key_value.
+        self._stats = {}
+        # (key_type, metric): the cumulative sketches, one row per row of
+        # the DataFrame in _stats.
+        self._cumulative = {}
+        # The service dates counted, sorted.
+        self._days = numpy.array([], dtype="datetime64[D]")
+
+    #######################################################
+
+    # The number of baselines, for every key and metric.
+    def __len__(self):
+        return sum(len(frame.index) for frame in self._stats.values())
+
+    #######################################################
+
+    # Read the snapshot of a Reference_Stats table. Returns a bool.
+    def load(self, table):
+        stats = table.query_stats()
+        if stats is None:
+            return False
+        days = table.query_days()
+        if days is None:
+            return False
+
+        self.build(stats, days)
+        self._ios.log_and_print("Loaded {} reference statistics.".format(len(self)))
+        return True
+
+    #######################################################
+
+    # Replace the snapshot with a DataFrame of the columns of reference_stats
+    # and the service dates it counts.
+    def build(self, stats, days=()):
+        self.clear()
+        self._days = self._dates(days)
+        for (key_type, metric), group in stats.groupby(["key_type", "metric"], sort=False):
+            observations = group["observations"].to_numpy(dtype="int64")
+            self._stats[(key_type, metric)] = pandas.DataFrame({
+                "observations": observations,
+                "mean": group["mean"].to_numpy(dtype="float64"),
+                "std": numpy.sqrt(group["m2"].to_numpy(dtype="float64") / observations),
+                "last_date": pandas.to_datetime(group["last_date"]).to_numpy(),
+            }, index=pandas.Index(group["key_value"].to_numpy(dtype="int64")))
+            self._cumulative[(key_type, metric)] = numpy.cumsum(
+                self._sketch_matrix(group["sketch"]), axis=1)
+        self.loaded = True
+
+    #######################################################
+
+    # The Baseline of one key_value, or None if it has none.
+    def get(self, key_type, metric, key_value):
+        frame = self._stats.get((key_type, metric))
+        if frame is None or key_value not in frame.index:
+            return None
+        row = frame.loc[key_value]
+        return Baseline(int(row["observations"]), row["mean"], row["std"])
+
+    #######################################################
+
+    # The baselines of a Series of key_values, e.g. a column of a chunk, as a
+    # DataFrame of observations, mean and std with the index of key_values;
+    # NaN where a key has no baseline.
+    def lookup(self, key_type, metric, key_values):
+        key_values = pandas.Series(key_values)
+        positions = self._positions(key_type, metric, key_values)
+        result = pandas.DataFrame(numpy.nan, index=key_values.index,
+                                  columns=["observations", "mean", "std"])
+        found = positions >= 0
+        if found.any():
+            frame = self._stats[(key_type, metric)]
+            result.iloc[found, :] = frame[["observations", "mean", "std"]].to_numpy()[positions[found]]
+        return result
+
+    #######################################################
+
+    # The q-th quantile (0 <= q <= 1) of the metric for every key of
+    # key_values, as a float64 numpy array; NaN where a key has no baseline.
+    def quantile(self, key_type, metric, key_values, q):
+        positions = self._positions(key_type, metric, pandas.Series(key_values))
+        result = numpy.full(len(positions), numpy.nan)
+        found = positions >= 0
+        if found.any():
+            cumulative = self._cumulative[(key_type, metric)][positions[found]]
+            rank = q * cumulative[:, -1]
+            # The first bucket reaching the rank.
+            buckets = (cumulative < rank[:, None]).sum(axis=1)
+            result[found] = self._bucket_value(numpy.minimum(buckets, self._BUCKETS - 1))
+        return result
+
+    #######################################################
+
+    # The Summary of the rows of a ctran_data DataFrame. Rows of a service
+    # date the snapshot already counted are left out, so a reprocessed day is
+    # never counted twice.
+    def summarize(self, data):
+        parts = []
+        if "service_date" not in data:
+            return self.combine([])
+
+        dates = pandas.to_datetime(data["service_date"], errors="coerce").to_numpy(
+            dtype="datetime64[ns]")
+        new = ~numpy.isnat(dates) & self._is_new(dates)
+        for key_type in self.keys:
+            if key_type not in data:
+                continue
+            keys = self._numeric(data[key_type])
+            for metric in self.metrics:
+                if metric not in data:
+                    continue
+                values = self._numeric(data[metric])
+                valid = ~numpy.isnan(keys) & ~numpy.isnan(values) & new
+                if valid.any():
+                    parts.append(self._summary(
+                        key_type, metric, keys[valid].astype("int64"),
+                        values[valid], dates[valid]))
+        return Summary(self._combine_stats(parts), self._dates(dates[new]))
+
+    #######################################################
+
+    # Merge Summaries, e.g. of the chunks of a range, into one.
+    def combine(self, parts):
+        parts = [part for part in parts if part is not None]
+        return Summary(self._combine_stats([part.stats for part in parts]),
+                       self._dates(numpy.concatenate([part.days for part in parts] or [[]])))
+
+    ###########################################################################
+    # Private Methods
+
+    # Merge frames of reference_stats rows into one, with a row per key_type,
+    # key_value and metric.
+    def _combine_stats(self, parts):
+        parts = [part for part in parts if part is not None and len(part.index)]
+        if not parts:
+            return pandas.DataFrame(columns=self.columns)
+
+        df = pandas.concat(parts, ignore_index=True)
+        codes = df.groupby(["key_type", "key_value", "metric"], sort=False).ngroup().to_numpy()
+        groups = codes.max() + 1
+        first = numpy.unique(codes, return_index=True)[1]
+
+        observations = df["observations"].to_numpy(dtype="float64")
+        means = df["mean"].to_numpy(dtype="float64")
+        total = numpy.bincount(codes, weights=observations, minlength=groups)
+        mean = numpy.bincount(codes, weights=observations * means, minlength=groups) / total
+        m2 = numpy.bincount(
+            codes, minlength=groups,
+            weights=df["m2"].to_numpy(dtype="float64") + observations * (means - mean[codes]) ** 2)
+
+        sketches = numpy.zeros((groups, self._BUCKETS), dtype="int64")
+        numpy.add.at(sketches, codes, self._sketch_matrix(df["sketch"]))
+        last_dates = numpy.full(groups, numpy.iinfo("int64").min)
+        numpy.maximum.at(last_dates, codes,
+                         pandas.to_datetime(df["last_date"]).to_numpy(dtype="datetime64[ns]").view("int64"))
+
+        result = df.iloc[first][["key_type", "key_value", "metric"]].reset_index(drop=True)
+        result["observations"] = total.astype("int64")
+        result["mean"] = mean
+        result["m2"] = m2
+        result["sketch"] = list(sketches)
+        result["last_date"] = last_dates.view("datetime64[ns]")
+        return result[self.columns]
+
+    def _summary(self, key_type, metric, keys, values, dates):
+        key_values, codes = numpy.unique(keys, return_inverse=True)
+        groups = len(key_values)
+        observations = numpy.bincount(codes, minlength=groups)
+        mean = numpy.bincount(codes, weights=values, minlength=groups) / observations
+        m2 = numpy.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=groups)
+        sketches = numpy.bincount(
+            codes * self._BUCKETS + self._bucket(values),
+            minlength=groups * self._BUCKETS).reshape(groups, self._BUCKETS)
+        last_dates = numpy.full(groups, numpy.iinfo("int64").min)
+        numpy.maximum.at(last_dates, codes, dates.view("int64"))
+
+        return pandas.DataFrame({
+            "key_type": key_type,
+            "key_value": key_values,
+            "metric": metric,
+            "observations": observations,
+            "mean": mean,
+            "m2": m2,
+            "sketch": list(sketches),
+            "last_date": last_dates.view("datetime64[ns]"),
+        }, columns=self.columns)
+
+    # Whether the snapshot has yet to count the rows of each of dates.
+    def _is_new(self, dates):
+        return ~numpy.isin(dates.astype("datetime64[D]"), self._days)
+
+    # The distinct dates of a sequence of dates, sorted, as datetime64[D].
+    def _dates(self, dates):
+        dates = pandas.to_datetime(pandas.Series(dates, dtype=object), errors="coerce")
+        return numpy.unique(dates.dropna().to_numpy(dtype="datetime64[ns]").astype("datetime64[D]"))
+
+    # The position of every key in the snapshot of key_type and metric; -1
+    # for the keys without a baseline.
+    def _positions(self, key_type, metric, key_values):
+        keys = self._numeric(key_values)
+        positions = numpy.full(len(keys), -1, dtype="int64")
+        frame = self._stats.get((key_type, metric))
+        present = ~numpy.isnan(keys)
+        if frame is not None and present.any():
+            positions[present] = frame.index.get_indexer(keys[present].astype("int64"))
+        return positions
+
+    def _bucket(self, values):
+        buckets = numpy.zeros(len(values), dtype="int64")
+        above = values >= 1
+        buckets[above] = numpy.minimum(
+            1 + numpy.floor(numpy.log(values[above]) / math.log(self._GAMMA)).astype("int64"),
+            self._BUCKETS - 1)
+        return buckets
+
+    # A value representative of each bucket: the geometric middle of its
+    # bounds; 0 for bucket 0.
+    def _bucket_value(self, buckets):
+        values = self._GAMMA ** (buckets - 0.5)
+        return numpy.where(buckets == 0, 0.0, values)
+
+    def _sketch_matrix(self, sketches):
+        if not len(sketches):
+            return numpy.zeros((0, self._BUCKETS), dtype="int64")
+        return numpy.vstack([numpy.asarray(sketch, dtype="int64") for sketch in sketches])
+
+    def _numeric(self, values):
+        return pandas.to_numeric(pandas.Series(values), errors="coerce").to_numpy(
+            dtype="float64", na_value=numpy.nan)
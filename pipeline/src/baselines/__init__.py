@@ -0,0 +1,5 @@
+from .Baselines import Baseline
+from .Baselines import Summary
+from .Baselines import Baselines
+
+baselines = Baselines()
@@ -1,9 +1,13 @@
 import os
 import sys
-from collections import namedtuple
+import pandas
+import multiprocessing
+import time
+import threading
+from collections import namedtuple, Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from datetime import timedelta
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 from progress.bar import Bar
 
@@ -12,11 +16,24 @@ from src.tables import CTran_Data
 from src.tables import Flagged_Data
 from src.tables import Flags
 from src.tables import Service_Periods
+from src.tables import Fingerprints
+from src.tables import Checkpoints
+from src.tables import Location_References
+from src.tables import Reference_Stats
+from src.tables import engines
+from src.pushdown import Pushdown
+from src.migrations import Migrator, migrations
+from src.stages import Stages
+from src.daemon import Daemon
+from src.metrics import metrics
+from src.spatial import locations
+from src.baselines import baselines
 from src.config import config
 from src.restarter import restarter
 from src.interface import ArgInterface
-from flaggers.flagger import flaggers, FlagInfo
+from flaggers.flagger import flaggers, FlagInfo, SequenceFlagger, Trips, flagger_version
 from flaggers.flagger import Flags as flag_enums
+from flaggers.flagger import flag_descriptions
 
 
 class _Option():
@@ -24,6 +41,94 @@ class _Option():
         self.msg = msg
         self.func_pointer = func_pointer
 
+""" _Range_Checkpoint
+The counts of every service date of one _process_range call, which become
+its rows in the checkpoints table (see src/tables/checkpoints.py). A date is
+complete once processed if it had ctran_data rows, flagged or not.
+"""
+class _Range_Checkpoint():
+    def __init__(self, start_date, end_date):
+        self.started_at = datetime.now()
+        self.count_flags = True
+        self._dates = [d.date() for d in pandas.date_range(start_date, end_date)]
+        self._ctran_rows = Counter()
+        self._skipped_rows = Counter()
+        self._flag_rows = Counter()
+        # The Summary (see Baselines.summarize) of every chunk.
+        self.stats = []
+        # The fingerprints of the dates' Portal rows before they were read
+        # (see CTran_Data.fingerprint_date_range), and the flagger_version
+        # they are flagged with; recorded with the checkpoints.
+        self.fingerprints = {}
+        self.flagger_version = None
+
+    # service_dates is the service_date column of a chunk, and skipped the
+    # mask of its rows without a service_key.
+    def add_rows(self, service_dates, skipped):
+        dates = pandas.to_datetime(service_dates).dt.date
+        self._ctran_rows.update(dates.value_counts().to_dict())
+        self._skipped_rows.update(dates[skipped].value_counts().to_dict())
+
+    # counts is a dict of datetime.date to number of rows.
+    def add_counts(self, counts):
+        self._ctran_rows.update(counts)
+
+    def add_flags(self, flagged_rows):
+        for date, count in Counter(row[3] for row in flagged_rows).items():
+            self._flag_rows[pandas.Timestamp(date).date()] += count
+
+    # Rows for Checkpoints.write_sql. status overrides the status of every
+    # date, e.g. "failed".
+    def rows(self, status=None):
+        finished_at = datetime.now()
+        rows = []
+        for date in self._dates:
+            ctran_rows = self._ctran_rows[date]
+            date_status = status
+            if date_status is None:
+                date_status = "complete" if ctran_rows else "no_data"
+            source_rows, max_row_id, source_hash = self.fingerprints.get(date, (None, None, None))
+            rows.append([
+                date,
+                date_status,
+                ctran_rows,
+                self._skipped_rows[date],
+                self._flag_rows[date] if self.count_flags else None,
+                self.started_at,
+                finished_at,
+                source_rows,
+                max_row_id,
+                source_hash,
+                self.flagger_version,
+            ])
+        return rows
+
+
+# The fingerprints (see Fingerprints.frame) of the chunks of a range that were
+# flagged but not saved yet, so not in the fingerprint index, which only gets
+# them with their flags. The staged mode saves them on another thread.
+class _Unsaved_Fingerprints():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}
+
+    def add(self, df):
+        with self._lock:
+            self._frames[id(df)] = df
+
+    def remove(self, df):
+        with self._lock:
+            self._frames.pop(id(df), None)
+
+    def clear(self):
+        with self._lock:
+            self._frames = {}
+
+    def frames(self):
+        with self._lock:
+            return list(self._frames.values())
+
+
 """ Members:
 self.config
 self. tables
@@ -43,13 +148,44 @@ class _Client():
 
         self._ios = ios
         self._ios.log_and_print("The client is starting initialization.")
+        self._read_env_data = read_env_data
         self._flag_lookup = None
+        # Stages.stats() of the last range processed in the staged mode.
+        self.stage_stats = None
+        # Whether the location references were loaded, or failed to.
+        self._locations_tried = False
+        # Likewise for the baselines; and the reference statistics of the
+        # last range processed, once combined (see src/baselines).
+        self._baselines_tried = False
+        self.range_stats = None
+        self._unsaved_fingerprints = _Unsaved_Fingerprints()
+        # Whether duplicates are looked up in the fingerprint index while
+        # flagging; the parallel backfill does it in the parent instead.
+        self._match_index = True
+        # The days skipped and processed by the last reprocess or backfill;
+        # see _changed_runs.
+        self.day_report = None
+        # Whether the pending migrations were applied; see _migrate_once.
+        self._migrated = False
         self.config = config
         self.config.load(read_env_data=read_env_data)
 
+        self._ios.configure(
+            durability=config.get_value("log_durability"),
+            flush_bytes=config.get_value("log_flush_bytes"),
+            flush_interval=config.get_value("log_flush_interval"))
+
         self._output_path = config.get_value("output_path")
         self._output_type = config.get_value("output_type")
 
+        # Every table shares one pooled engine per database; this must happen
+        # before the tables below build them.
+        engines.configure(
+            pool_size=config.get_value("db_pool_size"),
+            max_overflow=config.get_value("db_max_overflow"),
+            pool_pre_ping=config.get_value("db_pool_pre_ping"),
+            pool_recycle=config.get_value("db_pool_recycle"))
+
         portal_user = config.get_value("portal_user")
         portal_passwd = config.get_value("portal_passwd")
         portal_hostname = config.get_value("portal_hostname")
@@ -69,29 +205,58 @@ class _Client():
         pipe_hostname = config.get_value("pipeline_hostname")
         pipe_db_name = config.get_value("pipeline_db_name")
         pipe_schema = config.get_value("pipeline_schema")
+        flag_storage = config.get_value("flag_storage")
+        flag_partitioning = config.get_value("flag_partitioning")
         if pipe_user and pipe_passwd and pipe_hostname and pipe_db_name:
             if pipe_schema:
-                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name, pipe_schema)
+                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name, pipe_schema, storage=flag_storage, partitioning=flag_partitioning)
                 self._hive_engine = self.flagged.get_engine()
                 engine_url = self._hive_engine.url
                 self.flags = Flags(schema=pipe_schema, engine=engine_url)
                 self.service_periods = Service_Periods(schema=pipe_schema, engine=engine_url)
+                self.fingerprints = Fingerprints(schema=pipe_schema, engine=engine_url)
+                self.checkpoints = Checkpoints(schema=pipe_schema, engine=engine_url)
+                self.location_references = Location_References(schema=pipe_schema, engine=engine_url)
+                self.reference_stats = Reference_Stats(schema=pipe_schema, engine=engine_url)
+                self.pushdown = Pushdown(self.ctran, self.flagged, self.service_periods)
+                self.migrator = self._make_migrator()
                 self._ios.log_and_print("The client has finished initializing.")
                 return
             else:
-                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name)
+                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name, storage=flag_storage, partitioning=flag_partitioning)
         else:
             print("Please enter credentials for Hive's Database.")
-            self.flagged = Flagged_Data()
+            self.flagged = Flagged_Data(storage=flag_storage, partitioning=flag_partitioning)
 
         self._hive_engine = self.flagged.get_engine()
         engine_url = self._hive_engine.url
         self.flags = Flags(engine=engine_url)
         self.service_periods = Service_Periods(engine=engine_url)
+        self.fingerprints = Fingerprints(engine=engine_url)
+        self.checkpoints = Checkpoints(engine=engine_url)
+        self.location_references = Location_References(engine=engine_url)
+        self.reference_stats = Reference_Stats(engine=engine_url)
+        self.pushdown = Pushdown(self.ctran, self.flagged, self.service_periods)
+        self.migrator = self._make_migrator()
         self._ios.log_and_print("The client has finished initializing.")
 
     #######################################################
 
+    # The tables the migrations in src/migrations/versions.py can target.
+    def _make_migrator(self):
+        return Migrator({
+            "ctran": self.ctran,
+            "flagged": self.flagged,
+            "flags": self.flags,
+            "service_periods": self.service_periods,
+            "fingerprints": self.fingerprints,
+            "checkpoints": self.checkpoints,
+            "location_references": self.location_references,
+            "reference_stats": self.reference_stats,
+        }, migrations)
+
+    #######################################################
+
     def main(self, read_env_data=False):
         if len(sys.argv) > 1:
             ai = ArgInterface()
@@ -129,6 +294,10 @@ class _Client():
         self.flags.create_table()
         self.service_periods.create_table()
         self.flagged.create_table()
+        self.fingerprints.create_table()
+        self.checkpoints.create_table()
+        self.location_references.create_table()
+        self.reference_stats.create_table()
 
     ###########################################################
 
@@ -138,95 +307,320 @@ class _Client():
     def process_data(self, start_date=None, end_date=None, restart=False):
         self._ios.log_and_print("Starting data processing pipeline.")
         start_date, end_date = self._get_date_range(start_date, end_date)
-        ctran_df = self.ctran.query_date_range(start_date, end_date)
-        if ctran_df is None or ctran_df.empty:
+        if not self._migrate_once():
+            return False
+
+        chunk_count = self._process_range(
+            start_date, end_date, restart, self._save_output)
+        if chunk_count:
+            self._save_reference_stats(self.range_stats)
+        self._write_metrics()
+        if not chunk_count:
             self._ios.log_and_print(
                 "The supplied dates were unable to be gathered from CTran data.",
                 self._ios.Severity.ERROR)
             return False
 
-        flagged_rows = []
-        skipped_rows = 0
+        self._ios.log_and_print("Done executing the pipeline.")
 
-        csv_service_keys = []
+        return True
 
-        duplicate = None
-        self._ios.log_and_print("Processing the queried data.")
-        progress_bar = Bar(
-            "",
-            max=len(ctran_df.index))
-        for row_id, row in ctran_df.iterrows():
+    ###########################################################
 
-            if self._output_type == "csv" or self._output_type == "both":
-                if not row.service_date in csv_service_keys:
-                    csv_service_keys.append(row.service_date)
+    # Query, flag and hand to save_output the data between start_date and
+    # end_date, inclusive. save_output is called like _save_output, once per
+    # chunk, with the chunk's fingerprints for the index when it is used; the
+    # last call also gets the checkpoint rows of the range (see
+    # _Range_Checkpoint), which are "failed" ones if the range failed.
+    # If direct_insert is True, pushed down flags may be written straight into
+    # flagged_data rather than through save_output.
+    # This returns the number of non-empty chunks processed (0 if there was no
+    # data in the range; SQL pushdown counts as one chunk), or None if the
+    # data could not be queried.
+    def _process_range(self, start_date, end_date, restart, save_output, direct_insert=True):
+        checkpoint = _Range_Checkpoint(start_date, end_date)
+        self.range_stats = None
+        self._unsaved_fingerprints.clear()
+        if config.get_value("day_fingerprints"):
+            # Before the rows are read, so that a later change to them can
+            # only make the recorded fingerprint stale, never hide it.
+            checkpoint.fingerprints = self.ctran.fingerprint_date_range(start_date, end_date) or {}
+            # The references the flaggers read go into the version.
+            self._load_locations(flaggers)
+            checkpoint.flagger_version = flagger_version(flaggers, config)
+        chunk_count = self._flag_range(
+            start_date, end_date, restart, save_output, direct_insert, checkpoint)
+        if chunk_count is None:
+            save_output([], [], append=True, checkpoint=checkpoint.rows("failed"))
+        elif checkpoint.stats:
+            self.range_stats = baselines.combine(checkpoint.stats)
+        return chunk_count
+
+    # The work of _process_range, counting the range into checkpoint.
+    def _flag_range(self, start_date, end_date, restart, save_output, direct_insert, checkpoint):
+        chunk_count = 0
+        flagger_list = flaggers
+        if config.get_value("sql_pushdown"):
+            if not self._pushdown_range(start_date, end_date, save_output, direct_insert, checkpoint):
+                return None
+            chunk_count = 1
+            flagger_list = [f for f in flaggers if f.sql_flags(config) is None]
+            if not flagger_list:
+                # The rows were never read, so count them for the checkpoint.
+                counts = self.ctran.count_date_range(start_date, end_date)
+                if counts is None:
+                    return None
+                checkpoint.add_counts(counts)
+                if not save_output([], [], append=True, checkpoint=checkpoint.rows()):
+                    return None
+                return chunk_count
+
+        self._load_locations(flagger_list)
+        self._load_baselines()
+
+        # With a chunksize configured, Portal is read through a server-side
+        # cursor and each chunk is flagged and saved before the next one is
+        # fetched, so memory is bounded by the chunk rather than the range.
+        chunksize = config.get_value("chunksize")
+        if chunksize:
+            chunks = self.ctran.query_date_range_chunks(start_date, end_date, chunksize)
+            if any(isinstance(f, SequenceFlagger) for f in flagger_list):
+                chunks = self._whole_trips(chunks)
+        else:
+            chunks = [self.ctran.query_date_range(start_date, end_date)]
 
-            service_key = self.service_periods.query_or_insert(row.service_date)
+        if not config.get_value("staged_pipeline"):
+            return self._flag_chunks(
+                chunks, restart, save_output, flagger_list, checkpoint, chunk_count)
 
-            if restart:
-                if config.get_value("max_skipped_rows"):
-                    if skipped_rows > config.get_value("max_skipped_rows"):
-                        msg = self._ios.log_and_print(
-                            "Exceeded maximum number of skipped service rows.",
-                            self._ios.Severity.DEBUG)
-                        restarter.critical_error(msg)
-
-            # If this fails, it's very likely a sqlalchemy error.
-            # e.g. not able to connect to db.
-            if not service_key:
-                self._ios.log_and_print(
-                    "Cannot find or create new service_key, skipping.",
-                    self._ios.Severity.WARNING)
-                skipped_rows +=1
+        # The staged mode reads the chunks and saves their flags on threads of
+        # their own, overlapping both with the flagging here.
+        stages = Stages(config.get_value("stage_queue_size") or 2)
+        result = None
+        try:
+            result = self._flag_chunks(
+                stages.read(chunks), restart, stages.writer(save_output),
+                flagger_list, checkpoint, chunk_count)
+        finally:
+            closed = stages.close()
+            stages.log_stats()
+            self.stage_stats = stages.stats()
+        return result if closed else None
+
+    ###########################################################
+
+    # Regroup chunks read in trip order so that no trip is split between two
+    # of them, for the SequenceFlaggers: the rows of the last trip of each
+    # chunk are held back and flagged with the next one. A None chunk is
+    # passed on, and ends the chunks.
+    def _whole_trips(self, chunks):
+        tail = None
+        for df in chunks:
+            if df is None:
+                yield None
+                return
+            if tail is not None:
+                df = pandas.concat([tail, df])
+                tail = None
+            if df.empty or not all(key in df for key in Trips.keys):
+                yield df
                 continue
 
-            flags = set()
-            for flagger in flaggers:
-                try:
-                    # Duplicate flagger requires a special call later on,
-                    # independent of this loop.
-                    if flagger.name == "Duplicate":
-                        duplicate = flagger
-                    else:
-                        flags.update(flagger.flag(row, config))
-                except Exception as e:
-                    self._ios.log_and_print(
-                        "Error in flagger {}. Skipping.\n{}".format(flagger.name, e),
-                        self._ios.Severity.WARNING)
+            keys = df[Trips.keys]
+            last = keys.iloc[-1]
+            held = (keys.eq(last) | (keys.isna() & last.isna())).all(axis=1)
+            tail = df[held]
+            if not held.all():
+                yield df[~held]
 
-            date = row["service_date"]
-            date = "".join([str(date.year), "/", str(date.month), "/", str(date.day)])
-            for flag in flags:
-                flagged_rows.append([
-                    row_id,
-                    service_key,
-                    int(flag),
-                    date
-                ])
-            progress_bar.next()
+        if tail is not None:
+            yield tail
+
+    ###########################################################
+
+    # Flag and hand to save_output every DataFrame of chunks, continuing the
+    # chunk_count of _flag_range. This returns the chunk_count, or None if a
+    # chunk could not be read or saved; nothing more is saved after a failed
+    # save, so the range can't be checkpointed as complete without all of
+    # its flags.
+    def _flag_chunks(self, chunks, restart, save_output, flagger_list, checkpoint, chunk_count):
+        csv_service_keys = []
+        skipped_rows = 0
+        # The flags of a chunk are saved once the next one is read, so the
+        # last ones can carry the checkpoint rows into their transaction.
+        pending = None
+        for ctran_df in chunks:
+            if ctran_df is None:
+                if pending is not None:
+                    save_output(pending[0], list(csv_service_keys), append=pending[1],
+                                fingerprints=pending[2])
+                return None
+            if ctran_df.empty:
+                continue
+
+            if self._output_type == "csv" or self._output_type == "both":
+                dates = pandas.to_datetime(ctran_df["service_date"]).dropna()
+                for date in dates.dt.date.unique():
+                    if not date in csv_service_keys:
+                        csv_service_keys.append(date)
+
+            flagged_rows, chunk_skipped_rows, fingerprints = self._process_chunk(
+                ctran_df, flagger_list, checkpoint)
+            checkpoint.add_flags(flagged_rows)
+            if config.get_value("reference_stats"):
+                with metrics.timer("pipeline_stage_seconds", stage="stats"):
+                    checkpoint.stats.append(baselines.summarize(ctran_df))
+
+            skipped_rows += chunk_skipped_rows
+            if restart and config.get_value("max_skipped_rows"):
+                if skipped_rows > config.get_value("max_skipped_rows"):
+                    msg = self._ios.log_and_print(
+                        "Exceeded maximum number of skipped service rows.",
+                        self._ios.Severity.DEBUG)
+                    restarter.critical_error(msg)
+
+            if pending is not None:
+                if not save_output(pending[0], list(csv_service_keys), append=pending[1],
+                                   fingerprints=pending[2]):
+                    return None
+            pending = (flagged_rows, chunk_count > 0, fingerprints)
+            chunk_count += 1
+
+        if pending is None:
+            pending = ([], chunk_count > 0, None)
+        if not save_output(pending[0], list(csv_service_keys), append=pending[1],
+                           checkpoint=checkpoint.rows(), fingerprints=pending[2]):
+            return None
+        return chunk_count
+
+    ###########################################################
+
+    # Evaluate every flagger supporting SQL pushdown over the date range in
+    # the database. When allowed, and the output only goes to Hive, the flags
+    # are inserted by the database itself when Portal and Hive are the same
+    # database; otherwise only the flagged (row_id, flag_id) pairs are fetched
+    # and handed to save_output.
+    # The flags fetched are counted into checkpoint, if given.
+    # This returns a bool.
+    def _pushdown_range(self, start_date, end_date, save_output, direct_insert=True, checkpoint=None):
+        expressions = self.pushdown.compile(flaggers, config)
+        if not expressions:
+            return True
+
+        self._ios.log_and_print("Pushing down {} flags to the database.".format(
+            len(expressions)))
+        dates = pandas.Series(pandas.date_range(start_date, end_date))
+        if self.service_periods.resolve(dates).isna().any():
+            self._ios.log_and_print(
+                "Cannot find or create the service_keys of the date range.",
+                self._ios.Severity.ERROR)
+            return False
+
+        if direct_insert and self._output_type == "aperture" and self.pushdown.same_database():
+            if self.pushdown.insert_date_range(start_date, end_date, expressions):
+                if checkpoint is not None:
+                    checkpoint.count_flags = False
+                return True
+            self._ios.log_and_print(
+                "Pushdown insert failed; fetching the flags instead.",
+                self._ios.Severity.WARNING)
+
+        pairs = self.pushdown.query_date_range(start_date, end_date, expressions)
+        if pairs is None:
+            return False
+
+        service_keys = self.service_periods.resolve(pairs["service_date"])
+        dates = self._format_dates(pairs["service_date"])
+        flagged_rows = [list(row) for row in zip(
+            pairs["row_id"].tolist(),
+            service_keys.astype(int).tolist(),
+            pairs["flag_id"].tolist(),
+            dates.tolist())]
+        csv_service_keys = pairs["service_date"].unique().tolist()
+        if checkpoint is not None:
+            checkpoint.add_flags(flagged_rows)
+        self._count_flags(flagged_rows)
+        return save_output(flagged_rows, csv_service_keys, append=False)
+
+    ###########################################################
+
+    # Flag one DataFrame of ctran_data rows with the flaggers in flagger_list.
+    # Its rows are counted into checkpoint, if given.
+    # This returns: flagged_rows, skipped_rows, and the fingerprints to add to
+    # the index with the flags (see _flag_duplicates)
+    def _process_chunk(self, ctran_df, flagger_list=flaggers, checkpoint=None):
+        with metrics.timer("pipeline_stage_seconds", stage="resolve"):
+            service_keys = self.service_periods.resolve(ctran_df["service_date"])
+
+        # If this fails, it's very likely a sqlalchemy error.
+        # e.g. not able to connect to db.
+        skipped = service_keys.isna()
+        if checkpoint is not None:
+            checkpoint.add_rows(ctran_df["service_date"], skipped)
+        skipped_rows = int(skipped.sum())
+        metrics.inc("pipeline_rows_read_total", len(ctran_df.index))
+        metrics.inc("pipeline_rows_skipped_total", skipped_rows)
+        if skipped_rows > 0:
+            self._ios.log_and_print(
+                "Cannot find or create new service_key for {} rows, skipping.".format(skipped_rows),
+                self._ios.Severity.WARNING)
+            ctran_df = ctran_df[~skipped]
+            service_keys = service_keys[~skipped]
+
+        self._ios.log_and_print(
+            "Processing {} rows of the queried data.".format(len(ctran_df.index)))
+        flagged_rows, duplicate = self._flag_data(ctran_df, service_keys, flagger_list)
 
-        progress_bar.finish()
         # Duplicate flagger requires a special call later on, independent of
-        # the primary loop.
+        # the other flaggers.
+        # NOTE: without the duplicate_index, when reading in chunks,
+        # duplicates are only found within a chunk.
+        fingerprints = None
         if duplicate is not None:
             self._ios.log_and_print("Checking for duplicates.")
-            flagged_rows.extend(self._flag_duplicates(ctran_df, duplicate))
+            with metrics.timer("pipeline_flagger_seconds", flagger=duplicate.name):
+                duplicate_rows, fingerprints = self._flag_duplicates(ctran_df, duplicate)
+                flagged_rows.extend(duplicate_rows)
         else:
             self._ios.log_and_print(
                 "This run is not checking for duplicates.",
                 self._ios.Severity.WARNING)
 
-        self._save_output(flagged_rows, csv_service_keys)
-
-        self._ios.log_and_print("Done executing the pipeline.")
-
-        return True
+        flagged_rows = self._drop_duplicate_flags(flagged_rows)
+        self._count_flags(flagged_rows)
+        return flagged_rows, skipped_rows, fingerprints
+
+    # Keep the first of the flagged_rows of every (row_id, flag_id): a flag
+    # can come from both a frame flagger and a row flagger.
+    def _drop_duplicate_flags(self, flagged_rows):
+        flagged = set()
+        unique_rows = []
+        for row in flagged_rows:
+            if (row[0], row[2]) not in flagged:
+                flagged.add((row[0], row[2]))
+                unique_rows.append(row)
+        return unique_rows
+
+    # Count flagged_rows into pipeline_rows_flagged_total, by flag name.
+    def _count_flags(self, flagged_rows):
+        for flag_id, count in Counter(row[2] for row in flagged_rows).items():
+            try:
+                flag = flag_descriptions[flag_enums(flag_id)].name
+            except (KeyError, ValueError):
+                flag = str(flag_id)
+            metrics.inc("pipeline_rows_flagged_total", count, flag=flag)
 
     ###########################################################
 
-    # This method will process all days since the latest processed day.
-    def process_since_checkpoint(self):
-        start_date = self.flagged.get_latest_day()
+    # This method will process all days since the latest processed day, until
+    # end_date (a datetime.date, defaulting to today), inclusive.
+    # If workers (defaulting to backfill_workers in the config) is more than
+    # one, the days are processed in parallel; see _parallel_backfill. Days
+    # already processed and unchanged since are skipped; see _unchanged_days.
+    def process_since_checkpoint(self, workers=None, end_date=None):
+        if not self._migrate_once():
+            return False
+        start_date = self._get_latest_day()
         if start_date is None:
             self._ios.log_and_print(
                 "No prior date processed; cannot continue from the last processed day.",
@@ -236,15 +630,122 @@ class _Client():
         self._ios.log_and_print("Last processed day: " + str(start_date))
         start_date = start_date + timedelta(days=1)
         self._ios.log_and_print("Processing    from: " + str(start_date))
-        end_date = datetime.now().date()
+        if end_date is None:
+            end_date = datetime.now().date()
         self._ios.log_and_print("             until: " + str(end_date))
-        return self.process_data(start_date, end_date)
+
+        skipped = self._unchanged_days(start_date, end_date)
+        runs = self._changed_runs(start_date, end_date, skipped)
+        if not runs:
+            self._ios.log_and_print("No changed days to process.")
+            return True
+
+        if workers is None:
+            workers = config.get_value("backfill_workers")
+        if workers and workers > 1 and start_date < end_date:
+            return self._parallel_backfill(start_date, end_date, workers, skipped)
+        for run_start, run_end in runs:
+            if not self.process_data(run_start, run_end):
+                return False
+        return True
+
+    ###########################################################
+
+    # Process every service date between start_date and end_date, inclusive,
+    # on a pool of worker processes, one day per work unit. The workers only
+    # query and flag; their results are saved here strictly in date order, so
+    # the last processed day never advances past a day that has not been
+    # saved. Once a day fails, nothing after it is saved, and the next run
+    # resumes from that day.
+    # NOTE: the workers build their own client, so the database credentials
+    # must be available from the config or the environment.
+    # The dates in skipped are left as they are.
+    def _parallel_backfill(self, start_date, end_date, workers, skipped=()):
+        dates = []
+        date = start_date
+        while date <= end_date:
+            if date not in skipped:
+                dates.append(date)
+            date += timedelta(days=1)
+
+        self._ios.log_and_print("Backfilling {} days on {} processes.".format(
+            len(dates), workers))
+
+        # Workers are spawned rather than forked so that they never share the
+        # pooled database connections of this process.
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_backfill_worker,
+            initargs=(self._read_env_data, self._output_type))
+
+        pending = {}
+        submitted = 0
+        saved_chunks = 0
+        csv_service_keys = []
+        try:
+            for i in range(len(dates)):
+                # Keep a bounded number of days in flight, so days finished
+                # ahead of the one being waited on don't pile up in memory.
+                while submitted < len(dates) and submitted < i + 2 * workers:
+                    pending[submitted] = executor.submit(_backfill_day, dates[submitted])
+                    submitted += 1
+
+                try:
+                    chunk_count, chunks, worker_metrics, stats = pending.pop(i).result()
+                    metrics.merge(worker_metrics)
+                except Exception as e:
+                    self._ios.log_and_print(
+                        "Backfill worker crashed on {}.\n{}".format(dates[i], e),
+                        self._ios.Severity.ERROR)
+                    chunk_count = None
+
+                if chunk_count is None:
+                    self._ios.log_and_print(
+                        "".join(["Failed to process ", str(dates[i]), "; stopping. ",
+                                 "Days up to ", str(dates[i] - timedelta(days=1)),
+                                 " have been saved."]),
+                        self._ios.Severity.ERROR)
+                    return False
+
+                if chunk_count == 0:
+                    self._ios.log_and_print(
+                        "No CTran data for " + str(dates[i]) + ".",
+                        self._ios.Severity.WARNING)
+
+                for flagged_rows, chunk_service_keys, checkpoint, fingerprints in chunks:
+                    for key in chunk_service_keys:
+                        if not key in csv_service_keys:
+                            csv_service_keys.append(key)
+                    if fingerprints is not None:
+                        flagged_rows = self._add_index_duplicates(flagged_rows, fingerprints)
+                    if not self._save_output(flagged_rows, csv_service_keys,
+                                             append=saved_chunks > 0, checkpoint=checkpoint,
+                                             fingerprints=fingerprints):
+                        self._ios.log_and_print(
+                            "".join(["Failed to save ", str(dates[i]), "; stopping. ",
+                                     "Days before it have been saved."]),
+                            self._ios.Severity.ERROR)
+                        return False
+                    saved_chunks += 1
+                self._save_reference_stats(stats)
+
+                self._ios.log_and_print("Processed " + str(dates[i]) + ".")
+
+        finally:
+            for future in pending.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+            self._write_metrics()
+
+        self._ios.log_and_print("Done executing the backfill.")
+        return True
 
     ###########################################################
     
     # This method will process the next day after the latest processed day.
     def process_next_day(self, restart=False):
-        start_date = self.flagged.get_latest_day()
+        start_date = self._get_latest_day()
         if start_date is None:
             msg = "".join([
                 "An error occured while attempting to find the last processed day. ",
@@ -265,12 +766,126 @@ class _Client():
 
     ###########################################################
 
+    # Rebuild the reference position of every stop location (see
+    # src/spatial) from the ctran_data rows between start_date and end_date,
+    # inclusive; by default, the gps_reference_days up to Portal's latest
+    # service date. Locations without rows in the range keep their reference.
+    # Returns a bool.
+    def build_location_references(self, start_date=None, end_date=None):
+        if start_date is None or end_date is None:
+            end_date = self.ctran.get_latest_day()
+            if end_date is None:
+                self._ios.log_and_print(
+                    "Cannot find the latest service date in Portal.",
+                    self._ios.Severity.ERROR)
+                return False
+            days = config.get_value("gps_reference_days") or 90
+            start_date = end_date - timedelta(days=days - 1)
+
+        self._ios.log_and_print("Building the location references from {} to {}.".format(
+            start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
+        references = self.ctran.query_location_references(start_date, end_date)
+        if references is None:
+            return False
+        if references.empty:
+            self._ios.log_and_print(
+                "No location has enough rows with coordinates in the range.",
+                self._ios.Severity.ERROR)
+            return False
+        if not self.location_references.write_table(references):
+            return False
+
+        self._locations_tried = True
+        return locations.load(self.location_references, self._gps_outlier_distance(),
+                              self._gps_coordinate_units())
+
+    ###########################################################
+
+    # Load the location references of the GPS Outlier flagger, once per
+    # client. Until they are built, it flags nothing.
+    def _load_locations(self, flagger_list):
+        if self._locations_tried or not any(f.name == "GPS Outlier" for f in flagger_list):
+            return
+
+        self._locations_tried = True
+        if not locations.load(self.location_references, self._gps_outlier_distance(),
+                              self._gps_coordinate_units()):
+            self._ios.log_and_print(
+                "Cannot load the location references; GPS outliers will not be flagged.",
+                self._ios.Severity.WARNING)
+
+    # Load the snapshot of the reference statistics, once per client, when
+    # they are kept (see src/baselines).
+    def _load_baselines(self):
+        if self._baselines_tried or not config.get_value("reference_stats"):
+            return
+
+        self._baselines_tried = True
+        if not baselines.load(self.reference_stats):
+            self._ios.log_and_print(
+                "Cannot load the reference statistics; the baselines start empty.",
+                self._ios.Severity.WARNING)
+
+    # Merge the Summary of a processed range (see _process_range) into
+    # reference_stats, then reload the snapshot so the next range sees them.
+    # A failure is only logged: the days are saved, and their statistics
+    # are left out of the baselines. Returns a bool.
+    def _save_reference_stats(self, summary):
+        if summary is None or summary.stats.empty:
+            return True
+
+        with metrics.timer("pipeline_stage_seconds", stage="stats"):
+            if not self.reference_stats.write_table(summary.stats, summary.days):
+                self._ios.log_and_print(
+                    "Cannot save the reference statistics of the range; they are left out of the baselines.",
+                    self._ios.Severity.WARNING)
+                return False
+            return baselines.load(self.reference_stats)
+
+    def _gps_outlier_distance(self):
+        distance = config.get_value("gps_outlier_distance")
+        return 1000 if distance is None else distance
+
+    def _gps_coordinate_units(self):
+        return config.get_value("gps_coordinate_units") or "feet"
+
+    ###########################################################
+
+    # Stay resident and process new service dates as Portal gets them; see
+    # src/daemon. This only returns once the daemon is stopped.
+    def run_daemon(self):
+        return Daemon(self).run()
+
+    ###########################################################
+
+    # Save the metrics for the UI's /metrics; see src/metrics.
+    def _write_metrics(self):
+        path = config.get_value("metrics_file")
+        if path:
+            metrics.write(path)
+
+    ###########################################################
+
+    # The latest processed service date, from the checkpoints; a Hive
+    # processed before they existed falls back to its latest flagged day.
+    def _get_latest_day(self):
+        latest_day = self.checkpoints.get_latest_day()
+        if latest_day is None:
+            self._ios.log_and_print(
+                "No complete checkpoint; looking up the latest flagged day instead.",
+                self._ios.Severity.WARNING)
+            latest_day = self.flagged.get_latest_day()
+        return latest_day
+
+    ###########################################################
+
     def delete_flagged_range(self):
         self.print(
             "Please input a date range. If either or both fields are empty,"\
             " it will be treated as the beginning or time, or the end of"\
             " time, respectively. Note that dates are INCLUSIVE.", force=True)
         start_date, end_date = self._get_date_range(None, allow_empty=True)
+        self.checkpoints.delete_date_range(start_date, end_date)
         if start_date is None:
             start_date = datetime.min
         if end_date is None:
@@ -279,17 +894,139 @@ class _Client():
 
     ###########################################################
 
+    # Reprocess the data between start_date and end_date, inclusive. With
+    # day_fingerprints set, the days whose Portal rows and flaggers haven't
+    # changed since they were processed are skipped (see _unchanged_days),
+    # and the rest are reprocessed in runs of consecutive days.
     def reprocess(self, start_date=None, end_date=None):
         start_date, end_date = self._get_date_range(start_date, end_date)
-        if not self.flagged.delete_date_range(start_date, end_date):
-            msg = "".join([
-                "An error occured while attempting to delete the data in the ",
-                "supplied range [", str(start_date), ", ", str(end_date), "]. ",
-                "This may be because the last processed day doesn't exist or an ",
-                "error occured while connecting to the database."])
-            self._ios.log_and_print(msg, self._ios.Severity.ERROR)
+        if not self._migrate_once():
+            return False
+        skipped = self._unchanged_days(start_date, end_date)
+        runs = self._changed_runs(start_date, end_date, skipped)
+        if not runs:
+            self._ios.log_and_print("Every day of the range is unchanged; nothing to reprocess.")
+            return True
+
+        for run_start, run_end in runs:
+            # The flags go first: until they are deleted, the checkpoints
+            # and fingerprints of the run still describe them. Then the
+            # checkpoints, so that a day is never complete without its flags.
+            deleted = self.flagged.delete_date_range(run_start, run_end)
+            if deleted:
+                deleted = self.checkpoints.delete_date_range(run_start, run_end)
+            # The rows of the range may have been replaced in Portal since,
+            # under new row_ids, so forget their fingerprints too.
+            if deleted and config.get_value("duplicate_index"):
+                deleted = self.fingerprints.delete_date_range(run_start, run_end)
+            if not deleted:
+                msg = "".join([
+                    "An error occured while attempting to delete the data in the ",
+                    "supplied range [", str(run_start), ", ", str(run_end), "]. ",
+                    "This may be because the last processed day doesn't exist or an ",
+                    "error occured while connecting to the database."])
+                self._ios.log_and_print(msg, self._ios.Severity.ERROR)
+                return False
+            if not self.process_data(run_start, run_end):
+                return False
+        return True
+
+    ###########################################################
+
+    # The days between start_date and end_date, inclusive, that reprocessing
+    # would not change: their checkpoint is complete, was flagged with the
+    # current flagger_version (so with the current location references), and
+    # recorded the fingerprint their Portal rows still have (see
+    # CTran_Data.fingerprint_date_range). Returns a set of datetime.date,
+    # empty if day_fingerprints isn't set or the fingerprints cannot be read,
+    # so that every day is processed.
+    def _unchanged_days(self, start_date, end_date):
+        if not config.get_value("day_fingerprints"):
+            return set()
+
+        start_date = pandas.Timestamp(start_date).date()
+        end_date = pandas.Timestamp(end_date).date()
+        stored = self.checkpoints.query_date_range(start_date, end_date)
+        if not stored:
+            return set()
+
+        self._load_locations(flaggers)
+        version = flagger_version(flaggers, config)
+        candidates = dict(
+            (pandas.Timestamp(date).date(), row) for date, row in stored.items()
+            if row["status"] == "complete" and row["flagger_version"] == version)
+        if not candidates:
+            return set()
+
+        current = self.ctran.fingerprint_date_range(start_date, end_date)
+        if current is None:
+            self._ios.log_and_print(
+                "Cannot fingerprint the range in Portal; processing every day of it.",
+                self._ios.Severity.WARNING)
+            return set()
+        current = dict((pandas.Timestamp(date).date(), fingerprint)
+                       for date, fingerprint in current.items())
+
+        return set(date for date, row in candidates.items()
+                   if current.get(date) == (row["source_rows"], row["max_row_id"], row["source_hash"]))
+
+    # Split start_date to end_date, inclusive, into the runs of consecutive
+    # days not in skipped, as a list of (first, last) datetime.date pairs.
+    # Logs which days are skipped and which are processed, and keeps both
+    # lists in self.day_report.
+    def _changed_runs(self, start_date, end_date, skipped):
+        days = [d.date() for d in pandas.date_range(
+            pandas.Timestamp(start_date).date(), pandas.Timestamp(end_date).date())]
+        processed = [day for day in days if day not in skipped]
+        self.day_report = {
+            "skipped": [day for day in days if day in skipped],
+            "processed": processed}
+
+        if self.day_report["skipped"]:
+            self._ios.log_and_print("Skipping {} unchanged days: {}".format(
+                len(self.day_report["skipped"]), self._format_runs(self._runs(self.day_report["skipped"]))))
+        if processed:
+            self._ios.log_and_print("Processing {} days: {}".format(
+                len(processed), self._format_runs(self._runs(processed))))
+        return self._runs(processed)
+
+    # The runs of consecutive days of a sorted list of datetime.date.
+    def _runs(self, days):
+        runs = []
+        for day in days:
+            if runs and runs[-1][1] + timedelta(days=1) == day:
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        return runs
+
+    def _format_runs(self, runs):
+        return ", ".join(str(first) if first == last else "{} to {}".format(first, last)
+                         for first, last in runs)
+
+    ###########################################################
+
+    # Applies the pending schema migrations (see src/migrations) and prints
+    # the resulting state.
+    def migrate(self):
+        success = self.migrator.migrate()
+        self.migrator.print_status()
+        return success
+
+    # Apply the pending migrations, once per client, before anything is
+    # processed: the flags are saved with their checkpoints, so a Hive
+    # predating processing_checkpoints or its columns could not take them.
+    # Returns a bool.
+    def _migrate_once(self):
+        if self._migrated:
+            return True
+        if not self.migrator.migrate():
+            self._ios.log_and_print(
+                "Cannot apply the pending migrations, without which the flags and their checkpoints cannot be saved; see main.py --migrate.",
+                self._ios.Severity.ERROR)
             return False
-        return self.process_data(start_date, end_date)
+        self._migrated = True
+        return True
 
     ###########################################################
 
@@ -343,6 +1080,121 @@ class _Client():
 
     #######################################################
 
+    # Run every flagger of flagger_list but Duplicate over df, whose rows are
+    # already known to have a valid service_key (service_keys is aligned with
+    # df.index).
+    # Flaggers implementing Flagger.flag_frame are evaluated once over the
+    # whole frame; legacy flaggers fall back to being called on every row.
+    # SequenceFlaggers share one sort of df into trips.
+    # This returns: flagged_rows, duplicate_flagger (or None)
+    def _flag_data(self, df, service_keys, flagger_list=flaggers):
+        duplicate = None
+        row_flaggers = []
+        masks = {}
+        # Sorted into trips on the first sequence flagger, then shared.
+        trips = None
+        for flagger in flagger_list:
+            # Duplicate flagger requires a special call later on,
+            # independent of this loop.
+            if flagger.name == "Duplicate":
+                duplicate = flagger
+                continue
+
+            try:
+                with metrics.timer("pipeline_flagger_seconds", flagger=flagger.name):
+                    if isinstance(flagger, SequenceFlagger):
+                        if trips is None:
+                            trips = Trips(df)
+                        flagger_masks = trips.apply(flagger, config)
+                    else:
+                        flagger_masks = flagger.flag_frame(df, config)
+            except Exception as e:
+                self._ios.log_and_print(
+                    "Error in flagger {}. Skipping.\n{}".format(flagger.name, e),
+                    self._ios.Severity.WARNING)
+                continue
+
+            if flagger_masks is None:
+                row_flaggers.append(flagger)
+                continue
+
+            for flag, mask in flagger_masks.items():
+                mask = mask.fillna(False).astype(bool)
+                if flag in masks:
+                    masks[flag] = masks[flag] | mask
+                else:
+                    masks[flag] = mask
+
+        dates = self._format_dates(df["service_date"])
+        service_keys = service_keys.astype(int)
+
+        flagged_rows = []
+        for flag, mask in masks.items():
+            flag_id = int(flag)
+            flagged_rows.extend([
+                [row_id, service_key, flag_id, date]
+                for row_id, service_key, date in zip(
+                    df.index[mask.values],
+                    service_keys[mask].tolist(),
+                    dates[mask].tolist())
+            ])
+
+        if row_flaggers:
+            flagged_rows.extend(
+                self._flag_rows(df, service_keys, dates, row_flaggers))
+
+        return flagged_rows, duplicate
+
+    #######################################################
+
+    # Format a Series of dates the way flagged rows store them: YYYY/M/D.
+    def _format_dates(self, dates):
+        dates = pandas.to_datetime(dates)
+        return dates.dt.year.astype(str) + "/" \
+               + dates.dt.month.astype(str) + "/" + dates.dt.day.astype(str)
+
+    #######################################################
+
+    # Legacy path for flaggers that only implement the row-wise Flagger.flag.
+    def _flag_rows(self, df, service_keys, dates, row_flaggers):
+        flagged_rows = []
+        progress_bar = Bar(
+            "",
+            max=len(df.index))
+        # Seconds spent in each flagger, over every row.
+        seconds = Counter()
+        for row_id, row in df.iterrows():
+            flags = set()
+            for flagger in row_flaggers:
+                start = time.perf_counter()
+                try:
+                    flags.update(flagger.flag(row, config))
+                except Exception as e:
+                    self._ios.log_and_print(
+                        "Error in flagger {}. Skipping.\n{}".format(flagger.name, e),
+                        self._ios.Severity.WARNING)
+                seconds[flagger.name] += time.perf_counter() - start
+
+            for flag in flags:
+                flagged_rows.append([
+                    row_id,
+                    service_keys[row_id],
+                    int(flag),
+                    dates[row_id]
+                ])
+            progress_bar.next()
+
+        progress_bar.finish()
+        for name, total in seconds.items():
+            metrics.observe("pipeline_flagger_seconds", total, flagger=name)
+        return flagged_rows
+
+    #######################################################
+
+    # Flag the duplicated rows of df, and with the duplicate_index, the rows
+    # duplicating those of earlier chunks and runs (see _match_fingerprints).
+    # This returns: the flagged rows, and the fingerprints of df for the index
+    # (see Fingerprints.frame), or None without the duplicate_index.
     def _flag_duplicates(self, df, duplicate_instance):
         """ Order of fields.
             index:  row_id
@@ -352,14 +1204,25 @@ class _Client():
         """
         dup_df = None
         try:
-            dup_df = duplicate_instance.flag(df, config)
+            fingerprints = duplicate_instance.fingerprint(df)
+            dup_df = duplicate_instance.flag(df, config, fingerprints)
         except ValueError as err:
             self._ios.log_and_print("", self._ios.Severity.ERROR, err)
-            return []
+            return [], None
+
+        indexed = None
+        if config.get_value("duplicate_index"):
+            indexed = self.fingerprints.frame(fingerprints, df["service_date"])
+            dup_df = self._match_fingerprints(indexed, dup_df, self._match_index)
+
+        return self._duplicate_rows(dup_df), indexed
 
+    # The flagged rows of dup_df (index row_id, field service_date).
+    def _duplicate_rows(self, dup_df):
         dup_df.insert(0, "service_key", 0)
-        dup_df["service_key"] = dup_df["service_date"].apply(
-            lambda date: self.service_periods.query_or_insert(date))
+        dup_df["service_key"] = self.service_periods.resolve(dup_df["service_date"])
+        dup_df = dup_df[dup_df["service_key"].notna()].copy()
+        dup_df["service_key"] = dup_df["service_key"].astype(int)
 
         dup_df.insert(1, "flag_id", 1)
         dup_df["flag_id"] = flag_enums.DUPLICATE
@@ -379,6 +1242,77 @@ class _Client():
 
     ###########################################################
 
+    # Look the fingerprints of a chunk (see Fingerprints.frame) up among the
+    # chunks of the range not saved yet and, if lookup_index, in the
+    # persistent index, so that duplicates are found across chunks and runs.
+    # Both the rows of the chunk and the earlier rows they duplicate are added
+    # to dup_df (index row_id, field service_date). The chunk is then one of
+    # the unsaved ones until _save_output adds it to the index with its flags.
+    def _match_fingerprints(self, indexed, dup_df, lookup_index=True):
+        # Taken before the index is read: a chunk leaves the unsaved ones only
+        # once it is committed to the index, so it is in one or the other.
+        unsaved = self._unsaved_fingerprints.frames()
+        matches = [self._match_unsaved(indexed, unsaved)]
+        if lookup_index:
+            found = self.fingerprints.match(indexed)
+            if found is None:
+                self._ios.log_and_print(
+                    "Could not use the fingerprint index; only duplicates within the queried data are flagged.",
+                    self._ios.Severity.WARNING)
+            else:
+                matches.append(found)
+        self._unsaved_fingerprints.add(indexed)
+        return self._add_matches(indexed, dup_df, pandas.concat(matches, ignore_index=True))
+
+    # Like Fingerprints.match, against the frames of unsaved.
+    def _match_unsaved(self, indexed, unsaved):
+        columns = ["row_id", "service_date", "match_row_id"]
+        if not unsaved:
+            return pandas.DataFrame(columns=columns)
+        earlier = pandas.concat(unsaved, ignore_index=True)
+        joined = earlier.merge(indexed[["fingerprint", "row_id"]],
+                               on="fingerprint", suffixes=("", "_match"))
+        joined = joined[joined["row_id"] != joined["row_id_match"]]
+        return pandas.DataFrame({
+            "row_id": joined["row_id"].values,
+            "service_date": joined["service_date"].values,
+            "match_row_id": joined["row_id_match"].values}, columns=columns)
+
+    # Add the rows of matches (see Fingerprints.match) and the rows of indexed
+    # they match to dup_df.
+    def _add_matches(self, indexed, dup_df, matches):
+        if matches.empty:
+            return dup_df
+
+        current = indexed.set_index("row_id").loc[matches["match_row_id"].unique(), ["service_date"]]
+        earlier = matches.drop_duplicates("row_id").set_index("row_id")[["service_date"]]
+        dup_df = pandas.concat([dup_df, current, earlier])
+        return dup_df[~dup_df.index.duplicated()]
+
+    # The parallel backfill's side of _match_fingerprints: adds to the
+    # flagged_rows of a worker's chunk the duplicates of the rows of indexed
+    # in the fingerprint index, which is read just before they are saved, so
+    # that it has every earlier day. Rows already flagged as duplicates are
+    # not added twice.
+    def _add_index_duplicates(self, flagged_rows, indexed):
+        matches = self.fingerprints.match(indexed)
+        if matches is None:
+            self._ios.log_and_print(
+                "Could not use the fingerprint index; only duplicates within the queried data are flagged.",
+                self._ios.Severity.WARNING)
+            return flagged_rows
+        if matches.empty:
+            return flagged_rows
+
+        flagged = set((row[0], row[2]) for row in flagged_rows)
+        dup_df = self._add_matches(indexed, pandas.DataFrame({"service_date": []}), matches)
+        duplicate_rows = [row for row in self._duplicate_rows(dup_df)
+                          if (row[0], row[2]) not in flagged]
+        self._count_flags(duplicate_rows)
+        return flagged_rows + duplicate_rows
+
+    ###########################################################
+
     def _db_menu(self):
         def ctran_info():
             query = self.ctran.get_full_table()
@@ -401,7 +1335,11 @@ class _Client():
             _Option("Create service_periods table.", self.service_periods.create_table),
             _Option("Delete flagged_data table.", self.flagged.delete_table),
             _Option("Delete service_periods table.", self.flags.delete_table),
-            _Option("Query ctran_data and print ctran_data.info().", ctran_info)
+            _Option("Query ctran_data and print ctran_data.info().", ctran_info),
+            _Option("Apply pending schema migrations (indexes).", self.migrate),
+            _Option("Build the location references for GPS outlier flagging.",
+                    self.build_location_references),
+            _Option("Print schema migration status.", self.migrator.print_status)
         ]
 
         return self._menu("This is the Database Operations sub-menu.", options)
@@ -518,22 +1456,105 @@ class _Client():
             self._output_type = "both"
             print("Output will be saved to aperture AND csv's")
 
+        def change_to_parquet(): 
+            self._output_type = "parquet"
+            print("Output will be saved to parquet files")
+
         options = [
            _Option("(or ctrl-d) Exit.", lambda: "Exit"),
            _Option("Check current output type.", lambda: print("Current output type: " + self._output_type)),
            _Option("Check current output path.", lambda: print("Current output path: " + self._output_path)),
            _Option("Change output to Aperture.", change_to_aperture),
            _Option("Change output to CSV's.", change_to_csv),
-           _Option("Change output to Aperture AND CSV's.", change_to_both)
+           _Option("Change output to Aperture AND CSV's.", change_to_both),
+           _Option("Change output to Parquet.", change_to_parquet)
         ]
 
         return self._menu("This is output type sub-menu.", options)
 
-    def _save_output(self, flagged_rows, csv_service_keys):
-        if self._output_type == "aperture" or self._output_type == "both":
-            self.flagged.write_table(flagged_rows)
+    # append is True for every chunk after the first of a process_data call,
+    # so the csv output accumulates instead of being overwritten.
+    # checkpoint is a list of rows for Checkpoints.write_sql, written in the
+    # same transaction as flagged_rows; it is not part of the csv output.
+    # fingerprints are the rows of the chunk for the fingerprint index (see
+    # _flag_duplicates); they are added to it in the same transaction as
+    # flagged_rows, or once the files are written, so a chunk that failed to
+    # save is never taken for an earlier copy of itself.
+    # Returns False as soon as a write fails, in which case the range must
+    # not be counted as complete.
+    def _save_output(self, flagged_rows, csv_service_keys, append=False, checkpoint=None,
+                     fingerprints=None):
+        with metrics.timer("pipeline_stage_seconds", stage="save"):
+            indexed = fingerprints is None
+            if self._output_type == "aperture" or self._output_type == "both":
+                if flagged_rows:
+                    after_sql = []
+                    if checkpoint is not None:
+                        after_sql.append(self.checkpoints.write_sql(checkpoint))
+                    if fingerprints is not None:
+                        after_sql.append(self.fingerprints.merge_statement(fingerprints))
+                    if not self.flagged.write_table(flagged_rows, after_sql=after_sql or None):
+                        return False
+                    indexed = True
+                else:
+                    if fingerprints is not None:
+                        if not self.fingerprints.merge(fingerprints):
+                            return False
+                        indexed = True
+                    if checkpoint is not None:
+                        if not self.checkpoints.write_table(checkpoint):
+                            return False
+
+            if self._output_type == "parquet":
+                compression = config.get_value("parquet_compression") or "zstd"
+                if not append and not self.flags.write_parquet(self._output_path, compression):
+                    return False
+                if not self.flagged.write_parquet(self._output_path, flagged_rows, append, compression):
+                    return False
+
+            if (self._output_type == "csv" or self._output_type == "both") \
+                    and (flagged_rows or checkpoint is None):
+                if not (self.flags.write_csv(self._output_path)
+                        and self.flagged.write_csv(self._output_path, flagged_rows, append)
+                        and self.service_periods.write_csv(self._output_path, csv_service_keys)):
+                    return False
+
+            if not indexed:
+                if not self.fingerprints.merge(fingerprints):
+                    return False
+        if fingerprints is not None:
+            self._unsaved_fingerprints.remove(fingerprints)
+
+        return True
+
+
+###########################################################
+# Parallel backfill workers; see _Client._parallel_backfill.
+
+_backfill_client = None
+
+def _init_backfill_worker(read_env_data, output_type):
+    global _backfill_client
+    _backfill_client = _Client(read_env_data)
+    _backfill_client._output_type = output_type
+    # The days are saved by the parent, in order; the index only has the
+    # earlier ones once the day is about to be saved.
+    _backfill_client._match_index = False
+
+# Query and flag a single service date, without saving anything.
+# This returns: chunk_count (see _Client._process_range), and a list of the
+# (flagged_rows, csv_service_keys, checkpoint, fingerprints) of every chunk,
+# where fingerprints is for _Client._save_output and still has to be looked up
+# in the fingerprint index (see _Client._index_duplicates), the metrics
+# recorded (see _Metrics.snapshot) and the reference statistics of the day.
+def _backfill_day(date):
+    metrics.reset()
+    chunks = []
+    def collect(flagged_rows, csv_service_keys, append=False, checkpoint=None, fingerprints=None):
+        chunks.append((flagged_rows, list(csv_service_keys), checkpoint, fingerprints))
+        return True
+
+    chunk_count = _backfill_client._process_range(
+        date, date, False, collect, direct_insert=False)
+    return chunk_count, chunks, metrics.snapshot(), _backfill_client.range_stats
 
-        if self._output_type == "csv" or self._output_type == "both":
-            self.flags.write_csv(self._output_path)
-            self.flagged.write_csv(self._output_path, flagged_rows)
-            self.service_periods.write_csv(self._output_path, csv_service_keys)
\ No newline at end of file
@@ -1,9 +1,11 @@
 import sys
 import json
 import os
-from datetime import datetime
+from collections import namedtuple
+from datetime import date, datetime
 from dateutil.parser import parse, ParserError
 from enum import Enum
+import pandas
 
 CONFIG_FILENAME = "./assets/config.json"
 
@@ -12,9 +14,14 @@ class BoundsResult(Enum):
     MAX_ERROR = 2 #value is greater than MAX
     MIN_ERROR = 3 #value is less than MIN
 
+# The bounds of a column, compiled from the "columns" section: min and max are
+# None when not set, and pandas.Timestamp for dates (is_date).
+Bounds = namedtuple("Bounds", ["min", "max", "is_date"])
+
 class Config:
     def __init__(self):
         self._data = {}
+        self._bounds = {}
     def load(self, filename=CONFIG_FILENAME, read_env_data=False, debug=False):
         self._filename = filename
 
@@ -27,8 +34,33 @@ class Config:
         if read_env_data:
             self._ingest_env()
 
+        self._compile_bounds()
         return True
 
+    # Parse the "columns" section once, rather than on every check_bounds.
+    def _compile_bounds(self):
+        self._bounds = {}
+        for column_name in self._data.get("columns", {}):
+            self._compile_column(column_name)
+
+    def _compile_column(self, column_name):
+        col = self._data["columns"][column_name]
+        col_min = self._compile_bound(col.get("min"))
+        col_max = self._compile_bound(col.get("max"))
+        is_date = isinstance(col_min, pandas.Timestamp) or isinstance(col_max, pandas.Timestamp)
+        self._bounds[column_name] = Bounds(col_min, col_max, is_date)
+
+    def _compile_bound(self, val):
+        if val is None or self._is_na(val):
+            return None
+        if self._is_date(val):
+            return pandas.Timestamp(parse(val))
+        # Neither a date nor a number: no bound.
+        try:
+            return float(val) if isinstance(val, str) else val
+        except ValueError:
+            return None
+
     def _ingest_env(self):
         if "PORTAL_USER" in os.environ:
             self._data["portal_user"] = os.environ["PORTAL_USER"]
@@ -89,44 +121,64 @@ class Config:
 
     def set_bounds(self, column_name, min, max):
         self._data['columns'][column_name] = {'min' : min, 'max' : max}
+        self._compile_column(column_name)
 
     def get_bounds(self, column_name):
         if column_name in self._data['columns']:
             return self._data['columns'][column_name]
 
+    # The names of the columns with bounds.
+    def bounded_columns(self):
+        return list(self._bounds)
+
+    # The compiled Bounds of a column, None if it has none.
+    def get_compiled_bounds(self, column_name):
+        return self._bounds.get(column_name)
+
     def check_bounds(self, column_name, val):
-        if column_name in self._data["columns"]:
-            col = self._data["columns"][column_name]
-
-            col_max = None
-            col_min = None
-
-            if self._is_date(val):
-                val = parse(val)
-                if 'max' in col:
-                    if not self._is_na(col['max']):
-                        col_max = parse(col['max'])
-                if 'min' in col:
-                    if not self._is_na(col['min']):
-                        col_min = parse(col['min'])
-            else:
-                if 'max' in col:
-                    if not self._is_na(col['max']):
-                        col_max = col['max']
-                if 'min' in col:
-                    if not self._is_na(col['min']):
-                        col_min = col['min']
-                        
-            if 'max' in col:
-                if not self._is_na(col['max']):
-                    if val > col_max:
-                        return BoundsResult.MAX_ERROR
-            if 'min' in col:
-                if not self._is_na(col['min']):
-                    if val < col_min:
-                        return BoundsResult.MIN_ERROR
+        bounds = self._bounds.get(column_name)
+        if bounds is None:
+            return BoundsResult.VALID
+
+        if self._is_date(val):
+            val = pandas.Timestamp(parse(val))
+        elif isinstance(val, date):
+            val = pandas.Timestamp(val)
+
+        # A value that can't be compared to the bounds, such as a number
+        # against dates, is not out of them.
+        try:
+            if bounds.max is not None and val > bounds.max:
+                return BoundsResult.MAX_ERROR
+            if bounds.min is not None and val < bounds.min:
+                return BoundsResult.MIN_ERROR
+        except TypeError:
+            pass
 
         return BoundsResult.VALID
+
+    # Vectorized check_bounds over a whole Series. Returns a dict of
+    # {BoundsResult.MIN_ERROR: mask, BoundsResult.MAX_ERROR: mask}, boolean
+    # Series aligned with series, for the bounds the column has. Nulls, and
+    # values that are not numbers (or dates, for date bounds), are never out
+    # of bounds.
+    def check_bounds_frame(self, column_name, series):
+        bounds = self._bounds.get(column_name)
+        if bounds is None:
+            return {}
+
+        if bounds.is_date:
+            values = pandas.to_datetime(series, errors="coerce")
+        else:
+            values = pandas.to_numeric(series, errors="coerce")
+
+        masks = {}
+        if bounds.max is not None:
+            masks[BoundsResult.MAX_ERROR] = (values > bounds.max).fillna(False).astype(bool)
+        if bounds.min is not None:
+            masks[BoundsResult.MIN_ERROR] = (values < bounds.min).fillna(False).astype(bool)
+        return masks
+
     def save(self, new_filename=""):
         if not new_filename:
             new_filename = self._filename
@@ -0,0 +1,151 @@
+import signal
+import threading
+from datetime import date, datetime, timedelta
+
+from ..ios import ios
+from ..config import config
+from ..notif import notif
+from ..metrics import metrics
+
+
+""" Daemon
+A long running alternative to the --daily cron job. It polls Portal every
+daemon_poll_interval seconds and processes the service dates that arrived
+since the last processed one, with the same client every time. Its pooled
+connections, service period cache and flag lookups stay warm between runs.
+
+A service date is only processed once it is daemon_lag_days old, so a day
+still being loaded into Portal isn't processed partway. A failed poll is
+retried in-process after daemon_retry_base seconds, doubling on every
+consecutive failure up to daemon_retry_max, rather than exiting for Docker
+to restart the container. After daemon_notify_after consecutive failures the
+users are emailed once, like Restarter does. With metrics_port set, the
+metrics are served at http://<host>:<metrics_port>/metrics while it runs.
+For more, see docs/cl_query.md
+"""
+class Daemon():
+
+    def __init__(self, client):
+        self._ios = ios
+        self._client = client
+        self._poll_interval = self._config_value("daemon_poll_interval", 900)
+        self._lag_days = self._config_value("daemon_lag_days", 1)
+        self._retry_base = self._config_value("daemon_retry_base", 30)
+        self._retry_max = self._config_value("daemon_retry_max", 3600)
+        self._notify_after = self._config_value("daemon_notify_after", 5)
+        self._metrics_port = config.get_value("metrics_port")
+        self._stop = threading.Event()
+        self._failures = 0
+
+    #######################################################
+
+    # Poll until stop() is called, or SIGTERM or SIGINT is received; or, for
+    # testing, until max_polls polls are done.
+    def run(self, max_polls=None):
+        self._handle_signals()
+        self._ios.log_and_print(
+            "The daemon is starting, polling every {} seconds.".format(self._poll_interval))
+
+        server = None
+        if self._metrics_port is not None:
+            server = metrics.serve(self._metrics_port)
+
+        polls = 0
+        try:
+            while not self._stop.is_set():
+                delay = self.poll()
+                polls += 1
+                if max_polls is not None and polls >= max_polls:
+                    break
+                self._stop.wait(delay)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        self._ios.log_and_print("The daemon is stopping.")
+        return True
+
+    #######################################################
+
+    def stop(self):
+        self._stop.set()
+
+    #######################################################
+
+    # Process the new service dates, if any. Returns the number of seconds
+    # to wait before the next poll.
+    def poll(self):
+        try:
+            success = self._process_new_days()
+        except Exception as e:
+            self._ios.log_and_print(
+                "Unexpected error while polling: {}".format(e),
+                self._ios.Severity.ERROR)
+            success = False
+
+        if success:
+            if self._failures:
+                self._ios.log_and_print(
+                    "Recovered after {} failed attempts.".format(self._failures))
+            self._failures = 0
+            return self._poll_interval
+
+        self._failures += 1
+        delay = min(self._retry_max, self._retry_base * 2 ** (self._failures - 1))
+        self._ios.log_and_print(
+            "Attempt {} failed; retrying in {} seconds.".format(self._failures, delay),
+            self._ios.Severity.WARNING)
+        if self._failures == self._notify_after:
+            self._notify()
+        return delay
+
+    ###########################################################################
+    # Private Methods
+
+    # Returns a bool.
+    def _process_new_days(self):
+        latest_processed = self._client._get_latest_day()
+        if latest_processed is None:
+            self._ios.log_and_print(
+                "No prior date processed; process a first date before starting the daemon.",
+                self._ios.Severity.ERROR)
+            return False
+
+        latest_available = self._client.ctran.get_latest_day()
+        if latest_available is None:
+            self._ios.log_and_print(
+                "Cannot find the latest service date in Portal.",
+                self._ios.Severity.ERROR)
+            return False
+
+        end_date = min(self._as_date(latest_available),
+                       date.today() - timedelta(days=self._lag_days))
+        if end_date <= self._as_date(latest_processed):
+            self._ios.log_and_print("No new service dates to process.")
+            return True
+
+        return self._client.process_since_checkpoint(end_date=end_date)
+
+    def _notify(self):
+        now = datetime.now().strftime("%b %d %Y %H:%M:%S")
+        subject = "Pipeline Error - {0}".format(now)
+        msg = "".join([
+            "The pipeline daemon failed ", str(self._failures), " times in a row ",
+            "as of ", now, ". It keeps retrying every ", str(self._retry_max),
+            " seconds at most; see the log for the errors."])
+        notif.email(subject, msg)
+
+    def _handle_signals(self):
+        # Signal handlers can only be set from the main thread.
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, lambda signum, frame: self.stop())
+
+    def _config_value(self, name, default):
+        value = config.get_value(name)
+        return default if value is None else value
+
+    def _as_date(self, value):
+        return value.date() if isinstance(value, datetime) else value
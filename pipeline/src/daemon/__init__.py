@@ -0,0 +1 @@
+from .Daemon import Daemon
@@ -2,13 +2,13 @@ import sys
 import argparse
 from datetime import datetime
 from ..ios import ios
+from ..profiler import Profiler
 
 
 class ArgInterface:
 
     def query_with_args(self, client, args):
-        ctran = client.ctran
-        flagged = client.flagged
+        args_list = args
         try:
             args = self._parse_cl_args(args)
 
@@ -27,19 +27,40 @@ class ArgInterface:
 
                 args.flag = args.flag.id
 
-            if args.select:
-                df = self._handle_flag_query(flagged, args)
-            elif args.date_start:
-                df = self._handle_range_query(client, args)
-            elif args.daily:
-                client.process_next_day(restart=True)
-                return None
-            else:
-                ios.print("Insufficient arguments.")
-                return None
+            if args.profile:
+                command = " ".join(a for a in args_list if a != "--profile")
+                return Profiler().run(self._operation(args), command,
+                                      self._run_operation, client, args)
+            return self._run_operation(client, args)
         except ValueError:
             raise SystemExit(2)
-        return df
+
+    def _run_operation(self, client, args):
+        if args.select:
+            return self._handle_flag_query(client.flagged, args)
+        elif args.build_locations:
+            return client.build_location_references(args.date_start, args.date_end)
+        elif args.date_start:
+            return self._handle_range_query(client, args)
+        elif args.daemon:
+            client.run_daemon()
+            return None
+        elif args.migrate:
+            client.migrate()
+            return None
+        elif args.daily:
+            client.process_next_day(restart=True)
+            return None
+        else:
+            ios.print("Insufficient arguments.")
+            return None
+
+    # The name of the operation args select, as in _run_operation.
+    def _operation(self, args):
+        for operation in ["select", "build_locations", "date_start", "daemon", "migrate", "daily"]:
+            if getattr(args, operation):
+                return "range" if operation == "date_start" else operation
+        return "none"
 
     def _parse_cl_args(self, args):
         parser = self._create_parser(args)
@@ -115,6 +136,18 @@ class ArgInterface:
                             help="Process data of the next unprocessed day. No arguments. This will restart on failure.",
                             required=self._is_present(args, None, "--daily") and len(args) == 1,
                             action="store_true")
+        parser.add_argument("--daemon",
+                            help="Stay resident, processing new service dates as they arrive in Portal. No arguments. Failures are retried in-process.",
+                            action="store_true")
+        parser.add_argument("--migrate",
+                            help="Apply the pending schema migrations, such as new indexes, to Portal and Hive. No arguments.",
+                            action="store_true")
+        parser.add_argument("--build-locations",
+                            help="Rebuild the reference positions of the stop locations, for GPS outlier flagging, from the rows of --date-start to --date-end (default: the last gps_reference_days in Portal).",
+                            action="store_true")
+        parser.add_argument("--profile",
+                            help="Run the operation under a profiler, saving a pstats file and a per-stage summary to output/. No arguments.",
+                            action="store_true")
         parser.add_argument("--date-start",
                             help="Format: --date-start=YYYY-MM-DD (ex. 2020-01-01)",
                             required=not daily and not query and self._is_present(args, None, "--date-end"),
@@ -1,3 +1,4 @@
+import atexit
 import getpass
 from .logger import Logger
 from .logger import Severity
@@ -7,6 +8,8 @@ class IOs(Logger):
         super().__init__()
         self._filename = filename
         self._started = False
+        # A background log writer is a daemon thread; drain it on a clean exit.
+        atexit.register(self.stop)
 
     def __del__(self):
         self.stop()
@@ -1,5 +1,8 @@
 import datetime
 import os
+import queue
+import threading
+import time
 from enum import Enum
 from datetime import date
 
@@ -10,13 +13,46 @@ class Severity(Enum):
     WARNING = 3
     ERROR = 4
 
+# NOTE: if you change this Enum, please adjust ios.md
+class Durability(Enum):
+    EVERY_RECORD = 1  # flush and fsync every record on the calling thread
+    ERRORS = 2        # background writer; fsync on ERROR records and on stop
+    SHUTDOWN = 3      # background writer; fsync only on stop
+
 
 class Logger:
     def __init__(self):
         self.Severity = Severity
+        self.Durability = Durability
+        self._f = None
+        self._writer = None
+        self._durability = Durability.EVERY_RECORD
+        self._flush_bytes = 65536
+        self._flush_interval = 1.0
+
+    # Any option left as None keeps its current value. If the log is open, it
+    # is drained and reopened with the new options.
+    def configure(self, durability=None, flush_bytes=None, flush_interval=None):
+        filename = None
+        if self._f is not None and not self._f.closed:
+            filename = self._f.name
+            self._close()
+
+        if durability is not None:
+            self._durability = Durability[durability.upper()] if isinstance(durability, str) else durability
+        if flush_bytes is not None:
+            self._flush_bytes = flush_bytes
+        if flush_interval is not None:
+            self._flush_interval = flush_interval
+
+        if filename is not None:
+            Logger.start(self, filename)
 
     def start(self, filename='output/' + date.today().strftime('%Y-%m-%d') + '.txt'):
         self._f = open(filename,'a+')
+        if self._durability != Durability.EVERY_RECORD:
+            self._writer = _Log_Writer(self._f, self._durability, self._flush_bytes, self._flush_interval)
+            self._writer.start()
 
     def log(self, message, severity=Severity.INFO):
         timestamp = datetime.datetime.now()
@@ -31,9 +67,13 @@ class Logger:
         elif severity == Severity.DEBUG:
             tag = '[DEBUG]'
 
-        self._f.write('{} ({}):   {}\n'.format(tag, timestamp, message))
-        self._f.flush()
-        os.fsync(self._f)
+        record = '{} ({}):   {}\n'.format(tag, timestamp, message)
+        if self._writer is not None:
+            self._writer.put(record, severity)
+        else:
+            self._f.write(record)
+            self._f.flush()
+            os.fsync(self._f)
 
         if severity == Severity.INFO:
             return message
@@ -42,4 +82,73 @@ class Logger:
 
     def stop(self):
         self.log('The logger is shutting down.', self.Severity.INFO)
+        self._close()
+
+    # Drain the background writer, if any, and close the file.
+    def _close(self):
+        if self._writer is not None:
+            self._writer.drain()
+            self._writer = None
         self._f.close()
+
+
+""" _Log_Writer
+Background thread that writes the records queued by Logger.log. The file is
+flushed once flush_bytes of records are pending, or flush_interval seconds
+after the oldest pending record was queued, whichever comes first. Records are
+fsynced only as the durability level asks, and always when draining.
+"""
+class _Log_Writer(threading.Thread):
+
+    def __init__(self, f, durability, flush_bytes, flush_interval):
+        super().__init__(name="log-writer", daemon=True)
+        self._f = f
+        self._durability = durability
+        self._flush_bytes = flush_bytes
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue()
+
+    def put(self, record, severity):
+        self._queue.put((record, severity))
+
+    # Write every queued record, fsync the file and stop the thread.
+    def drain(self):
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        pending = 0
+        deadline = None
+        while True:
+            try:
+                if deadline is None:
+                    item = self._queue.get()
+                else:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = ()
+
+            if item is None:
+                break
+
+            if item:
+                record, severity = item
+                self._f.write(record)
+                pending += len(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self._flush_interval
+
+                if severity == Severity.ERROR and self._durability == Durability.ERRORS:
+                    self._sync()
+                    pending, deadline = 0, None
+                    continue
+
+            if pending >= self._flush_bytes or time.monotonic() >= deadline:
+                self._f.flush()
+                pending, deadline = 0, None
+
+        self._sync()
+
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f)
@@ -1,2 +1,3 @@
 from .Logger import Logger
 from .Logger import Severity
+from .Logger import Durability
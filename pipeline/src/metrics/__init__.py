@@ -0,0 +1,3 @@
+from .metrics import _Metrics
+
+metrics = _Metrics()
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from ..ios import ios
+
+
+""" Metrics
+Counters and histograms of what the pipeline does, rendered in the
+Prometheus text format (version 0.0.4):
+
+    pipeline_rows_read_total                rows read from Portal
+    pipeline_rows_skipped_total             rows without a service_key
+    pipeline_rows_flagged_total{flag}       flagged rows, per flag name
+    pipeline_db_seconds{table, operation}   query and write latency
+    pipeline_flagger_seconds{flagger}       flagging time per chunk
+    pipeline_stage_seconds{stage}           service_key resolution, save and reference statistics time
+
+The values live in this process. They are served over HTTP by serve(), which
+the daemon does when metrics_port is set, and saved to a file by write(),
+which the Flask UI serves at /metrics.
+For more, see docs/metrics.md
+"""
+class _Metrics():
+
+    # name: (type, help)
+    _METRICS = {
+        "pipeline_rows_read_total": (
+            "counter", "Rows of ctran_data read from Portal."),
+        "pipeline_rows_skipped_total": (
+            "counter", "Rows skipped for lack of a service_key."),
+        "pipeline_rows_flagged_total": (
+            "counter", "Flagged rows, by flag."),
+        "pipeline_db_seconds": (
+            "histogram", "Latency of database queries and writes, by table and operation."),
+        "pipeline_flagger_seconds": (
+            "histogram", "Time spent flagging a chunk, by flagger."),
+        "pipeline_stage_seconds": (
+            "histogram", "Time spent resolving the service_keys of a chunk (resolve), saving its flags (save) and updating the reference statistics (stats)."),
+    }
+
+    # Counters rendered as 0 before their first increment.
+    _UNLABELED = ("pipeline_rows_read_total", "pipeline_rows_skipped_total")
+
+    # Upper bounds, in seconds, of the histogram buckets.
+    _BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                10.0, 30.0, 60.0, 120.0, 300.0)
+
+    def __init__(self):
+        self._ios = ios
+        # The staged pipeline's threads record metrics concurrently.
+        self._lock = threading.Lock()
+        self.reset()
+
+    #######################################################
+
+    def reset(self):
+        with self._lock:
+            # name: {labels: value}, where labels is a sorted tuple of
+            # (label, value) pairs. Histogram values are
+            # [bucket counts..., sum, count].
+            self._values = dict((name, {}) for name in self._METRICS)
+
+    #######################################################
+
+    def inc(self, name, value=1, **labels):
+        if not value:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    #######################################################
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._values[name]
+            if key not in series:
+                series[key] = [0] * len(self._BUCKETS) + [0.0, 0]
+            values = series[key]
+            for i, bound in enumerate(self._BUCKETS):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    #######################################################
+
+    # A copy of every value recorded, which merge() adds to another
+    # instance's; this is how worker processes hand theirs back.
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                (name, dict((key, list(value) if isinstance(value, list) else value)
+                            for key, value in series.items()))
+                for name, series in self._values.items())
+
+    #######################################################
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, series in snapshot.items():
+                values = self._values[name]
+                for key, value in series.items():
+                    if not isinstance(value, list):
+                        values[key] = values.get(key, 0) + value
+                    elif key in values:
+                        values[key] = [a + b for a, b in zip(values[key], value)]
+                    else:
+                        values[key] = list(value)
+
+    #######################################################
+
+    # Observe the time spent in the with block, even if it raises.
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    #######################################################
+
+    # Returns every metric in the Prometheus text format.
+    def render(self):
+        with self._lock:
+            values = dict((name, dict(series)) for name, series in self._values.items())
+
+        lines = []
+        for name, (kind, help_text) in self._METRICS.items():
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            series = values[name]
+            if kind == "counter" and not series and name in self._UNLABELED:
+                series = {(): 0}
+            for key in sorted(series):
+                if kind == "counter":
+                    lines.append(self._sample(name, key, series[key]))
+                    continue
+
+                counts = series[key]
+                for bound, count in zip(self._BUCKETS, counts):
+                    lines.append(self._sample(
+                        name + "_bucket", key + (("le", repr(bound)),), count))
+                lines.append(self._sample(
+                    name + "_bucket", key + (("le", "+Inf"),), counts[-1]))
+                lines.append(self._sample(name + "_sum", key, counts[-2]))
+                lines.append(self._sample(name + "_count", key, counts[-1]))
+
+        return "\n".join(lines) + "\n"
+
+    #######################################################
+
+    # Save render() to path, replacing it atomically so a reader never sees
+    # half a file. Returns a bool.
+    def write(self, path):
+        temp_path = path + ".tmp"
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, "w") as f:
+                f.write(self.render())
+            os.replace(temp_path, path)
+        except OSError as error:
+            self._ios.log_and_print(
+                "Could not write the metrics to {}: {}".format(path, error),
+                self._ios.Severity.ERROR)
+            return False
+        return True
+
+    #######################################################
+
+    # Serve render() at http://host:port/metrics from a background thread.
+    # Returns the server, to be stopped with its shutdown(), or None if the
+    # port cannot be bound. Port 0 picks a free port (server.server_port).
+    def serve(self, port, host=""):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # Keep scrapes out of the log.
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = _Server((host, port), Handler)
+        except OSError as error:
+            self._ios.log_and_print(
+                "Could not serve the metrics on port {}: {}".format(port, error),
+                self._ios.Severity.ERROR)
+            return None
+
+        thread = threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True)
+        thread.start()
+        self._ios.log_and_print(
+            "Serving the metrics at port {}, path /metrics.".format(server.server_port))
+        return server
+
+    ###########################################################################
+    # Private Methods
+
+    def _key(self, name, labels):
+        if name not in self._METRICS:
+            raise KeyError("Unknown metric: " + name)
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def _sample(self, name, key, value):
+        if key:
+            name += "{" + ",".join(
+                '{}="{}"'.format(label, self._escape(value)) for label, value in key) + "}"
+        return "{} {}".format(name, value)
+
+    def _escape(self, value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
@@ -0,0 +1,128 @@
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..ios import ios
+from ..tables import Schema_Migrations
+
+
+""" Migration
+One versioned change to the schema of a table. target names the table in the
+Migrator's tables, and statements is a function of that table returning the
+list of SQL statements to run; they must be safe to run again (IF NOT EXISTS,
+...), as a migration interrupted before it was recorded is applied again.
+"""
+class Migration():
+    def __init__(self, version, description, target, statements):
+        self.version = version
+        self.description = description
+        self.target = target
+        self.statements = statements
+
+
+""" Migrator
+Applies the migrations that have not been applied yet to the tables they
+target. The applied versions are recorded in a schema_migrations table, in
+each schema holding a target table, so Portal and Hive each keep their own
+record even when they are separate databases. Each migration runs in one
+transaction with its record, and a failing migration stops the ones after it
+in the same schema.
+For more, see docs/db_ops.md
+"""
+class Migrator():
+
+    # tables maps the target names of the migrations to Table instances.
+    def __init__(self, tables, migrations):
+        self._ios = ios
+        self._tables = tables
+        self._migrations = sorted(migrations, key=lambda m: m.version)
+
+    #######################################################
+
+    # Returns True if every pending migration was applied.
+    def migrate(self):
+        success = True
+        for record, migrations in self._schemas():
+            if not record.create_table():
+                success = False
+                continue
+
+            applied = record.query_versions()
+            if applied is None:
+                success = False
+                continue
+
+            pending = [m for m in migrations if m.version not in applied]
+            if not pending:
+                self._ios.log_and_print("".join([
+                    record._schema, " is up to date."]))
+            for migration in pending:
+                if not self._apply(record, migration):
+                    success = False
+                    break
+
+        return success
+
+    #######################################################
+
+    # Prints the applied and pending versions of every schema. Returns False
+    # if one of them could not be read.
+    def print_status(self):
+        success = True
+        for record, migrations in self._schemas():
+            applied = record.query_versions()
+            if applied is None:
+                success = False
+                continue
+
+            url = record.get_engine().url
+            self._ios.print("".join([
+                record._schema, " (", str(url.host), "/", str(url.database), "):"]))
+            for migration in migrations:
+                state = "applied" if migration.version in applied else "pending"
+                self._ios.print("    {:>4}  {:<8} {}".format(
+                    migration.version, state, migration.description))
+
+        return success
+
+    #######################################################
+
+    # Returns a list of (Schema_Migrations, migrations) pairs, one per schema
+    # holding a target table, with the migrations of its tables in order.
+    def _schemas(self):
+        schemas = {}
+        for migration in self._migrations:
+            table = self._tables.get(migration.target)
+            if table is None:
+                self._ios.log_and_print(
+                    "No table for migration {}: {}".format(migration.version, migration.target),
+                    self._ios.Severity.WARNING)
+                continue
+
+            url = table.get_engine().url
+            key = (url.host, url.port, url.database, table._schema)
+            if key not in schemas:
+                schemas[key] = (Schema_Migrations(schema=table._schema, engine=url), [])
+            schemas[key][1].append(migration)
+
+        return list(schemas.values())
+
+    #######################################################
+
+    def _apply(self, record, migration):
+        table = self._tables[migration.target]
+        statements = migration.statements(table)
+        statements.append(record.record_sql(migration.version, migration.description))
+
+        self._ios.log_and_print("Applying migration {}: {}".format(
+            migration.version, migration.description))
+        try:
+            with record.get_engine().connect() as con:
+                with con.begin():
+                    for sql in statements:
+                        self._ios.log_and_print(sql)
+                        con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
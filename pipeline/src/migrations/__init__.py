@@ -0,0 +1,2 @@
+from .Migrator import Migrator, Migration
+from .versions import migrations
@@ -0,0 +1,90 @@
+from .Migrator import Migration
+import flaggers.flagger as flagger
+
+
+# Index statements only take the table instance, so that they follow the
+# schema, table name and storage format it was configured with.
+def _index(suffix, columns, requires=None):
+    def statements(table):
+        if requires is not None and requires not in table._expected_cols:
+            return []
+        return ["".join([
+            "CREATE INDEX IF NOT EXISTS ", table._table_name, "_", suffix, "_idx",
+            " ON ", table._schema, ".", table._table_name,
+            " (", ", ".join(columns), ");"])]
+    return statements
+
+
+# Flags added to the enum after a Hive's flags table was filled; the ones
+# already there are left alone.
+def _insert_flags(flags):
+    def statements(table):
+        values = ", ".join([
+            "({}, '{}', '{}')".format(
+                int(flag), flagger.flag_descriptions[flag].desc, flagger.flag_descriptions[flag].name)
+            for flag in flags])
+        return ["".join([
+            "INSERT INTO ", table._schema, ".", table._table_name,
+            " (flag_id, description, name) VALUES ", values,
+            " ON CONFLICT (flag_id) DO NOTHING;"])]
+    return statements
+
+
+# Columns added to a table after it was created; IF NOT EXISTS covers the
+# tables created with them.
+def _add_columns(columns):
+    def statements(table):
+        return ["".join([
+            "ALTER TABLE ", table._schema, ".", table._table_name, " ",
+            ", ".join("ADD COLUMN IF NOT EXISTS " + column for column in columns),
+            ";"])]
+    return statements
+
+
+# The days counted into reference_stats, which were only known as the
+# last_date of every key. The complete days up to the latest last_date of a
+# statistic are taken as counted, so that none of them is counted again.
+def _create_reference_stats_days(table):
+    return [table._days_creation_sql, "".join([
+        "INSERT INTO ", table._schema, ".", table._days_name, " (service_date)",
+        " SELECT c.service_date FROM ", table._schema, ".processing_checkpoints AS c",
+        " WHERE c.status = 'complete' AND c.service_date <= (SELECT MAX(last_date) FROM ",
+        table._schema, ".", table._table_name, ")",
+        " ON CONFLICT (service_date) DO NOTHING;"])]
+
+
+# NOTE: versions are applied in order and never renumbered; append new
+# migrations at the end, and please adjust docs/db_ops.md
+migrations = [
+    Migration(1, "Index ctran_data on service_date", "ctran",
+              _index("service_date", ["service_date"])),
+    Migration(2, "Index flagged_data on service_date", "flagged",
+              _index("service_date", ["service_date"])),
+    # The bitmask storage has no flag_id column to index.
+    Migration(3, "Index flagged_data on flag_id, service_date", "flagged",
+              _index("flag_id_service_date", ["flag_id", "service_date"], requires="flag_id")),
+    Migration(4, "Index flagged_data on row_id", "flagged",
+              _index("row_id", ["row_id"])),
+    Migration(5, "Index row_fingerprints on service_date", "fingerprints",
+              _index("service_date", ["service_date"])),
+    # Hives created before the checkpoints table.
+    Migration(6, "Create processing_checkpoints", "checkpoints",
+              lambda table: [table._creation_sql]),
+    Migration(7, "Add the bounds flags", "flags",
+              _insert_flags([flagger.Flags.BELOW_MIN, flagger.Flags.ABOVE_MAX])),
+    Migration(8, "Add the trip sequence flags", "flags",
+              _insert_flags([flagger.Flags.ARRIVE_TIME_REGRESSION,
+                             flagger.Flags.IMPLIED_SPEED,
+                             flagger.Flags.MILEAGE_REGRESSION])),
+    Migration(9, "Create location_references", "location_references",
+              lambda table: [table._creation_sql]),
+    Migration(10, "Add the GPS outlier flag", "flags",
+              _insert_flags([flagger.Flags.GPS_OUTLIER])),
+    Migration(11, "Create reference_stats", "reference_stats",
+              lambda table: [table._creation_sql]),
+    Migration(12, "Add the day fingerprints to processing_checkpoints", "checkpoints",
+              _add_columns(["source_rows BIGINT", "max_row_id BIGINT",
+                            "source_hash CHAR(32)", "flagger_version CHAR(32)"])),
+    Migration(13, "Create reference_stats_days", "reference_stats",
+              _create_reference_stats_days),
+]
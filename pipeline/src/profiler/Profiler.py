@@ -0,0 +1,140 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+from datetime import datetime
+
+from ..ios import ios
+from ..metrics import metrics
+
+
+""" Profiler
+Runs one operation under cProfile, then saves to output_path:
+
+    profile-<label>-<YYYYmmdd-HHMMSS>.pstats    the raw stats, for pstats or snakeviz
+    profile-<label>-<YYYYmmdd-HHMMSS>.txt       a per-stage summary, and the
+                                                functions taking the most time
+
+The stages are timed by src.metrics, so the summary also covers the reader
+and writer threads of the staged pipeline, which cProfile doesn't see. The
+summary lists the stages and flaggers in a fixed order and the function paths
+without directories, so that the files of two runs can be diffed.
+For more, see docs/cl_query.md
+"""
+class Profiler():
+
+    # Number of functions listed in the summary.
+    _TOP_FUNCTIONS = 40
+
+    def __init__(self, output_path="output/"):
+        self._ios = ios
+        self._output_path = output_path
+
+    #######################################################
+
+    # Call fn(*args, **kwargs) under the profiler and save its files; label
+    # names them, and command, the arguments run, heads the summary. Returns
+    # what fn returns.
+    def run(self, label, command, fn, *args, **kwargs):
+        before = metrics.snapshot()
+        profile = cProfile.Profile()
+        started = datetime.now()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            stages = self.stages(before, metrics.snapshot())
+            self._save(label, command, started, total, profile, stages)
+
+    #######################################################
+
+    # The (stage, seconds, calls) recorded between two metrics snapshots, in
+    # the order the pipeline runs them: the ctran_data queries, service_key
+    # resolution, each flagger by name, the duplicate check, the reference
+    # statistics, then the saves.
+    def stages(self, before, after):
+        queries = self._histogram(before, after, "pipeline_db_seconds")
+        flaggers = self._histogram(before, after, "pipeline_flagger_seconds")
+        steps = self._histogram(before, after, "pipeline_stage_seconds")
+
+        stages = [("query", self._total(queries, table="ctran_data", operation="query")),
+                  ("service-key resolution", self._total(steps, stage="resolve"))]
+        names = sorted(set(dict(key)["flagger"] for key in flaggers) - set(["Duplicate"]))
+        for name in names:
+            stages.append(("flagger " + name, self._total(flaggers, flagger=name)))
+        stages.append(("duplicate check", self._total(flaggers, flagger="Duplicate")))
+        stages.append(("reference statistics", self._total(steps, stage="stats")))
+        stages.append(("save", self._total(steps, stage="save")))
+        return [(stage, seconds, calls) for stage, (seconds, calls) in stages]
+
+    ###########################################################################
+    # Private Methods
+
+    def _save(self, label, command, started, total, profile, stages):
+        name = "".join(["profile-", label, "-", started.strftime("%Y%m%d-%H%M%S")])
+        stats_path = os.path.join(self._output_path, name + ".pstats")
+        summary_path = os.path.join(self._output_path, name + ".txt")
+        try:
+            os.makedirs(self._output_path, exist_ok=True)
+            profile.dump_stats(stats_path)
+            with open(summary_path, "w") as f:
+                f.write(self._summary(command, started, total, profile, stages))
+        except OSError as error:
+            self._ios.log_and_print(
+                "Could not save the profile: {}".format(error),
+                self._ios.Severity.ERROR)
+            return False
+
+        self._ios.log_and_print(
+            "Saved the profile to {} and {}".format(stats_path, summary_path))
+        return True
+
+    def _summary(self, command, started, total, profile, stages):
+        lines = [
+            "Profile of: " + command,
+            "Started: " + started.strftime("%Y-%m-%d %H:%M:%S"),
+            "",
+            "{:<32} {:>10} {:>8} {:>7}".format("Stage", "Seconds", "Calls", "Share")]
+        for stage, seconds, calls in stages:
+            lines.append(self._stage_line(stage, seconds, calls, total))
+        # In the staged mode the stages overlap, and may add up to more than
+        # the total.
+        other = max(0.0, total - sum(seconds for _, seconds, _ in stages))
+        lines.append(self._stage_line("other", other, "", total))
+        lines.append(self._stage_line("total", total, "", total))
+
+        lines.extend(["", "Top functions by cumulative time (main thread only):"])
+        text = io.StringIO()
+        stats = pstats.Stats(profile, stream=text)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(self._TOP_FUNCTIONS)
+        lines.append(text.getvalue())
+        return "\n".join(lines)
+
+    def _stage_line(self, stage, seconds, calls, total):
+        share = 100.0 * seconds / total if total > 0 else 0.0
+        return "{:<32} {:>10.3f} {:>8} {:>6.1f}%".format(stage, seconds, calls, share)
+
+    # {labels: (seconds, count)} of the observations of a histogram between
+    # two snapshots.
+    def _histogram(self, before, after, name):
+        series = {}
+        for key, values in after.get(name, {}).items():
+            previous = before.get(name, {}).get(key)
+            seconds, count = values[-2], values[-1]
+            if previous is not None:
+                seconds, count = seconds - previous[-2], count - previous[-1]
+            if count:
+                series[key] = (seconds, count)
+        return series
+
+    # The (seconds, count) of the series with every label given.
+    def _total(self, series, **labels):
+        seconds, count = 0.0, 0
+        for key, (key_seconds, key_count) in series.items():
+            key = dict(key)
+            if all(key.get(label) == value for label, value in labels.items()):
+                seconds += key_seconds
+                count += key_count
+        return seconds, count
@@ -0,0 +1 @@
+from .Profiler import Profiler
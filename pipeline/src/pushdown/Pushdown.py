@@ -0,0 +1,141 @@
+import pandas
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+from ..ios import ios
+
+
+""" Pushdown
+Evaluates flaggers whose checks are simple predicates (see
+Flagger.sql_flags) inside the database, rather than pulling every ctran_data
+row into Python. All of the pushed down flaggers are compiled into a single
+statement that scans the date range once:
+
+- When Portal and Hive are the same database, the flags are written with one
+  INSERT INTO flagged_data SELECT ..., so the data never leaves the database.
+- Otherwise the flags are computed by Portal and only (row_id, flag_id,
+  service_date) triples are fetched.
+
+The service periods covering the date range must exist before
+insert_date_range is called.
+For more, see docs/flaggers.md
+"""
+class Pushdown():
+
+    def __init__(self, ctran, flagged, service_periods):
+        self._ios = ios
+        self._ctran = ctran
+        self._flagged = flagged
+        self._service_periods = service_periods
+
+    #######################################################
+
+    # Returns a list of (flag_id, SQL expression) for every flag raised by the
+    # flaggers in flagger_list that support pushdown.
+    def compile(self, flagger_list, config):
+        expressions = []
+        for flagger in flagger_list:
+            try:
+                sql_flags = flagger.sql_flags(config)
+            except Exception as e:
+                self._ios.log_and_print(
+                    "Error in flagger {}. Skipping.\n{}".format(flagger.name, e),
+                    self._ios.Severity.WARNING)
+                continue
+
+            if sql_flags is None:
+                continue
+            for flag, expression in sql_flags.items():
+                expressions.append((int(flag), expression))
+
+        return expressions
+
+    #######################################################
+
+    # True if ctran_data and flagged_data live in the same database, so one
+    # statement can read the former and write the latter.
+    def same_database(self):
+        ctran_url = self._ctran.get_engine().url
+        flagged_url = self._flagged.get_engine().url
+        return (ctran_url.host, ctran_url.port, ctran_url.database) == \
+               (flagged_url.host, flagged_url.port, flagged_url.database)
+
+    #######################################################
+
+    # Write the flags of every ctran_data row between start_date and end_date,
+    # inclusive, straight into flagged_data. Returns a bool.
+    def insert_date_range(self, start_date, end_date, expressions):
+        engine = self._flagged.get_engine()
+        if not isinstance(engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        if not self._flagged.create_partitions(pandas.date_range(start_date, end_date)):
+            return False
+
+        sql = self._flagged.insert_select_sql("".join([
+            "SELECT c.row_id, sp.service_key, c.flag_id, c.service_date FROM (",
+            self._flags_sql(start_date, end_date, expressions), ") AS c",
+            " JOIN ", self._full_name(self._service_periods), " AS sp",
+            " ON c.service_date BETWEEN sp.start_date AND sp.end_date"]))
+
+        try:
+            self._ios.log_and_print(sql)
+            with engine.connect() as con:
+                result = con.execute(sql)
+                self._ios.log_and_print(
+                    "Pushdown inserted {} flags.".format(result.rowcount))
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+    #######################################################
+
+    # Compute the flags of every ctran_data row between start_date and
+    # end_date, inclusive, on Portal. Returns a DataFrame with the columns
+    # row_id, flag_id and service_date, or None if an error occurred.
+    def query_date_range(self, start_date, end_date, expressions):
+        engine = self._ctran.get_engine()
+        if not isinstance(engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join([self._flags_sql(start_date, end_date, expressions), ";"])
+        try:
+            self._ios.log_and_print(sql)
+            df = pandas.read_sql(sql, engine)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemy: " + str(error), self._ios.Severity.ERROR)
+            return None
+        except (ValueError, KeyError) as error:
+            self._ios.log_and_print(
+                "Pandas: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+        return df
+
+    #######################################################
+
+    # One row per (row_id, flag_id) whose expression holds. The expressions
+    # are evaluated in a LATERAL VALUES list, so the range is scanned once no
+    # matter how many flags there are, and only ctran_data's columns are in
+    # scope for them.
+    def _flags_sql(self, start_date, end_date, expressions):
+        values = ", ".join(["".join(["(", str(flag_id), ", (", expression, "))"])
+                            for flag_id, expression in expressions])
+        return "".join([
+            "SELECT row_id, f.flag_id, service_date FROM ",
+            self._full_name(self._ctran),
+            " CROSS JOIN LATERAL (VALUES ", values, ") AS f(flag_id, flagged)",
+            " WHERE service_date BETWEEN ",
+            start_date.strftime("'%Y-%m-%d'"), " AND ",
+            end_date.strftime("'%Y-%m-%d'"),
+            " AND f.flagged"])
+
+    def _full_name(self, table):
+        return "".join([table._schema, ".", table._table_name])
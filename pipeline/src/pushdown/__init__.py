@@ -0,0 +1 @@
+from .Pushdown import Pushdown
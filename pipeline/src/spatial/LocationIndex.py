@@ -0,0 +1,192 @@
+import hashlib
+import math
+import numpy
+import pandas
+
+from ..ios import ios
+
+
+""" LocationIndex
+The reference position of every stop location, to tell how far from its stop
+a stop event was recorded. The references are the median x_coordinate and
+y_coordinate of each location_id's past rows, kept in Hive's
+location_references table (see src/tables/location_references.py), and
+loaded by the client once per run.
+
+The coordinates are in feet on a projected plane, such as the state plane
+ctran_data uses ("feet" units), or longitude and latitude ("degrees" units),
+which are projected to feet on a plane around the mean latitude of the
+references, accurate to well under a percent across a transit district.
+The references are also bucketed into a grid of cell_size feet, so
+the nearest reference to a point is found among the 9 cells around it rather
+than among every reference. Both lookups are vectorized, so checking a day of
+rows costs a sort and a few passes over it.
+For more, see docs/flaggers.md
+"""
+class LocationIndex():
+
+    # Feet per degree of latitude.
+    _FEET_PER_DEGREE = 364567.0
+    # The coordinate units build() takes.
+    units = ["feet", "degrees"]
+
+    # A cell's key holds its column in the high 32 bits and its row, offset
+    # to be positive, in the low 32 bits.
+    _COLUMN_FACTOR = 2 ** 32
+    _ROW_OFFSET = 2 ** 31
+
+    def __init__(self):
+        self._ios = ios
+        self.clear()
+
+    #######################################################
+
+    def clear(self):
+        self.loaded = False
+        self._ids = numpy.empty(0, dtype="int64")
+        self._x = numpy.empty(0)
+        self._y = numpy.empty(0)
+        self._x_scale = 1.0
+        self._y_scale = 1.0
+        self._cell_size = 1.0
+        # The keys of the references' cells, sorted, and the reference of
+        # each key.
+        self._cell_keys = numpy.empty(0, dtype="int64")
+        self._cell_refs = numpy.empty(0, dtype="int64")
+
+    #######################################################
+
+    def __len__(self):
+        return len(self._ids)
+
+    #######################################################
+
+    # An md5 digest of the references indexed, so that days flagged against
+    # other references can be told apart (see flagger_version); None if none
+    # are.
+    def digest(self):
+        if not len(self._ids):
+            return None
+        md5 = hashlib.md5()
+        for array in [self._ids, self._x, self._y]:
+            md5.update(numpy.ascontiguousarray(array).tobytes())
+        return md5.hexdigest()
+
+    #######################################################
+
+    # Read the references of a Location_References table and index them.
+    # Returns a bool.
+    def load(self, table, cell_size, units="feet"):
+        references = table.query_references()
+        if references is None:
+            return False
+
+        self.build(references, cell_size, units)
+        self._ios.log_and_print(
+            "Loaded the reference positions of {} locations.".format(len(self)))
+        return True
+
+    #######################################################
+
+    # Index a DataFrame with the columns location_id, x_coordinate and
+    # y_coordinate, in units (one of LocationIndex.units), replacing any
+    # earlier references. Raises ValueError for other units.
+    def build(self, references, cell_size, units="feet"):
+        if units not in self.units:
+            raise ValueError("Unknown coordinate units: " + str(units))
+        references = references.dropna(
+            subset=["location_id", "x_coordinate", "y_coordinate"])
+        references = references.sort_values("location_id")
+        y = references["y_coordinate"].to_numpy(dtype="float64")
+        x = references["x_coordinate"].to_numpy(dtype="float64")
+
+        self._ids = references["location_id"].to_numpy(dtype="int64")
+        self._x_scale = 1.0
+        self._y_scale = 1.0
+        if units == "degrees":
+            self._y_scale = self._FEET_PER_DEGREE
+            self._x_scale = self._FEET_PER_DEGREE
+            if len(y):
+                self._x_scale *= math.cos(math.radians(y.mean()))
+        self._x = x * self._x_scale
+        self._y = y * self._y_scale
+
+        self._cell_size = max(float(cell_size), 1.0)
+        keys = self._cell_key(*self._cell(self._x, self._y))
+        self._cell_refs = numpy.argsort(keys, kind="stable")
+        self._cell_keys = keys[self._cell_refs]
+        self.loaded = True
+
+    #######################################################
+
+    # The distance in feet from every point to the reference of its
+    # location_id, as a float64 numpy array; NaN where a value is missing or
+    # the location has no reference.
+    def reference_distance(self, location_ids, x_coordinates, y_coordinates):
+        ids = self._numeric(location_ids)
+        x, y = self._project(x_coordinates, y_coordinates)
+        distance = numpy.full(len(ids), numpy.nan)
+        if not len(self._ids):
+            return distance
+
+        points = numpy.flatnonzero(~numpy.isnan(ids))
+        point_ids = ids[points].astype("int64")
+        refs = numpy.minimum(
+            numpy.searchsorted(self._ids, point_ids), len(self._ids) - 1)
+        found = self._ids[refs] == point_ids
+        points, refs = points[found], refs[found]
+        distance[points] = numpy.hypot(x[points] - self._x[refs], y[points] - self._y[refs])
+        return distance
+
+    #######################################################
+
+    # The distance in feet from every point to the nearest reference, as a
+    # float64 numpy array. Only the references within cell_size are looked
+    # at; a point farther than that from all of them gets inf, and a point
+    # with a missing coordinate NaN.
+    def nearest_distance(self, x_coordinates, y_coordinates):
+        x, y = self._project(x_coordinates, y_coordinates)
+        distance = numpy.full(len(x), numpy.inf)
+        missing = numpy.isnan(x) | numpy.isnan(y)
+        distance[missing] = numpy.nan
+        points = numpy.flatnonzero(~missing)
+        if not len(self._ids) or not len(points):
+            return distance
+
+        columns, rows = self._cell(x[points], y[points])
+        for column_step in (-1, 0, 1):
+            for row_step in (-1, 0, 1):
+                keys = self._cell_key(columns + column_step, rows + row_step)
+                start = numpy.searchsorted(self._cell_keys, keys, side="left")
+                end = numpy.searchsorted(self._cell_keys, keys, side="right")
+                # One pass per reference in the fullest cell, which holds a
+                # handful of stops at most.
+                for k in range(int((end - start).max())):
+                    has = start + k < end
+                    cell_points = points[has]
+                    refs = self._cell_refs[start[has] + k]
+                    distance[cell_points] = numpy.minimum(
+                        distance[cell_points],
+                        numpy.hypot(x[cell_points] - self._x[refs],
+                                    y[cell_points] - self._y[refs]))
+
+        distance[distance > self._cell_size] = numpy.inf
+        return distance
+
+    ###########################################################################
+    # Private Methods
+
+    def _project(self, x_coordinates, y_coordinates):
+        return (self._numeric(x_coordinates) * self._x_scale,
+                self._numeric(y_coordinates) * self._y_scale)
+
+    def _cell(self, x, y):
+        return (numpy.floor(x / self._cell_size).astype("int64"),
+                numpy.floor(y / self._cell_size).astype("int64"))
+
+    def _cell_key(self, columns, rows):
+        return columns * self._COLUMN_FACTOR + (rows + self._ROW_OFFSET)
+
+    def _numeric(self, values):
+        return pandas.to_numeric(pandas.Series(values), errors="coerce").to_numpy(
+            dtype="float64", na_value=numpy.nan)
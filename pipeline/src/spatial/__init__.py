@@ -0,0 +1,3 @@
+from .LocationIndex import LocationIndex
+
+locations = LocationIndex()
@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+
+from ..ios import ios
+
+
+""" Stages
+Overlaps the three stages of processing a date range: reading chunks from
+Portal, flagging them, and writing the flags to Hive. The chunks are read on
+a reader thread and the writes run on a writer thread, each connected to the
+flagging stage, which stays on the calling thread, by a bounded queue of
+queue_size items:
+
+    reader --(read queue)--> flagging --(write queue)--> writer
+
+The bounds keep memory at a few chunks, whichever stage is the slowest; the
+queue in front of it fills and the stages before it wait. Every stage times
+how long it is busy and how long it waits, and the queues record their
+depths, see stats(). Writes run in the order they are queued.
+For more, see docs/stages.md
+"""
+class Stages():
+
+    _DONE = object()
+
+    def __init__(self, queue_size=2):
+        self._ios = ios
+        self._queue_size = max(1, queue_size)
+        self._stop = threading.Event()
+        self._read_queue = queue.Queue(self._queue_size)
+        self._write_queue = queue.Queue(self._queue_size)
+        self._reader = None
+        self._writer = None
+        self._error = None
+        self._stats = {
+            stage: {"busy": 0.0, "wait": 0.0, "items": 0}
+            for stage in ["read", "flag", "write"]}
+        self._depths = {"read": [], "write": []}
+        self._flag_started = None
+
+    #######################################################
+
+    # Generator of the items of chunks, which are iterated on the reader
+    # thread. Time spent between two items is the flagging stage's. If
+    # iterating chunks raises an exception, None is yielded and the
+    # generator stops, like Table._query_table_chunks.
+    def read(self, chunks):
+        self._reader = threading.Thread(
+            target=self._read, args=(chunks,), name="stage-read", daemon=True)
+        self._reader.start()
+
+        while True:
+            item = self._get(self._read_queue, "flag")
+            if item is Stages._DONE:
+                if self._error is not None:
+                    yield None
+                return
+            yield item
+
+    #######################################################
+
+    # Returns a function queuing calls of write on the writer thread, and
+    # returning immediately: False once a write has failed, by raising an
+    # exception or returning False, so the caller can stop; otherwise True.
+    def writer(self, write):
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write, name="stage-write", daemon=True)
+            self._writer.start()
+
+        def queue_write(*args, **kwargs):
+            if self._error is not None:
+                return False
+            self._put(self._write_queue, (write, args, kwargs), "flag", "write")
+            return True
+        return queue_write
+
+    #######################################################
+
+    # Wait for every queued write and stop the threads. Returns False if a
+    # stage raised an exception, or a write returned False, which is logged.
+    def close(self):
+        if self._flag_started is not None:
+            self._stats["flag"]["busy"] += time.perf_counter() - self._flag_started
+            self._flag_started = None
+
+        if self._writer is not None:
+            self._write_queue.put(Stages._DONE)
+            self._writer.join()
+
+        self._stop.set()
+        if self._reader is not None:
+            # Unblock a reader waiting on a full queue.
+            while self._reader.is_alive():
+                try:
+                    self._read_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        if self._error is not None:
+            self._ios.log_and_print(
+                "A pipeline stage failed: {}".format(self._error),
+                self._ios.Severity.ERROR)
+            return False
+        return True
+
+    #######################################################
+
+    # Returns a dict of stage name ("read", "flag", "write") to a dict of:
+    #   busy: seconds spent working.
+    #   wait: seconds spent blocked on a queue, for input or room for output.
+    #   items: number of items the stage handled.
+    # and for "read" and "write", of the queue feeding the stage:
+    #   max_depth, mean_depth: the items waiting in it, sampled on every put.
+    def stats(self):
+        stats = {}
+        for stage, values in self._stats.items():
+            stats[stage] = dict(values)
+            depths = self._depths.get(stage)
+            if depths is not None:
+                stats[stage]["max_depth"] = max(depths) if depths else 0
+                stats[stage]["mean_depth"] = sum(depths) / len(depths) if depths else 0.0
+        return stats
+
+    #######################################################
+
+    # Logs the stats, and which stage was the busiest.
+    def log_stats(self):
+        stats = self.stats()
+        for stage, values in stats.items():
+            line = "Stage {:<5}: {:>4} items, busy {:8.3f}s, waiting {:8.3f}s".format(
+                stage, values["items"], values["busy"], values["wait"])
+            if "max_depth" in values:
+                line += ", queue depth max {} mean {:.2f}".format(
+                    values["max_depth"], values["mean_depth"])
+            self._ios.log_and_print(line)
+
+        bottleneck = max(stats, key=lambda stage: stats[stage]["busy"])
+        self._ios.log_and_print("Bottleneck stage: " + bottleneck)
+
+    ###########################################################################
+    # Private Methods
+
+    def _read(self, chunks):
+        try:
+            iterator = iter(chunks)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(iterator, Stages._DONE)
+                if item is not Stages._DONE:
+                    self._stats["read"]["busy"] += time.perf_counter() - start
+                    self._stats["read"]["items"] += 1
+                if not self._put(self._read_queue, item, "read", "read"):
+                    return
+                if item is Stages._DONE:
+                    return
+        except Exception as e:
+            self._error = e
+            self._put(self._read_queue, Stages._DONE, "read", "read")
+
+    def _write(self):
+        failed = False
+        while True:
+            item = self._get(self._write_queue, "write")
+            if item is Stages._DONE:
+                return
+            if failed:
+                # Drop the writes after a failed one, which may depend on it.
+                continue
+
+            write, args, kwargs = item
+            start = time.perf_counter()
+            try:
+                if write(*args, **kwargs) is False:
+                    raise RuntimeError("the write returned False")
+            except Exception as e:
+                self._error = e
+                failed = True
+            self._stats["write"]["busy"] += time.perf_counter() - start
+            self._stats["write"]["items"] += 1
+
+    # Blocking put on a bounded queue, which gives up once stopped. The time
+    # blocked is the wait of stage, and the depth is recorded for the queue
+    # feeding depth_stage. Returns False if stopped.
+    def _put(self, q, item, stage, depth_stage):
+        self._pause_flag(stage)
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    q.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self._stop.is_set():
+                        return False
+        finally:
+            self._stats[stage]["wait"] += time.perf_counter() - start
+            self._resume_flag(stage)
+
+        if item is not Stages._DONE:
+            self._depths[depth_stage].append(q.qsize())
+        return True
+
+    def _get(self, q, stage):
+        self._pause_flag(stage)
+        start = time.perf_counter()
+        item = q.get()
+        self._stats[stage]["wait"] += time.perf_counter() - start
+        if stage == "flag" and item is not Stages._DONE:
+            self._stats["flag"]["items"] += 1
+        self._resume_flag(stage)
+        return item
+
+    # The flagging stage runs the caller's code between its gets and puts, so
+    # it is busy whenever it is not waiting on a queue.
+    def _pause_flag(self, stage):
+        if stage == "flag" and self._flag_started is not None:
+            self._stats["flag"]["busy"] += time.perf_counter() - self._flag_started
+            self._flag_started = None
+
+    def _resume_flag(self, stage):
+        if stage == "flag":
+            self._flag_started = time.perf_counter()
@@ -0,0 +1 @@
+from .Stages import Stages
@@ -1,5 +1,12 @@
+from .engine_registry import Engine_Registry
+from .engine_registry import engines
 from .table import Table
 from .ctran_data import CTran_Data
 from .flagged_data import Flagged_Data
 from .flags import Flags
 from .service_periods import Service_Periods
+from .fingerprints import Fingerprints
+from .schema_migrations import Schema_Migrations
+from .checkpoints import Checkpoints
+from .location_references import Location_References
+from .reference_stats import Reference_Stats
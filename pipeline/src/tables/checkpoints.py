@@ -0,0 +1,178 @@
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+from .table import Table
+
+class Checkpoints(Table):
+    # One row per service date the pipeline has processed, with its counts,
+    # timings and status:
+    # - "complete": every flag of the day is written; a day with no flags is
+    #   complete as long as it had ctran_data rows.
+    # - "no_data": Portal had no rows for the day yet, so it will be
+    #   processed again.
+    # - "failed": the day could not be processed.
+    # The rows of a range are written in the transaction of its last flag
+    # write (see write_sql), so a complete day always has all of its flags.
+    # A day also records the fingerprint of its Portal rows when it was read
+    # (see CTran_Data.fingerprint_date_range) and the flagger_version it was
+    # flagged with, so that reprocessing can skip the days neither changed.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "processing_checkpoints"
+        self._index_col = None
+        self._expected_cols = [
+            "service_date",
+            "status",
+            "ctran_rows",
+            "skipped_rows",
+            "flag_rows",
+            "started_at",
+            "finished_at",
+            "source_rows",
+            "max_row_id",
+            "source_hash",
+            "flagger_version",
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                service_date DATE PRIMARY KEY,
+                status VARCHAR(10) NOT NULL,
+                ctran_rows BIGINT,
+                skipped_rows BIGINT,
+                flag_rows BIGINT,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                source_rows BIGINT,
+                max_row_id BIGINT,
+                source_hash CHAR(32),
+                flagger_version CHAR(32)
+            );"""])
+
+
+    def write_sql(self, rows):
+        # rows is a list of [service_date, status, ctran_rows, skipped_rows,
+        # flag_rows, started_at, finished_at, source_rows, max_row_id,
+        # source_hash, flagger_version]; dates and times are datetime
+        # instances, and unknown values None.
+        # Returns the statement upserting them. A complete day is never
+        # downgraded, so a failed rerun of a range keeps its checkpoints.
+        values = ", ".join([
+            "".join(["(", ", ".join(self._sql_value(v) for v in row), ")"])
+            for row in rows])
+        target = "".join([self._schema, ".", self._table_name])
+        update = ", ".join(["".join([col, " = EXCLUDED.", col])
+                            for col in self._expected_cols[1:]])
+        return "".join([
+            "INSERT INTO ", target, " (", ", ".join(self._expected_cols), ")",
+            " VALUES ", values,
+            " ON CONFLICT (service_date) DO UPDATE SET ", update,
+            " WHERE ", target, ".status <> 'complete' OR EXCLUDED.status = 'complete';"])
+
+
+    def write_table(self, rows):
+        # Writes rows (see write_sql) on their own, for ranges without flags
+        # to write them with.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        sql = self.write_sql(rows)
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+
+    def get_latest_day(self):
+        # Returns the latest complete service date (as datetime.date), or None
+        # if there is none or an error occurs. This is a single probe of the
+        # primary key index, however many days are recorded.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join([
+            "SELECT service_date FROM ", self._schema, ".", self._table_name,
+            " WHERE status = 'complete' ORDER BY service_date DESC LIMIT 1;"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                row = con.execute(sql).first()
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+        return None if row is None else row[0]
+
+
+    def query_date_range(self, start_date, end_date):
+        # Returns the rows between start_date and end_date, inclusive
+        # (datetime.date instances), as a dict of service_date to a dict of
+        # every other column, or None if an error occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join([
+            "SELECT ", ", ".join(self._expected_cols),
+            " FROM ", self._schema, ".", self._table_name,
+            " WHERE service_date BETWEEN ", self._sql_value(start_date),
+            " AND ", self._sql_value(end_date), ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return dict((row[0], dict(zip(self._expected_cols[1:], row[1:])))
+                            for row in con.execute(sql))
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+
+    def delete_date_range(self, start_date, end_date):
+        # Forget the checkpoints between start_date and end_date, inclusive
+        # (datetime.date instances). Either can be None for an open range.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        conditions = []
+        if start_date is not None:
+            conditions.append("".join(["service_date >= ", self._sql_value(start_date)]))
+        if end_date is not None:
+            conditions.append("".join(["service_date <= ", self._sql_value(end_date)]))
+        sql = "".join(["DELETE FROM ", self._schema, ".", self._table_name])
+        if conditions:
+            sql = "".join([sql, " WHERE ", " AND ".join(conditions)])
+        sql += ";"
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+
+    def _sql_value(self, value):
+        if value is None:
+            return "NULL"
+        if hasattr(value, "hour"):
+            return value.strftime("'%Y-%m-%d %H:%M:%S'")
+        if hasattr(value, "strftime"):
+            return value.strftime("'%Y-%m-%d'")
+        if isinstance(value, str):
+            return "".join(["'", value, "'"])
+        return str(int(value))
@@ -74,6 +74,38 @@ class CTran_Data(Table):
                 trip_id INTEGER
             );"""])
 
+        # Column types of the queried frames, following _creation_sql: nullable
+        # integers, float32 for the distances and coordinates, and categories
+        # for the low cardinality codes.
+        self._dtypes = {
+            "service_date": "datetime64[ns]",
+            "vehicle_number": "Int32",
+            "leave_time": "Int32",
+            "train": "Int32",
+            "route_number": "Int32",
+            "direction": "Int16",
+            "service_key": "category",
+            "trip_number": "Int32",
+            "stop_time": "Int32",
+            "arrive_time": "Int32",
+            "dwell": "Int32",
+            "location_id": "Int32",
+            "door": "Int32",
+            "ons": "Int32",
+            "offs": "Int32",
+            "estimated_load": "Int32",
+            "lift": "Int32",
+            "maximum_speed": "Int32",
+            "train_mileage": "float64",
+            "pattern_distance": "float32",
+            "location_distance": "float32",
+            "x_coordinate": "float32",
+            "y_coordinate": "float32",
+            "data_source": "category",
+            "schedule_status": "Int32",
+            "trip_id": "Int32"
+        }
+
     #######################################################
 
     # [dev tool]
@@ -112,10 +144,42 @@ class CTran_Data(Table):
 
     #######################################################
 
+    # [dev tool]
+    # Bulk-load a DataFrame with the expected columns into the table, e.g.
+    # synthetic data for benchmarks. row_id is assigned by the table.
+    def write_table(self, data):
+        return self._copy_table(data)
+
+    #######################################################
+
     # Query all data between date_from and date_to, dates
     # NOTE: if there is no ctran_data table, this will not work, obviously.
     def query_date_range(self, date_from, date_to):
-        sql = "".join(["SELECT * FROM ",
+        return self._query_table(self._date_range_sql(date_from, date_to))
+
+    #######################################################
+
+    # Streaming version of query_date_range: a generator of DataFrames of at
+    # most chunksize rows each, read through a server-side cursor in trip
+    # order (see flaggers.flagger.Trips), so that the stops of a trip are
+    # read one after another. If an error occurs, None is yielded and the
+    # generator stops.
+    def query_date_range_chunks(self, date_from, date_to, chunksize):
+        sql = self._date_range_sql(date_from, date_to,
+                                   "service_date, vehicle_number, trip_id, stop_time, row_id")
+        return self._query_table_chunks(sql, chunksize)
+
+    #######################################################
+
+    # Count the rows of every service date between date_from and date_to.
+    # Returns a dict of datetime.date to count, without the dates that have
+    # no rows, or None if an error occurs.
+    def count_date_range(self, date_from, date_to):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT service_date, COUNT(*) FROM ",
                        self._schema,
                        ".",
                        self._table_name,
@@ -123,16 +187,132 @@ class CTran_Data(Table):
                        date_from.strftime("%Y-%m-%d"),
                        "' AND '",
                        date_to.strftime("%Y-%m-%d"),
-                       "';"])
+                       "' GROUP BY service_date;"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return dict((row[0], int(row[1])) for row in con.execute(sql))
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+    #######################################################
+
+    # Fingerprint the rows of every service date between date_from and
+    # date_to: their count, their largest row_id, and the md5 of the md5s of
+    # every whole row in row_id order, so that any added, removed or edited
+    # row changes it. Computed in the database, which only sends one row per
+    # day. Returns a dict of datetime.date to (count, max_row_id, hash),
+    # without the dates that have no rows, or None if an error occurs.
+    def fingerprint_date_range(self, date_from, date_to):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT service_date, COUNT(*), MAX(row_id),",
+                       " md5(string_agg(md5(c::text), '' ORDER BY row_id)) FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " AS c WHERE service_date BETWEEN '",
+                       date_from.strftime("%Y-%m-%d"),
+                       "' AND '",
+                       date_to.strftime("%Y-%m-%d"),
+                       "' GROUP BY service_date;"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return dict((row[0], (int(row[1]), int(row[2]), row[3]))
+                            for row in con.execute(sql))
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+    #######################################################
+
+    # Return the latest service date (as datetime.date) with data, None if
+    # there is none or an error occurs. With the service_date index (see
+    # src/migrations), this reads a single index entry.
+    def get_latest_day(self):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT MAX(service_date) FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return con.execute(sql).first()[0]
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+    #######################################################
 
-        return self._query_table(sql)
+    # The reference position of every location_id with at least min_rows
+    # rows between date_from and date_to: the median of their x_coordinates
+    # and y_coordinates, so a few bad GPS fixes don't move it. Returns a
+    # DataFrame of the columns of Location_References, or None if an error
+    # occurs.
+    def query_location_references(self, date_from, date_to, min_rows=5):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT location_id,",
+                       " percentile_cont(0.5) WITHIN GROUP (ORDER BY x_coordinate),",
+                       " percentile_cont(0.5) WITHIN GROUP (ORDER BY y_coordinate),",
+                       " COUNT(*) FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " WHERE service_date BETWEEN '",
+                       date_from.strftime("%Y-%m-%d"),
+                       "' AND '",
+                       date_to.strftime("%Y-%m-%d"),
+                       "' AND location_id IS NOT NULL",
+                       " AND x_coordinate IS NOT NULL AND y_coordinate IS NOT NULL",
+                       " GROUP BY location_id HAVING COUNT(*) >= ",
+                       str(int(min_rows)),
+                       ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return pandas.DataFrame(
+                    con.execute(sql).fetchall(),
+                    columns=["location_id", "x_coordinate", "y_coordinate", "observations"])
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
 
     ###########################################################################
     # Private Methods
 
+    def _date_range_sql(self, date_from, date_to, order_by=None):
+        return "".join(["SELECT * FROM ",
+                        self._schema,
+                        ".",
+                        self._table_name,
+                        " WHERE service_date BETWEEN '",
+                        date_from.strftime("%Y-%m-%d"),
+                        "' AND '",
+                        date_to.strftime("%Y-%m-%d"),
+                        "'",
+                        " ORDER BY " + order_by if order_by else "",
+                        ";"])
+
+    #######################################################
+
     def _create_table_helper(self, sample_data, exists_action="append"):
         try:
-            conn = self._engine.connect()
             self._ios.log_and_print("Initializing table.")
             if not super().create_table():
                 self._ios.log_and_print(
@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+
+""" Engine_Registry
+Every Table shares one pooled Engine per connection URL, rather than each
+instance building its own. The pool options are set once by configure(),
+which should be called before the tables are built; engines that already
+exist keep the options they were created with.
+For more, see docs/db_ops.md
+"""
+class Engine_Registry():
+
+    def __init__(self):
+        self._engines = {}
+        self._pool_options = {
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+        }
+
+    #######################################################
+
+    # Any option left as None keeps its current value.
+    def configure(self, pool_size=None, max_overflow=None, pool_pre_ping=None, pool_recycle=None):
+        options = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_pre_ping": pool_pre_ping,
+            "pool_recycle": pool_recycle,
+        }
+        for name, value in options.items():
+            if value is not None:
+                self._pool_options[name] = value
+
+    #######################################################
+
+    # url can be a str or a sqlalchemy URL.
+    def get_engine(self, url):
+        key = self._url_key(url)
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = create_engine(url, **self._pool_options)
+            self._engines[key] = engine
+        return engine
+
+    #######################################################
+
+    # Close every pooled connection and forget the engines.
+    def dispose_all(self):
+        for engine in self._engines.values():
+            engine.dispose()
+        self._engines = {}
+
+    #######################################################
+
+    def _url_key(self, url):
+        url = make_url(url)
+        if hasattr(url, "render_as_string"):
+            return url.render_as_string(hide_password=False)
+        return url.__to_string__(hide_password=False)
+
+
+engines = Engine_Registry()
@@ -0,0 +1,170 @@
+import pandas
+import psycopg2
+
+from .table import Table, _CSV_Stream
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+class Fingerprints(Table):
+    # Persistent index of the fingerprints of every processed ctran_data row
+    # (see Duplicate.fingerprint), so that duplicates can be found across
+    # separate runs without reading the earlier rows again. Fingerprints are
+    # unsigned 64 bit hashes, stored bit for bit as signed BIGINTs.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "row_fingerprints"
+        self._index_col = None
+        self._expected_cols = [
+            "fingerprint",
+            "row_id",
+            "service_date",
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                fingerprint BIGINT NOT NULL,
+                row_id BIGINT NOT NULL,
+                service_date DATE,
+                PRIMARY KEY (fingerprint, row_id)
+            );"""])
+
+
+    def frame(self, fingerprints, service_dates):
+        # fingerprints is a uint64 pandas.Series indexed by row_id, and
+        # service_dates the matching Series of dates. Returns them as the rows
+        # of the index, which match, merge and merge_statement take.
+        return pandas.DataFrame({
+            "fingerprint": fingerprints.values.view("int64"),
+            "row_id": fingerprints.index,
+            "service_date": pandas.to_datetime(service_dates).dt.date.values,
+        }, columns=self._expected_cols)
+
+
+    def match(self, df):
+        # Looks the rows of df (see frame) up in the index, without adding
+        # them; merge_statement does, with the flags of their chunk. This
+        # returns a DataFrame of the indexed rows sharing a fingerprint with
+        # one of the given rows, under another row_id, with the columns
+        # row_id, service_date and match_row_id (the given row); or None if
+        # an error occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        target = "".join([self._schema, ".", self._table_name])
+        match_sql = "".join([
+            "SELECT i.row_id, i.service_date, s.row_id FROM ", target, " AS i",
+            " JOIN ", self._staging_name(), " AS s ON i.fingerprint = s.fingerprint",
+            " WHERE i.row_id <> s.row_id;"])
+
+        self._ios.log_and_print("".join([
+            "Matching ", str(len(df.index)), " fingerprints against: ", target]))
+
+        con = None
+        try:
+            con = self._engine.raw_connection()
+            cursor = con.cursor()
+            self._stage(cursor, df)
+            self._ios.log_and_print(match_sql)
+            cursor.execute(match_sql)
+            matches = pandas.DataFrame(
+                cursor.fetchall(), columns=["row_id", "service_date", "match_row_id"])
+            con.commit()
+        except (SQLAlchemyError, psycopg2.Error) as error:
+            if con is not None:
+                con.rollback()
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return None
+        finally:
+            if con is not None:
+                con.close()
+
+        return matches
+
+
+    def merge_statement(self, df):
+        # Returns a function of a DB-API cursor adding the rows of df (see
+        # frame) to the index, for the after_sql of the write of their flags
+        # (see Table._copy_table), so that rows are only indexed once their
+        # flags are committed.
+        def merge(cursor):
+            self._stage(cursor, df)
+            sql = self._merge_sql()
+            self._ios.log_and_print(sql)
+            cursor.execute(sql)
+        return merge
+
+
+    def merge(self, df):
+        # merge_statement on its own, for chunks without flags to write.
+        # Returns a bool.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        con = None
+        try:
+            con = self._engine.raw_connection()
+            self.merge_statement(df)(con.cursor())
+            con.commit()
+        except (SQLAlchemyError, psycopg2.Error) as error:
+            if con is not None:
+                con.rollback()
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return False
+        finally:
+            if con is not None:
+                con.close()
+
+        return True
+
+
+    def delete_date_range(self, start_date, end_date):
+        # Forget the fingerprints of the rows between start_date and end_date,
+        # inclusive (datetime.date instances).
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        sql = "".join([
+            "DELETE FROM ", self._schema, ".", self._table_name,
+            " WHERE service_date BETWEEN ", start_date.strftime("'%Y-%m-%d'"),
+            " AND ", end_date.strftime("'%Y-%m-%d'"), ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+
+    def _staging_name(self):
+        return "".join(["staging_", self._table_name])
+
+    # Copy the rows of df into a temporary staging table, dropped when the
+    # transaction of cursor ends.
+    def _stage(self, cursor, df):
+        target = "".join([self._schema, ".", self._table_name])
+        create_sql = "".join(["CREATE TEMP TABLE ", self._staging_name(), " (LIKE ", target,
+                              ") ON COMMIT DROP;"])
+        copy_sql = "".join(["COPY ", self._staging_name(), " (", ", ".join(self._expected_cols), ")",
+                            " FROM STDIN WITH (FORMAT csv);"])
+        self._ios.log_and_print(create_sql)
+        cursor.execute(create_sql)
+        self._ios.log_and_print(copy_sql)
+        cursor.copy_expert(copy_sql, _CSV_Stream(df, self._copy_chunksize))
+
+    def _merge_sql(self):
+        columns = ", ".join(self._expected_cols)
+        return "".join(["INSERT INTO ", self._schema, ".", self._table_name, " (", columns, ")",
+                        " SELECT ", columns, " FROM ", self._staging_name(),
+                        " ON CONFLICT (fingerprint, row_id) DO NOTHING;"])
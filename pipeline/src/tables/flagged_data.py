@@ -1,4 +1,8 @@
 import datetime
+import os
+import shutil
+import uuid
+import numpy
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.exc import SQLAlchemyError
 import pandas
@@ -7,48 +11,283 @@ from .table import Table
 import flaggers.flagger as flagger
 
 
+""" Flagged_Data
+Flags can be stored in one of two formats, chosen by storage:
+
+- "rows": the flagged_data table holds one row per (row_id, service_key,
+  flag_id).
+- "bitmask": the flagged_bitmask table holds one row per (row_id,
+  service_key), with a BIGINT whose bit (flag_id - 1) is set for every flag
+  of the row. flagged_data is then a view expanding it back into the rows
+  format, so everything reading flagged_data keeps working.
+
+Both formats take and write the same [row_id, service_key, flag_id,
+service_date] rows. The schema of an existing Hive must match the storage
+it is used with.
+For more, see docs/db_ops.md
+"""
 class Flagged_Data(Table):
 
-    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None, storage="rows", partitioning=None):
         super().__init__(user, passwd, hostname, db_name, schema, engine)
-        self._table_name = "flagged_data"
         self._index_col = None
-        self._expected_cols = [
+        self._storage = storage or "rows"
+        # None, "month" or "day"; see create_partitions.
+        self._partitioning = partitioning
+        # Service dates written to by the current parquet run; see
+        # write_parquet.
+        self._parquet_dates = set()
+        # Name of the relation in the rows format, which is read from.
+        self._rows_name = "flagged_data"
+        self._long_cols = [
             "row_id",
             "service_key",
             "flag_id",
             "service_date"
         ]
-        # flag_id is ON UPDATE CASCADE to anticipate flags table changing.
-        # service_key shouldn't change.
-        self._creation_sql = "".join(["""
-            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
-            (
+
+        if self._storage == "bitmask":
+            self._table_name = "flagged_bitmask"
+            self._expected_cols = [
+                "row_id",
+                "service_key",
+                "flags",
+                "service_date"
+            ]
+            self._conflict_cols = ["service_key", "row_id"]
+            columns = "".join(["""
+                row_id BIGINT,
+                service_key INTEGER REFERENCES """, self._schema, """.service_periods(service_key),
+                flags BIGINT NOT NULL,
+                service_date DATE NOT NULL,"""])
+            self._view_sql = "".join(["""
+            CREATE OR REPLACE VIEW """, self._schema, ".", self._rows_name, """ AS
+            SELECT b.row_id, b.service_key, f.flag_id, b.service_date
+            FROM """, self._schema, ".", self._table_name, """ AS b
+            JOIN """, self._schema, """.flags AS f
+            ON b.flags & (1::BIGINT << (f.flag_id - 1)) <> 0;"""])
+        else:
+            self._table_name = self._rows_name
+            self._expected_cols = self._long_cols
+            self._conflict_cols = ["row_id", "flag_id", "service_key"]
+            # flag_id is ON UPDATE CASCADE to anticipate flags table changing.
+            # service_key shouldn't change.
+            columns = "".join(["""
                 row_id INTEGER,
                 service_key INTEGER REFERENCES """, self._schema, """.service_periods(service_key),
                 flag_id INTEGER REFERENCES """, self._schema, """.flags(flag_id) ON UPDATE CASCADE,
-                service_date DATE NOT NULL,
-                PRIMARY KEY (flag_id, service_key, row_id)
-            );"""])
+                service_date DATE NOT NULL,"""])
+
+        # The primary key of a partitioned table must hold the partition key.
+        partition_sql = ""
+        if self._partitioning:
+            self._conflict_cols = self._conflict_cols + ["service_date"]
+            partition_sql = " PARTITION BY RANGE (service_date)"
+
+        primary_key = ["flag_id", "service_key", "row_id"]
+        if self._storage == "bitmask":
+            primary_key = ["service_key", "row_id"]
+        if self._partitioning:
+            primary_key.append("service_date")
+
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (""", columns, """
+                PRIMARY KEY (""", ", ".join(primary_key), """)
+            )""", partition_sql, ";"])
+
+    #######################################################
+
+    def create_table(self):
+        if self._storage != "bitmask":
+            return super().create_table()
+
+        # Bit (flag_id - 1) of a signed BIGINT holds the flag.
+        if max(flag.value for flag in flagger.Flags) > 63:
+            self._ios.log_and_print(
+                "There are too many flags for the bitmask storage.",
+                self._ios.Severity.ERROR)
+            return False
+
+        if not super().create_table():
+            return False
+
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(self._view_sql)
+                con.execute(self._view_sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+    #######################################################
+
+    # In the bitmask storage, the flagged_data view depends on the table, so
+    # it is dropped first.
+    def delete_table(self):
+        if self._storage != "bitmask":
+            return super().delete_table()
+
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("self._engine is not an Engine, cannot continue.", self._ios.Severity.ERROR)
+            return False
+
+        sql = "".join(["DROP VIEW IF EXISTS ", self._schema, ".", self._rows_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return super().delete_table()
 
     #######################################################
 
-    def write_table(self, data):
-        # data is list of [row_id, flag_id, service_key].
+    # Returns the statement writing the result of select_sql, whose columns
+    # are row_id, service_key, flag_id and service_date, into the table.
+    def insert_select_sql(self, select_sql):
+        target = "".join([self._schema, ".", self._table_name])
+        if self._storage != "bitmask":
+            return "".join([
+                "INSERT INTO ", target, " (row_id, service_key, flag_id, service_date) ",
+                select_sql,
+                " ON CONFLICT (", ", ".join(self._conflict_cols), ") DO NOTHING;"])
+
+        return "".join([
+            "INSERT INTO ", target, " (row_id, service_key, flags, service_date)",
+            " SELECT row_id, service_key, bit_or(1::BIGINT << (flag_id - 1)), service_date",
+            " FROM (", select_sql, ") AS l",
+            " GROUP BY row_id, service_key, service_date",
+            " ON CONFLICT (", ", ".join(self._conflict_cols), ") DO UPDATE SET ",
+            self._merge_flags_sql(), ";"])
+
+    #######################################################
+
+    def write_table(self, data, use_copy=True, after_sql=None):
+        # data is list of [row_id, service_key, flag_id, service_date].
+        # use_copy selects the COPY bulk loader; set it to False to fall back
+        # to a single INSERT statement.
+        # after_sql is run in the transaction of the write; see
+        # Table._write_table.
         if data == []:
             self._ios.log_and_print(
                 "write_table recieved no data to write, cancelling.",
                 self._ios.Severity.ERROR)
             return False
             
-        df = pandas.DataFrame(data, columns=[
-            "row_id",
-            "service_key",
-            "flag_id",
-            "service_date",
-            ])
-        return self._write_table(df, 
-                 conflict_columns=["row_id", "flag_id", "service_key"])
+        df = pandas.DataFrame(data, columns=self._long_cols)
+        if not self.create_partitions(df["service_date"]):
+            return False
+        if self._storage == "bitmask":
+            return self._write_bitmasks(df, use_copy, after_sql)
+
+        if use_copy:
+            return self._copy_table(df, conflict_columns=self._conflict_cols, after_sql=after_sql)
+        return self._write_table(df, conflict_columns=self._conflict_cols, after_sql=after_sql)
+
+    #######################################################
+
+    # Fold the rows of df into one bitmask per (row_id, service_key), merged
+    # into the flags already stored for the row.
+    def _write_bitmasks(self, df, use_copy, after_sql=None):
+        df = df.drop_duplicates()
+        df["flags"] = numpy.left_shift(1, df["flag_id"].astype("int64") - 1)
+        # Flags are distinct within a group, so their sum is their OR.
+        df = df.groupby(["row_id", "service_key", "service_date"], sort=False)["flags"] \
+               .sum().reset_index()[self._expected_cols]
+
+        if use_copy:
+            return self._copy_table(df, self._conflict_cols, self._merge_flags_sql(), after_sql)
+        return self._write_table(df, self._conflict_cols, self._merge_flags_sql(), after_sql)
+
+    def _merge_flags_sql(self):
+        return "".join(["flags = ", self._table_name, ".flags | EXCLUDED.flags"])
+
+    #######################################################
+
+    # With partitioning set to "month" or "day", the table is partitioned by
+    # range of service_date, one partition per month or day, named
+    # <table>_pYYYYMM or <table>_pYYYYMMDD. Partitions are created on demand:
+    # this creates the partitions for dates (anything pandas.to_datetime
+    # takes) that do not exist. Other processes may drop partitions (see
+    # delete_date_range), so none are assumed to exist; the statements are
+    # idempotent, and one per partition a write touches. Returns a bool.
+    def create_partitions(self, dates):
+        if not self._partitioning:
+            return True
+
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        dates = pandas.to_datetime(pandas.Series(list(dates)), errors="coerce").dropna()
+        partitions = set(self._partition_bounds(date) for date in dates.dt.date.unique())
+        if not partitions:
+            return True
+
+        try:
+            with self._engine.connect() as con:
+                for name, start_date, end_date in sorted(partitions):
+                    sql = "".join([
+                        "CREATE TABLE IF NOT EXISTS ", self._schema, ".", name,
+                        " PARTITION OF ", self._schema, ".", self._table_name,
+                        " FOR VALUES FROM (", start_date.strftime("'%Y-%m-%d'"),
+                        ") TO (", end_date.strftime("'%Y-%m-%d'"), ");"])
+                    self._ios.log_and_print(sql)
+                    con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+    # Returns the (name, start_date, end_date) of the partition holding the
+    # datetime.date date; end_date is exclusive.
+    def _partition_bounds(self, date):
+        if self._partitioning == "day":
+            start_date = date
+            end_date = date + datetime.timedelta(days=1)
+            suffix = start_date.strftime("%Y%m%d")
+        else:
+            start_date = date.replace(day=1)
+            end_date = (start_date + datetime.timedelta(days=32)).replace(day=1)
+            suffix = start_date.strftime("%Y%m")
+        return "".join([self._table_name, "_p", suffix]), start_date, end_date
+
+    # Returns the (name, start_date, end_date) of the existing partitions,
+    # oldest first, read from the catalog through the connection con.
+    def _list_partitions(self, con):
+        sql = "".join([
+            "SELECT c.relname FROM pg_inherits AS i",
+            " JOIN pg_class AS c ON c.oid = i.inhrelid",
+            " WHERE i.inhparent = '", self._schema, ".", self._table_name, "'::regclass;"])
+        self._ios.log_and_print(sql)
+
+        prefix = "".join([self._table_name, "_p"])
+        partitions = []
+        for row in con.execute(sql):
+            suffix = row[0][len(prefix):]
+            if not row[0].startswith(prefix) or len(suffix) not in (6, 8):
+                continue
+            try:
+                if len(suffix) == 8:
+                    date = datetime.datetime.strptime(suffix, "%Y%m%d").date()
+                    end_date = date + datetime.timedelta(days=1)
+                else:
+                    date = datetime.datetime.strptime(suffix, "%Y%m").date()
+                    end_date = (date + datetime.timedelta(days=32)).replace(day=1)
+            except ValueError:
+                continue
+            partitions.append((row[0], date, end_date))
+
+        return sorted(partitions, key=lambda partition: partition[1])
 
     #######################################################
 
@@ -69,15 +308,15 @@ class Flagged_Data(Table):
             self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
             return None
 
-        sql = "".join(["SELECT * FROM ",
+        sql = "".join(["SELECT fd.* FROM ",
                        self._schema,
                        ".",
-                       self._table_name,
+                       self._rows_name,
                        " AS fd, ",
                        self._schema,
                        ".",
                        sp_table,
-                       " AS sp, WHERE fd.row_id = '",
+                       " AS sp WHERE fd.row_id = '",
                        row_id,
                        "' AND sp.year = '",
                        service_year,
@@ -86,7 +325,8 @@ class Flagged_Data(Table):
                        "' AND fd.service_key = sp.service_key"
                        ";"])
 
-        return self._query_table(sql)
+        # In the bitmask storage, the view has the rows format's columns.
+        return self._query_table(sql, self._long_cols)
 
     #######################################################
 
@@ -98,14 +338,14 @@ class Flagged_Data(Table):
         sql = "".join(["SELECT * FROM ",
                        self._schema,
                        ".",
-                       self._table_name,
+                       self._rows_name,
                        " WHERE flag_id = '",
                        str(flag_id),
                        "' LIMIT '",
                        str(limit),
                        "';"])
 
-        return self._query_table(sql)
+        return self._query_table(sql, self._long_cols)
 
     #######################################################
 
@@ -115,29 +355,52 @@ class Flagged_Data(Table):
             self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
             return None
 
+        if self._partitioning:
+            return self._get_latest_partitioned_day()
+
         value = None
         sql = "".join(["SELECT MAX(service_date) ",
                        "FROM ", self._schema, ".", self._table_name,
                        ";"])
         try:
             self._ios.log_and_print(sql)
-            conn = self._engine.connect()
-            value = conn.execute(sql)
+            with self._engine.connect() as conn:
+                value = conn.execute(sql)
+                if value is not None:
+                    value = value.first()[0]
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
             return None
-        
-        if value is not None:
-            return value.first()[0]
-        else:
+
+        return value
+
+    # Rather than scanning the whole table, look for the latest day in the
+    # partitions, newest first, which usually only reads the last one.
+    def _get_latest_partitioned_day(self):
+        try:
+            with self._engine.connect() as conn:
+                for name, start_date, end_date in reversed(self._list_partitions(conn)):
+                    sql = "".join(["SELECT MAX(service_date) FROM ",
+                                   self._schema, ".", name, ";"])
+                    self._ios.log_and_print(sql)
+                    value = conn.execute(sql).first()[0]
+                    if value is not None:
+                        return value
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
             return None
 
+        return None
+
     #######################################################
 
     # start_date and end_date can be string dates in YYYY/MM/DD, datetimes, or
     # None. If end_date is none, the start_date will be used for that value. If
     # dates are backwards, they will be flipped.
+    # On a partitioned table, the partitions entirely within the range are
+    # dropped, and rows are only deleted from the partitions it overlaps.
     def delete_date_range(self, start_date, end_date=None):
         if not isinstance(self._engine, Engine):
             self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
@@ -149,6 +412,9 @@ class Flagged_Data(Table):
                 "Could not determine the date(s).", self._ios.Severity.ERROR)
             return False
 
+        if self._partitioning:
+            return self._delete_partitioned_range(start_date, end_date)
+
         sql = "".join(["DELETE FROM ", self._schema, ".", self._table_name,
                        " WHERE service_date BETWEEN ", 
                        start_date.strftime("'%Y-%m-%d'"), " AND ", 
@@ -156,8 +422,38 @@ class Flagged_Data(Table):
         self._ios._print(sql)
         try:
             self._ios.log_and_print(sql)
-            conn = self._engine.connect()
-            conn.execute(sql)
+            with self._engine.connect() as conn:
+                conn.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+    def _delete_partitioned_range(self, start_date, end_date):
+        if isinstance(start_date, datetime.datetime):
+            start_date = start_date.date()
+        if isinstance(end_date, datetime.datetime):
+            end_date = end_date.date()
+
+        try:
+            with self._engine.connect() as conn:
+                with conn.begin():
+                    for name, p_start, p_end in self._list_partitions(conn):
+                        if p_end <= start_date or p_start > end_date:
+                            continue
+
+                        if start_date <= p_start and p_end - datetime.timedelta(days=1) <= end_date:
+                            # Dropping a partition detaches it from the table.
+                            sql = "".join(["DROP TABLE ", self._schema, ".", name, ";"])
+                        else:
+                            sql = "".join(["DELETE FROM ", self._schema, ".", name,
+                                           " WHERE service_date BETWEEN ",
+                                           start_date.strftime("'%Y-%m-%d'"), " AND ",
+                                           end_date.strftime("'%Y-%m-%d'"), ";"])
+                        self._ios.log_and_print(sql)
+                        conn.execute(sql)
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
@@ -167,9 +463,9 @@ class Flagged_Data(Table):
 
     #######################################################
 
-    # start_date and end_date can be string dates in YYYY/MM/DD, datetimes, or
-    # None. If end_date is none, the start_date will be used for that value. If
-    # dates are backwards, they will be flipped.
+    # start_date and end_date can be string dates in YYYY/MM/DD, dates,
+    # datetimes, or None. If end_date is none, the start_date will be used for
+    # that value. If dates are backwards, they will be flipped.
     # On success, this returns: start_date, end_date as datetimes; on failure,
     # this returns None, None.
     def _process_dates(self, start_date, end_date=None):
@@ -177,8 +473,10 @@ class Flagged_Data(Table):
             try:
                 if isinstance(string, str):
                     string = datetime.datetime.strptime(string, "%Y/%m/%d")
-                elif not isinstance(string, datetime.datetime) or not isinstance(string, datetime.date):
+                elif not isinstance(string, datetime.datetime) and not isinstance(string, datetime.date):
                     raise ValueError
+                elif not isinstance(string, datetime.datetime):
+                    string = datetime.datetime.combine(string, datetime.time())
             except ValueError:
                 return None
             return string
@@ -191,6 +489,8 @@ class Flagged_Data(Table):
             end_date = start_date
         else:
             end_date = _convert_to_date(end_date, "end  ")
+            if end_date is None:
+                return None, None
 
         if start_date < end_date:
             return start_date, end_date
@@ -203,7 +503,7 @@ class Flagged_Data(Table):
         view_name = "view_" + flagger.flag_descriptions[flag].desc
         sql = "".join([
             "CREATE VIEW ", self._schema, ".", view_name, " AS\n",
-            "SELECT * FROM ", self._schema, ".", self._table_name,
+            "SELECT * FROM ", self._schema, ".", self._rows_name,
             " WHERE flag_id=", str(flag.value), ";"
         ])
 
@@ -226,23 +526,89 @@ class Flagged_Data(Table):
                 status = False
         return status
 
-    def write_csv(self, path, data):
+    def write_csv(self, path, data, append=False):
         """
         Function that saves flagged data to csv: actual saving is done by parent class (Table)
 
         Args: 
             path    (String): relative path to where csv will be saved. 
             data    (Array) : list of flagged rows (flagged data)
+            append  (Boolean): append the rows to the existing csv, without a header row
 
         Returns: 
             Boolean representing state of the operation (successfull write: True, error during process: False)
         """
 
         #Append expected cols to beginning of the list to create header row in the csv
-        data.insert(0, self._expected_cols)
+        if not append:
+            data.insert(0, self._long_cols)
 
         #Create dataframe that will be saved to csv
         df = pandas.DataFrame(data)
 
         #Call parent function that does actual saving
-        return super().write_csv(df, path)
+        return super().write_csv(df, path, append)
+
+    #######################################################
+
+    def write_parquet(self, path, data, append=False, compression="zstd"):
+        """
+        Saves flagged data as parquet files partitioned by service date:
+        path/flagged_data/service_date=YYYY-MM-DD/part-<id>.parquet. Each write
+        adds a file to the partitions of its rows, and the first write of a run
+        to a partition replaces the files it had, so rerunning a day doesn't
+        duplicate its rows. flag_id and service_key are dictionary encoded.
+
+        Args: 
+            path        (String): relative path to the output directory.
+            data        (Array) : list of flagged rows (flagged data)
+            append      (Boolean): continue the current run, rather than start a new one.
+            compression (String): parquet compression codec, e.g. "zstd" or "snappy".
+
+        Returns: 
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            self._ios.log_and_print(
+                "The parquet output needs pyarrow: pip install pyarrow",
+                self._ios.Severity.ERROR)
+            return False
+
+        if not append:
+            self._parquet_dates = set()
+        if not data:
+            return True
+
+        df = pandas.DataFrame(data, columns=self._long_cols)
+        dates = pandas.to_datetime(df["service_date"], format="%Y/%m/%d").dt.date
+        root = os.path.join(path, self._rows_name)
+        try:
+            for date, day in df.groupby(dates.values, sort=True):
+                directory = os.path.join(root, "service_date=" + date.isoformat())
+                if date not in self._parquet_dates:
+                    if os.path.isdir(directory):
+                        shutil.rmtree(directory)
+                    self._parquet_dates.add(date)
+                os.makedirs(directory, exist_ok=True)
+
+                table = pyarrow.table({
+                    "row_id": pyarrow.array(day["row_id"].values, pyarrow.int64()),
+                    "service_key": pyarrow.array(day["service_key"].values, pyarrow.int32()),
+                    "flag_id": pyarrow.array(day["flag_id"].values, pyarrow.int16()),
+                })
+                # row_id is unique, so a dictionary would only grow it.
+                filename = "".join(["part-", uuid.uuid4().hex, ".parquet"])
+                pyarrow.parquet.write_table(
+                    table, os.path.join(directory, filename), compression=compression,
+                    use_dictionary=["service_key", "flag_id"])
+        except (OSError, pyarrow.ArrowException) as error:
+            self._ios.log_and_print(
+                "".join(["write_parquet couldn't save data to ", root, ": ", str(error)]),
+                self._ios.Severity.ERROR)
+            return False
+
+        return True
@@ -27,9 +27,13 @@ class Flags(Table):
             );"""])
 
 
-    def write_table(self, flags):
-        # flags is a list of [flag_id, flag_name]
+    def write_table(self, flags, use_copy=True):
+        # flags is a list of [flag_id, description, name]
+        # use_copy selects the COPY bulk loader; set it to False to fall back
+        # to a single INSERT statement.
         df = pandas.DataFrame(flags, columns=self._expected_cols)
+        if use_copy:
+            return self._copy_table(df, conflict_columns=["flag_id"])
         return self._write_table(df, conflict_columns=["flag_id"])
 
 
@@ -73,3 +77,13 @@ class Flags(Table):
         return super().write_csv(df, path)
 
 
+    def write_parquet(self, path, compression="zstd"):
+        # Saves every flag as path/flags.parquet, for looking up the flag_id
+        # of the parquet flagged_data.
+        flags = []
+        for flag in flagger.Flags:
+            fd = flagger.flag_descriptions[flag]
+            flags.append([flag.value, fd.desc, fd.name])
+
+        df = pandas.DataFrame(flags, columns=self._expected_cols)
+        return super().write_parquet(df, path, compression)
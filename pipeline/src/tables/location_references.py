@@ -0,0 +1,59 @@
+import pandas
+
+from .table import Table
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+class Location_References(Table):
+    # The reference position of every stop location: the median
+    # x_coordinate and y_coordinate of its ctran_data rows over a span of
+    # service dates, and how many rows that was. Built with
+    # CTran_Data.query_location_references, and read by src.spatial.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "location_references"
+        self._index_col = None
+        self._expected_cols = [
+            "location_id",
+            "x_coordinate",
+            "y_coordinate",
+            "observations",
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                location_id INTEGER PRIMARY KEY,
+                x_coordinate FLOAT NOT NULL,
+                y_coordinate FLOAT NOT NULL,
+                observations INTEGER NOT NULL
+            );"""])
+
+
+    def write_table(self, references):
+        # references is a DataFrame of the expected columns. Locations
+        # already in the table get their new reference; the others are kept.
+        update = ", ".join(["".join([col, " = EXCLUDED.", col])
+                            for col in self._expected_cols[1:]])
+        return self._copy_table(references, ["location_id"], update)
+
+
+    def query_references(self):
+        # Returns every reference as a DataFrame of the expected columns, or
+        # None if an error occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT ", ", ".join(self._expected_cols),
+                       " FROM ", self._schema, ".", self._table_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return pandas.DataFrame(
+                    con.execute(sql).fetchall(), columns=self._expected_cols)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return None
@@ -0,0 +1,152 @@
+import pandas
+
+from .table import Table
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+class Reference_Stats(Table):
+    # The statistics of the dwell, ons, offs and estimated_load of every
+    # location_id and route_number (see src.baselines): the number of rows,
+    # their mean, m2 (the sum of their squared deviations from the mean), a
+    # histogram sketch of their values and the latest service_date counted.
+    # New statistics are merged into the stored ones by the database, so
+    # only the rows of the latest range are ever sent. The service dates
+    # counted are kept in reference_stats_days, so that no day is counted
+    # twice, whatever order the days are processed in.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "reference_stats"
+        self._index_col = None
+        self._expected_cols = [
+            "key_type",
+            "key_value",
+            "metric",
+            "observations",
+            "mean",
+            "m2",
+            "sketch",
+            "last_date",
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                key_type VARCHAR(16) NOT NULL,
+                key_value INTEGER NOT NULL,
+                metric VARCHAR(16) NOT NULL,
+                observations BIGINT NOT NULL,
+                mean FLOAT NOT NULL,
+                m2 FLOAT NOT NULL,
+                sketch BIGINT[] NOT NULL,
+                last_date DATE NOT NULL,
+                PRIMARY KEY (key_type, key_value, metric)
+            );"""])
+        self._days_name = "reference_stats_days"
+        self._days_creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._days_name, """
+            (
+                service_date DATE PRIMARY KEY
+            );"""])
+        self._creation_sql += self._days_creation_sql
+
+
+    def delete_table(self):
+        # Drops the days counted with the statistics.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        sql = "".join(["DROP TABLE IF EXISTS ", self._schema, ".", self._days_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return super().delete_table()
+
+
+    def write_table(self, stats, days=()):
+        # stats is a DataFrame of the expected columns, e.g. from
+        # Baselines.summarize, whose sketches are sequences of counts. Stats
+        # of a key already in the table are merged into its row.
+        # days are the service dates stats count, recorded in the same
+        # transaction.
+        df = stats.copy()
+        df["sketch"] = ["".join(["{", ",".join(str(int(count)) for count in sketch), "}"])
+                        for sketch in stats["sketch"]]
+        df["last_date"] = pandas.to_datetime(stats["last_date"]).dt.date
+        after_sql = None
+        if len(days):
+            after_sql = [self.days_sql(days)]
+        return self._copy_table(
+            df, ["key_type", "key_value", "metric"], self.merge_sql(), after_sql)
+
+
+    def days_sql(self, days):
+        # Returns the statement recording days (dates) as counted.
+        values = ", ".join([
+            "".join(["('", pandas.Timestamp(day).strftime("%Y-%m-%d"), "')"]) for day in days])
+        return "".join([
+            "INSERT INTO ", self._schema, ".", self._days_name, " (service_date)",
+            " VALUES ", values, " ON CONFLICT (service_date) DO NOTHING;"])
+
+
+    def merge_sql(self):
+        # The SET clause merging EXCLUDED, the new stats, into the stored
+        # ones; every expression sees the stored row as it was.
+        stored = "".join([self._schema, ".", self._table_name, "."])
+        total = "".join(["(", stored, "observations + EXCLUDED.observations)"])
+        delta = "".join(["(EXCLUDED.mean - ", stored, "mean)"])
+        return "".join([
+            "observations = ", total,
+            ", mean = ", stored, "mean + ", delta,
+            " * EXCLUDED.observations::float8 / ", total,
+            ", m2 = ", stored, "m2 + EXCLUDED.m2 + ", delta, " * ", delta,
+            " * ", stored, "observations::float8 * EXCLUDED.observations / ", total,
+            ", sketch = ARRAY(SELECT COALESCE(a, 0) + COALESCE(b, 0) FROM unnest(",
+            stored, "sketch, EXCLUDED.sketch) AS s(a, b))",
+            ", last_date = GREATEST(", stored, "last_date, EXCLUDED.last_date)"])
+
+
+    def query_stats(self):
+        # Returns every row as a DataFrame of the expected columns, with the
+        # sketches as lists, or None if an error occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT ", ", ".join(self._expected_cols),
+                       " FROM ", self._schema, ".", self._table_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return pandas.DataFrame(
+                    con.execute(sql).fetchall(), columns=self._expected_cols)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return None
+
+
+    def query_days(self):
+        # Returns the list of the service dates counted, or None if an error
+        # occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT service_date FROM ", self._schema, ".", self._days_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return [row[0] for row in con.execute(sql)]
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                self._ios.Severity.ERROR)
+            return None
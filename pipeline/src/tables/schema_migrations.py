@@ -0,0 +1,52 @@
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine.base import Engine
+
+from .table import Table
+
+class Schema_Migrations(Table):
+    # Record of the migrations (see src/migrations) applied to one schema:
+    # one row per applied version.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "schema_migrations"
+        self._index_col = None
+        self._expected_cols = [
+            "version",
+            "description",
+            "applied_at",
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            );"""])
+
+
+    def query_versions(self):
+        # Returns the set of applied versions, or None if an error occurs.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        sql = "".join(["SELECT version FROM ", self._schema, ".", self._table_name, ";"])
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(sql)
+                return set(row[0] for row in con.execute(sql))
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+
+    def record_sql(self, version, description):
+        # Returns the statement recording version as applied, to be run in the
+        # transaction applying it.
+        return "".join([
+            "INSERT INTO ", self._schema, ".", self._table_name,
+            " (version, description) VALUES (", str(int(version)), ", '",
+            description.replace("'", "''"), "')",
+            " ON CONFLICT (version) DO NOTHING;"])
@@ -7,6 +7,11 @@ from sqlalchemy.engine.base import Engine
 
 class Service_Periods(Table):
 
+    # Process-wide cache of resolved service keys, shared by every instance
+    # so it survives across days and clients. It is keyed by
+    # (engine url, schema), then by datetime.date.
+    _service_key_cache = {}
+
     def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
         super().__init__(user, passwd, hostname, db_name, schema, engine)
         self._table_name = "service_periods"
@@ -100,6 +105,93 @@ class Service_Periods(Table):
             return period 
         
         return self.insert_one(date)
+
+
+    def resolve(self, dates):
+        # Bulk version of query_or_insert: dates is a pandas.Series of dates.
+        # Returns a pandas.Series of service_keys aligned with dates' index,
+        # NaN where a date is null or could not be resolved.
+        # Only unique dates that are not cached yet touch the database: one
+        # SELECT for the periods covering them, and one INSERT ... RETURNING
+        # for the periods that do not exist yet.
+        dates = pandas.to_datetime(dates, errors="coerce").dt.date
+        cache = self._get_cache()
+        missing = [date for date in dates.dropna().unique() if date not in cache]
+        if missing:
+            self._resolve_dates(missing, cache)
+
+        return dates.map(cache)
+
+
+    def clear_cache(self):
+        self._get_cache().clear()
+
+
+    def _get_cache(self):
+        key = (str(getattr(self._engine, "url", None)), self._schema)
+        return Service_Periods._service_key_cache.setdefault(key, {})
+
+
+    def _resolve_dates(self, dates, cache):
+        # Resolve the list of datetime.date dates into cache, inserting the
+        # missing service_periods rows.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        periods = {}
+        for date in dates:
+            start_date, end_date = self.get_service_period(date)
+            periods[date] = (start_date.date(), end_date.date())
+
+        select_sql = "".join([
+            "SELECT service_key, start_date, end_date FROM ",
+            self._schema, ".", self._table_name,
+            " WHERE start_date <= ", max(dates).strftime("'%Y-%m-%d'"),
+            " AND end_date >= ", min(dates).strftime("'%Y-%m-%d'"), ";"])
+
+        try:
+            with self._engine.connect() as con:
+                self._ios.log_and_print(select_sql)
+                self._match_periods(con.execute(select_sql), periods, cache)
+
+                to_insert = sorted(set(periods[date] for date in dates
+                                       if date not in cache))
+                if not to_insert:
+                    return True
+
+                values = ", ".join(["".join([
+                    "(", start_date.strftime("'%Y-%m-%d'"), ", ",
+                    end_date.strftime("'%Y-%m-%d'"), ")"])
+                    for start_date, end_date in to_insert])
+                insert_sql = "".join([
+                    "INSERT INTO ", self._schema, ".", self._table_name,
+                    " (start_date, end_date) VALUES ", values,
+                    " ON CONFLICT (start_date, end_date) DO NOTHING",
+                    " RETURNING service_key, start_date, end_date;"])
+                self._ios.log_and_print(insert_sql)
+                self._match_periods(con.execute(insert_sql), periods, cache)
+
+                # Periods inserted concurrently by someone else are not
+                # returned by ON CONFLICT DO NOTHING, so look them up again.
+                if any(date not in cache for date in dates):
+                    self._match_periods(con.execute(select_sql), periods, cache)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+
+    def _match_periods(self, rows, periods, cache):
+        # rows are (service_key, start_date, end_date) results; store the
+        # service_key of every date in periods that falls within one of them.
+        for row in rows:
+            service_key, start_date, end_date = row[0], row[1], row[2]
+            for date in periods:
+                if date not in cache and start_date <= date <= end_date:
+                    cache[date] = service_key
         
 
     def get_service_period(self, date):
@@ -2,12 +2,15 @@ import abc
 import sys
 import getpass
 import pandas
-from sqlalchemy import create_engine
+import psycopg2
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.engine.base import Engine
 import os
+import time
 
 from ..ios import ios
+from ..metrics import metrics
+from .engine_registry import engines
 
 
 
@@ -26,6 +29,8 @@ class Table(abc.ABC):
         self._table_name = None
         self._index_col = None
         self._chunksize = 1000
+        self._copy_chunksize = 100000
+        self._dtypes = None
 
         if schema is None:
             self._schema = self._ios.prompt("Enter the table's schema: ")
@@ -33,7 +38,7 @@ class Table(abc.ABC):
             self._schema = schema
 
         if engine is not None:
-            self._engine = create_engine(engine)
+            self._engine = engines.get_engine(engine)
 
         else:
             if user is None:
@@ -87,9 +92,9 @@ class Table(abc.ABC):
 
         sql = "".join(["CREATE SCHEMA IF NOT EXISTS ", self._schema, ";"])
         try:
-            conn = self._engine.connect()
-            self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._engine.connect() as conn:
+                self._ios.log_and_print(sql)
+                conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -106,9 +111,9 @@ class Table(abc.ABC):
 
         sql = "".join(["DROP SCHEMA IF EXISTS ", self._schema, " CASCADE;"])
         try:
-            conn = self._engine.connect()
-            self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._engine.connect() as conn:
+                self._ios.log_and_print(sql)
+                conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -128,9 +133,9 @@ class Table(abc.ABC):
             return False
 
         try:
-            conn = self._engine.connect()
-            self._ios.log_and_print(self._creation_sql)
-            conn.execute(self._creation_sql)
+            with self._engine.connect() as conn:
+                self._ios.log_and_print(self._creation_sql)
+                conn.execute(self._creation_sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -148,9 +153,9 @@ class Table(abc.ABC):
 
         sql = "".join(["DROP TABLE IF EXISTS " + self._schema + "." + self._table_name + ";"])
         try:
-            conn = self._engine.connect()
-            self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._engine.connect() as conn:
+                self._ios.log_and_print(sql)
+                conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -161,22 +166,22 @@ class Table(abc.ABC):
     ###########################################################################
     # Protected Methods
 
-    def _write_table(self, df, conflict_columns=None):
+    def _write_table(self, df, conflict_columns=None, conflict_update=None, after_sql=None):
         # Write the given dataframe into the database.
         # This method is meant to be called by a subclass.
         # df should be a well formed DataFrame, the subclass should form
         # the DataFrame.
         # conflict_columns should be a list of str values used as primary keys.
         #   if conflict_columns is None, will not do ON CONFLICT.
-        #   ON CONFLICT is always set to DO NOTHING. This is to ensure there
+        #   ON CONFLICT is set to DO NOTHING. This is to ensure there
         #   are no errors when inserting a duplicate row.
-        #
-        # TODO: Add an update option to ON CONFLICT.
-        # Currently ON CONFLICT only exists to stop postgres from
-        # throwing a fit whenever there's a duplicate insert. Would be useful
-        # to have an option to overwrite the duplicate data instead.
-        # Will be very useful for updating the flags table without dropping
-        # the whole thing.
+        # conflict_update is an optional SQL SET clause (e.g.
+        #   "col = EXCLUDED.col"); when given, conflicting rows are updated
+        #   with ON CONFLICT ... DO UPDATE SET conflict_update instead.
+        # after_sql is an optional list of statements run after the insert,
+        #   in the same transaction (e.g. Checkpoints.write_sql). Besides SQL
+        #   strings, it may hold functions of a DB-API cursor, for work
+        #   beyond a statement (e.g. Fingerprints.merge_statement).
 
         if not self._table_name:
             self._ios.log_and_print(
@@ -206,33 +211,135 @@ class Table(abc.ABC):
         self._ios.log_and_print("".join([
             "Writing to: ", self._schema, ".", self._table_name]))
 
-        if conflict_columns:
-            conflict_columns = "({})".format(
-                               ", ".join([s for s in conflict_columns]))
-            sql += "".join([" ON CONFLICT ", conflict_columns, " DO NOTHING;"])
+        sql += self._conflict_sql(conflict_columns, conflict_update)
 
+        statements = [s for s in after_sql or [] if not callable(s)]
+        functions = [s for s in after_sql or [] if callable(s)]
         try:
-            con = self._engine.connect()
-            # This /doesn't/ log the SQL here as opposed to how it usually is
-            # because that would blow away the terminanl and make the file
-            # extremely hard to read and needlessly long.
-            con.execute(sql)
-        except SQLAlchemyError as error:
+            with self._engine.connect() as con:
+                # This /doesn't/ log the SQL here as opposed to how it usually is
+                # because that would blow away the terminanl and make the file
+                # extremely hard to read and needlessly long.
+                # PostgreSQL runs the statements of one query string in a
+                # single transaction.
+                for statement in statements:
+                    self._ios.log_and_print(statement)
+                with metrics.timer("pipeline_db_seconds",
+                                   table=self._table_name, operation="write"):
+                    if not functions:
+                        con.execute("".join([sql] + statements))
+                    else:
+                        with con.begin():
+                            con.execute("".join([sql] + statements))
+                            for function in functions:
+                                function(con.connection.cursor())
+        except (SQLAlchemyError, psycopg2.Error) as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                ios.Severity.ERROR)
+            return False
+
+        return True
+
+    #######################################################
+
+    def _copy_table(self, df, conflict_columns=None, conflict_update=None, after_sql=None):
+        # Bulk-load version of _write_table, with the same arguments and
+        # conflict_columns/conflict_update/after_sql semantics.
+        # Rather than formatting one INSERT statement holding every row, the
+        # rows are streamed as CSV through COPY FROM STDIN into a temporary
+        # staging table, which is then merged into the target table with
+        # INSERT ... SELECT. The staging table is dropped on commit.
+
+        if not self._table_name:
+            self._ios.log_and_print(
+                "_copy_table not called by a subclass.", ios.Severity.ERROR)
+            return False
+
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("invalid engine", ios.Severity.ERROR)
+            return False
+
+        if not self._check_cols(df):
+            self._ios.log_and_print(
+                "the columns of data does not match required columns",
+                ios.Severity.ERROR)
+            return False
+
+        columns = ", ".join(list(df))
+        target = "".join([self._schema, ".", self._table_name])
+        staging = "".join(["staging_", self._table_name])
+
+        create_sql = "".join(["CREATE TEMP TABLE ", staging, " (LIKE ", target,
+                              " INCLUDING DEFAULTS) ON COMMIT DROP;"])
+        copy_sql = "".join(["COPY ", staging, " (", columns, ")",
+                            " FROM STDIN WITH (FORMAT csv);"])
+        merge_sql = "".join(["INSERT INTO ", target, " (", columns, ")",
+                             " SELECT ", columns, " FROM ", staging,
+                             self._conflict_sql(conflict_columns, conflict_update)])
+
+        self._ios.log_and_print("".join([
+            "Bulk loading ", str(len(df.index)), " rows to: ", target]))
+
+        con = None
+        start = time.perf_counter()
+        try:
+            con = self._engine.raw_connection()
+            cursor = con.cursor()
+            self._ios.log_and_print(create_sql)
+            cursor.execute(create_sql)
+            self._ios.log_and_print(copy_sql)
+            cursor.copy_expert(copy_sql, _CSV_Stream(df, self._copy_chunksize))
+            self._ios.log_and_print(merge_sql)
+            cursor.execute(merge_sql)
+            for statement in after_sql or []:
+                if callable(statement):
+                    statement(cursor)
+                    continue
+                self._ios.log_and_print(statement)
+                cursor.execute(statement)
+            con.commit()
+            metrics.observe("pipeline_db_seconds", time.perf_counter() - start,
+                            table=self._table_name, operation="write")
+        except (SQLAlchemyError, psycopg2.Error) as error:
+            if con is not None:
+                con.rollback()
             self._ios.log_and_print(
                 "SQLAlchemyError: " + str(error).splitlines()[0],
                 ios.Severity.ERROR)
             return False
+        finally:
+            if con is not None:
+                con.close()
 
         return True
 
     #######################################################
 
-    def _check_cols(self, sample_df):
-        # Check the columns of input df to make sure it matches what we expect.
+    # The ON CONFLICT clause (and final semicolon) of _write_table and
+    # _copy_table's INSERT statements.
+    def _conflict_sql(self, conflict_columns, conflict_update=None):
+        if not conflict_columns:
+            return ";"
+
+        conflict_columns = "({})".format(
+                           ", ".join([s for s in conflict_columns]))
+        if conflict_update:
+            return "".join([" ON CONFLICT ", conflict_columns,
+                            " DO UPDATE SET ", conflict_update, ";"])
+        return "".join([" ON CONFLICT ", conflict_columns, " DO NOTHING;"])
+
+    #######################################################
+
+    def _check_cols(self, sample_df, expected_cols=None):
+        # Check the columns of input df to make sure it matches what we expect:
+        # expected_cols, defaulting to self._expected_cols.
 
         # We may or may not care about the order of the columns. If not, then
         # wrap both sides in set().
-        if set(list(sample_df)) != set(self._expected_cols):
+        if expected_cols is None:
+            expected_cols = self._expected_cols
+        if set(list(sample_df)) != set(expected_cols):
             return False
 
         return True
@@ -242,11 +349,12 @@ class Table(abc.ABC):
     """
     Queries the C-Tran data table using the given SQL query.
 
-    :argument   a SQL query string
+    :argument   a SQL query string, and optionally the columns it reads when
+                they are not self._expected_cols (e.g. those of a view)
     :returns    a DataFrame containing query results, or
                 None if an exception occurred.
     """
-    def _query_table(self, sql):
+    def _query_table(self, sql, expected_cols=None):
         if not isinstance(self._engine, Engine):
             self._ios.log_and_print("invalid engine", ios.Severity.ERROR)
             return None
@@ -254,7 +362,9 @@ class Table(abc.ABC):
         df = None
         self._ios.log_and_print(sql)
         try:
-            df = pandas.read_sql(sql, self._engine, index_col=self._index_col)
+            with metrics.timer("pipeline_db_seconds",
+                               table=self._table_name, operation="query"):
+                df = pandas.read_sql(sql, self._engine, index_col=self._index_col)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -263,34 +373,101 @@ class Table(abc.ABC):
             self._ios.log_and_print("Pandas: " + str(error), ios.Severity.ERROR)
             return None
 
-        if not self._check_cols(df):
+        if not self._check_cols(df, expected_cols):
             self._ios.log_and_print("the columns of read data does not match the specified columns" , ios.Severity.ERROR)
             return None
 
-        #Converts NaN to None, can't do the same with NaT: null flagger takes care
-        df1 = df.where(df.notnull(), None)
+        return self._convert_types(df)
 
-        return df1
+    #######################################################
+
+    """
+    Generator version of _query_table: reads the query results through a
+    server-side cursor, chunksize rows at a time, so only one chunk is held in
+    memory.
+
+    :argument   a SQL query string, and the number of rows per chunk
+    :yields     a DataFrame per chunk; a single None is yielded, and the
+                generator stops, if an exception occurred.
+    """
+    def _query_table_chunks(self, sql, chunksize):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("invalid engine", ios.Severity.ERROR)
+            yield None
+            return
+
+        self._ios.log_and_print(sql)
+        con = None
+        try:
+            con = self._engine.connect().execution_options(stream_results=True)
+            chunks = pandas.read_sql(sql, con, index_col=self._index_col,
+                                     chunksize=chunksize)
+            while True:
+                # The time to fetch each chunk, not the time the caller
+                # spends on it.
+                start = time.perf_counter()
+                df = next(chunks, None)
+                if df is None:
+                    break
+                metrics.observe("pipeline_db_seconds", time.perf_counter() - start,
+                                table=self._table_name, operation="query")
+
+                if not self._check_cols(df):
+                    self._ios.log_and_print("the columns of read data does not match the specified columns" , ios.Severity.ERROR)
+                    yield None
+                    return
+
+                yield self._convert_types(df)
+
+        except SQLAlchemyError as error:
+            self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
+            yield None
+        except (ValueError, KeyError) as error:
+            self._ios.log_and_print("Pandas: " + str(error), ios.Severity.ERROR)
+            yield None
+        finally:
+            if con is not None:
+                con.close()
+
+    #######################################################
+
+    # Subclasses may set self._dtypes to a {column: dtype} map, in which case
+    # queried frames are cast to it; nulls then stay as the dtype's missing
+    # value (NaN, NaT or pandas.NA) and should be tested for with isna().
+    # Otherwise every column becomes an object column with None for nulls.
+    def _convert_types(self, df):
+        if self._dtypes is not None:
+            try:
+                dtypes = {col: dtype for col, dtype in self._dtypes.items() if col in df}
+                return df.astype(dtypes)
+            except (ValueError, TypeError) as error:
+                self._ios.log_and_print(
+                    "Could not apply the column types, falling back to objects: " + str(error),
+                    ios.Severity.WARNING)
+
+        #Converts NaN to None, can't do the same with NaT: null flagger takes care
+        return df.where(df.notnull(), None)
 
     ###########################################################################
     # Private Methods
 
     def _build_engine(self, user, passwd, hostname, db_name):
         engine_info = ["postgresql://", user, ":", passwd, "@", hostname, "/", db_name]
-        self._engine = create_engine("".join(engine_info))
+        self._engine = engines.get_engine("".join(engine_info))
         
         self._ios.log_and_print("Your engine has been created: ", obj=self._engine)
         return True
 
     ###########################################################################
 
-    def write_csv(self, df, path):
+    def write_csv(self, df, path, append=False):
         """
         Function is meant to be called by a subclass: saves passed in data to a csv file.
 
         Args: 
             df      (Object): pandas DataFrame that contains data to be saved to a csv.
             path    (String): relative path to where csv will be saved. 
+            append  (Boolean): append to the csv instead of overwriting it.
 
         Returns: 
             Boolean representing state of the operation (successfull write: True, error during process: False)
@@ -310,10 +487,77 @@ class Table(abc.ABC):
 
         #Attempt saving
         try:
-            df.to_csv(full_path, index=False, encoding='utf-8')
+            if append:
+                df.to_csv(full_path, mode='a', header=False, index=False, encoding='utf-8')
+            else:
+                df.to_csv(full_path, index=False, encoding='utf-8')
         except:
             self._print("ERROR: write_csv couldn't save data to " + full_path)
             return False
 
         return True
 
+    ###########################################################################
+
+    def write_parquet(self, df, path, compression="zstd"):
+        """
+        Function is meant to be called by a subclass: saves passed in data to a parquet file,
+        overwriting it. This needs pyarrow, which is only required for the parquet output.
+
+        Args: 
+            df          (Object): pandas DataFrame that contains data to be saved.
+            path        (String): relative path to where the file will be saved. 
+            compression (String): parquet compression codec, e.g. "zstd" or "snappy".
+
+        Returns: 
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        if not self._table_name:
+            self._ios.log_and_print(
+                "write_parquet not called by a subclass.", ios.Severity.ERROR)
+            return False
+
+        os.makedirs(path, exist_ok=True)
+        full_path = os.path.join(path, self._table_name + ".parquet")
+        try:
+            df.to_parquet(full_path, engine="pyarrow", compression=compression, index=False)
+        except ImportError:
+            self._ios.log_and_print(
+                "The parquet output needs pyarrow: pip install pyarrow", ios.Severity.ERROR)
+            return False
+        except (OSError, ValueError) as error:
+            self._ios.log_and_print(
+                "".join(["write_parquet couldn't save data to ", full_path, ": ", str(error)]),
+                ios.Severity.ERROR)
+            return False
+
+        return True
+
+
+""" _CSV_Stream
+A read-only file-like object handed to COPY FROM STDIN. It renders the
+DataFrame as CSV chunksize rows at a time, as the database asks for more
+data, so the whole frame is never held in memory as text.
+"""
+class _CSV_Stream():
+    def __init__(self, df, chunksize):
+        self._chunks = (df.iloc[i:i + chunksize]
+                        for i in range(0, len(df.index), chunksize))
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk.to_csv(header=False, index=False)
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
@@ -0,0 +1,113 @@
+import datetime
+import numpy as np
+import pandas
+import pytest
+from src.baselines import Baselines, Baseline
+
+def chunk(dates, locations, dwells):
+    return pandas.DataFrame({
+        "service_date": pandas.to_datetime(dates),
+        "location_id": pandas.array(locations, dtype="Int32"),
+        "dwell": pandas.array(dwells, dtype="Int32"),
+    })
+
+@pytest.fixture
+def instance_fixture():
+    return Baselines()
+
+def test_empty(instance_fixture):
+    assert not instance_fixture.loaded and len(instance_fixture) == 0
+    assert instance_fixture.get("location_id", "dwell", 1) is None
+    assert instance_fixture.lookup("location_id", "dwell", [1])["mean"].isna().all()
+    assert np.isnan(instance_fixture.quantile("location_id", "dwell", [1], 0.5)).all()
+    assert instance_fixture.summarize(pandas.DataFrame({"dwell": [1]})).stats.empty
+
+def test_summarize(instance_fixture):
+    stats, days = instance_fixture.summarize(chunk(
+        ["2020-01-01", "2020-01-02", "2020-01-02", "2020-01-02"],
+        [1, 1, 2, None], [10, 20, 5, 7]))
+    assert list(stats.columns) == Baselines.columns
+    assert [str(day) for day in days] == ["2020-01-01", "2020-01-02"]
+    assert stats[["key_type", "key_value", "metric", "observations", "mean", "m2"]].values.tolist() == [
+        ["location_id", 1, "dwell", 2, 15.0, 50.0],
+        ["location_id", 2, "dwell", 1, 5.0, 0.0]]
+    assert list(stats["last_date"]) == [pandas.Timestamp("2020-01-02")] * 2
+    assert [int(sketch.sum()) for sketch in stats["sketch"]] == [2, 1]
+
+def test_combine_matches_one_pass(instance_fixture):
+    rng = np.random.default_rng(3)
+    dwells = rng.integers(0, 300, 1000)
+    locations = rng.integers(1, 20, 1000)
+    dates = ["2020-01-01"] * 1000
+    whole = instance_fixture.summarize(chunk(dates, locations, dwells)).stats
+    parts = [instance_fixture.summarize(chunk(dates[i:i + 100], locations[i:i + 100], dwells[i:i + 100]))
+             for i in range(0, 1000, 100)]
+    combined, days = instance_fixture.combine(parts)
+    assert [str(day) for day in days] == ["2020-01-01"]
+
+    whole = whole.sort_values("key_value").reset_index(drop=True)
+    combined = combined.sort_values("key_value").reset_index(drop=True)
+    assert (combined["observations"] == whole["observations"]).all()
+    assert np.allclose(combined["mean"], whole["mean"])
+    assert np.allclose(combined["m2"], whole["m2"])
+    assert (np.vstack(combined["sketch"]) == np.vstack(whole["sketch"])).all()
+
+def test_build_and_lookup(instance_fixture):
+    rng = np.random.default_rng(5)
+    dwells = rng.integers(1, 1000, 5000)
+    stats = instance_fixture.summarize(chunk(["2020-01-01"] * 5000, [7] * 5000, dwells))
+    instance_fixture.build(*stats)
+    assert instance_fixture.loaded and len(instance_fixture) == 1
+
+    baseline = instance_fixture.get("location_id", "dwell", 7)
+    assert baseline == Baseline(5000, pytest.approx(dwells.mean()), pytest.approx(dwells.std()))
+    looked_up = instance_fixture.lookup("location_id", "dwell", pandas.Series([7, 8, None], index=[4, 5, 6]))
+    assert list(looked_up.index) == [4, 5, 6]
+    assert looked_up.loc[4, "mean"] == pytest.approx(dwells.mean())
+    assert looked_up.loc[[5, 6]].isna().all().all()
+
+    quantiles = instance_fixture.quantile("location_id", "dwell", [7, 7, 8], 0.5)
+    assert quantiles[0] == pytest.approx(np.median(dwells), rel=0.05)
+    assert np.isnan(quantiles[2])
+    assert instance_fixture.quantile("location_id", "dwell", [7], 0.99)[0] == \
+        pytest.approx(np.quantile(dwells, 0.99), rel=0.05)
+
+def test_summarize_skips_counted_days(instance_fixture):
+    instance_fixture.build(*instance_fixture.summarize(
+        chunk(["2020-01-01", "2020-01-02"], [1, 1], [10, 20])))
+    stats, days = instance_fixture.summarize(chunk(
+        ["2020-01-02", "2020-01-03", "2020-01-02"], [1, 1, 2], [30, 40, 50]))
+    # January 2nd is counted already, for every location.
+    assert stats[["key_value", "observations", "mean"]].values.tolist() == [[1, 1, 40.0]]
+    assert [str(day) for day in days] == ["2020-01-03"]
+
+def test_summarize_days_out_of_order(instance_fixture):
+    instance_fixture.build(*instance_fixture.summarize(
+        chunk(["2020-01-05"], [1], [10])))
+    # Days before the latest one counted are counted too, once.
+    summary = instance_fixture.summarize(chunk(
+        ["2020-01-03", "2020-01-05"], [1, 1], [20, 30]))
+    assert summary.stats[["key_value", "observations", "mean"]].values.tolist() == [[1, 1, 20.0]]
+
+    stats, days = instance_fixture.combine([instance_fixture.summarize(
+        chunk(["2020-01-05"], [1], [10])), summary])
+    instance_fixture.build(stats, days)
+    assert instance_fixture.summarize(chunk(["2020-01-03"], [1], [20])).stats.empty
+
+def test_load(instance_fixture):
+    class Mock_Table():
+        def __init__(self, stats):
+            self.stats = stats
+        def query_stats(self):
+            return self.stats
+        def query_days(self):
+            return [datetime.date(2020, 1, 1)]
+
+    assert instance_fixture.load(Mock_Table(None)) == False
+    stats = instance_fixture.summarize(chunk(["2020-01-01"], [1], [10])).stats
+    # As read back from the database.
+    stats["sketch"] = [list(sketch) for sketch in stats["sketch"]]
+    stats["last_date"] = [datetime.date(2020, 1, 1)]
+    assert instance_fixture.load(Mock_Table(stats)) == True
+    assert instance_fixture.get("location_id", "dwell", 1) == Baseline(1, 10.0, 0.0)
+    assert instance_fixture.summarize(chunk(["2020-01-01"], [1], [10])).stats.empty
@@ -1,7 +1,8 @@
 import pytest
 import os
 import json
-from datetime import datetime
+import pandas
+from datetime import date, datetime
 from src.config import Config
 from src.config import BoundsResult
 
@@ -97,6 +98,43 @@ def test_check_bounds(loaded_config):
     assert loaded_config.check_bounds("service_date", good_date_str) == BoundsResult.VALID
     assert loaded_config.check_bounds("service_date", bad_date_str) == BoundsResult.MIN_ERROR
 
+def test_compiled_bounds(loaded_config):
+    bounds = loaded_config.get_compiled_bounds("service_date")
+    assert bounds.min == pandas.Timestamp("1990-01-01")
+    assert bounds.max is None
+    assert bounds.is_date
+    assert loaded_config.get_compiled_bounds("vehicle_number") == (0, None, False)
+    assert loaded_config.get_compiled_bounds("missing") is None
+    assert sorted(loaded_config.bounded_columns()) == [
+        "maximum_speed", "no_bounds", "service_date", "vehicle_number"]
+
+def test_check_bounds_typed_values(loaded_config):
+    assert loaded_config.check_bounds("service_date", datetime(1980, 1, 1)) == BoundsResult.MIN_ERROR
+    assert loaded_config.check_bounds("service_date", date(2020, 1, 1)) == BoundsResult.VALID
+    assert loaded_config.check_bounds("service_date", pandas.Timestamp("1989-12-31")) == BoundsResult.MIN_ERROR
+    # Incomparable values are not out of bounds.
+    assert loaded_config.check_bounds("service_date", 5) == BoundsResult.VALID
+
+def test_check_bounds_frame(loaded_config):
+    speeds = pandas.Series([-1, 0, 150, 151, None], index=[5, 6, 7, 8, 9], dtype="Int32")
+    masks = loaded_config.check_bounds_frame("maximum_speed", speeds)
+    assert list(masks[BoundsResult.MIN_ERROR]) == [True, False, False, False, False]
+    assert list(masks[BoundsResult.MAX_ERROR]) == [False, False, False, True, False]
+    assert masks[BoundsResult.MIN_ERROR].index.equals(speeds.index)
+
+    dates = pandas.Series([date(1980, 1, 1), date(2020, 1, 1), None])
+    masks = loaded_config.check_bounds_frame("service_date", dates)
+    assert list(masks) == [BoundsResult.MIN_ERROR]
+    assert list(masks[BoundsResult.MIN_ERROR]) == [True, False, False]
+
+    assert loaded_config.check_bounds_frame("no_bounds", speeds) == {}
+    assert loaded_config.check_bounds_frame("missing", speeds) == {}
+
+def test_set_bounds_compiles(loaded_config):
+    loaded_config.set_bounds("service_date", "NA", "2000-01-01")
+    assert loaded_config.check_bounds("service_date", "1980-01-01") == BoundsResult.VALID
+    assert loaded_config.check_bounds("service_date", "2001-01-01") == BoundsResult.MAX_ERROR
+
 def test_save_config(loaded_config, tmp_path):
     p = tmp_path / "new_config.json"
 
@@ -0,0 +1,25 @@
+import pytest
+from src.config import config
+from src.tables import engines
+
+# Tables share their engines through the registry, and many tests patch
+# methods onto those engines; start every test with fresh engines.
+@pytest.fixture(autouse=True)
+def fresh_engines():
+    engines.dispose_all()
+    yield
+    engines.dispose_all()
+
+# Runs save their metrics to metrics_file (see _Client._write_metrics); keep
+# the tests' out of output/, including when a client reloads the config.
+@pytest.fixture(autouse=True)
+def metrics_file(monkeypatch, tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    load = config.load
+    def load_config(*args, **kwargs):
+        loaded = load(*args, **kwargs)
+        config._data["metrics_file"] = path
+        return loaded
+    monkeypatch.setattr(config, "load", load_config)
+    monkeypatch.setitem(config._data, "metrics_file", path)
+    return path
@@ -0,0 +1,86 @@
+import datetime
+import pytest
+from src.daemon import Daemon
+from src.notif import notif
+
+TODAY = datetime.date.today()
+
+@pytest.fixture
+def mock_client():
+    class Mock_CTran():
+        def __init__(self):
+            self.latest_day = TODAY
+        def get_latest_day(self):
+            return self.latest_day
+
+    class Mock_Client():
+        def __init__(self):
+            self.ctran = Mock_CTran()
+            self.latest_day = TODAY - datetime.timedelta(days=3)
+            self.results = []
+            self.processed = []
+        def _get_latest_day(self):
+            return self.latest_day
+        def process_since_checkpoint(self, workers=None, end_date=None):
+            self.processed.append(end_date)
+            result = self.results.pop(0) if self.results else True
+            if isinstance(result, Exception):
+                raise result
+            if result:
+                self.latest_day = end_date
+            return result
+
+    return Mock_Client()
+
+@pytest.fixture
+def instance_fixture(monkeypatch, mock_client):
+    emails = []
+    monkeypatch.setattr(notif, "email",
+                        lambda subject, msg: emails.append(subject))
+    daemon = Daemon(mock_client)
+    daemon._poll_interval = 900
+    daemon._lag_days = 1
+    daemon._retry_base = 30
+    daemon._retry_max = 100
+    daemon._notify_after = 3
+    daemon.emails = emails
+    return daemon
+
+
+def test_poll_processes_until_lag(mock_client, instance_fixture):
+    assert instance_fixture.poll() == 900
+    # Today's data may still be arriving.
+    assert mock_client.processed == [TODAY - datetime.timedelta(days=1)]
+
+    # Nothing new on the next poll.
+    assert instance_fixture.poll() == 900
+    assert len(mock_client.processed) == 1
+
+def test_poll_waits_for_portal(mock_client, instance_fixture):
+    mock_client.ctran.latest_day = mock_client.latest_day
+    assert instance_fixture.poll() == 900
+    assert mock_client.processed == []
+
+def test_poll_backs_off(mock_client, instance_fixture):
+    mock_client.results = [False, ValueError("connection reset"), False, False, True]
+    delays = [instance_fixture.poll() for _ in range(5)]
+    assert delays == [30, 60, 100, 100, 900]
+    # Emailed once, on the third consecutive failure.
+    assert len(instance_fixture.emails) == 1
+
+def test_poll_without_checkpoint(mock_client, instance_fixture):
+    mock_client.latest_day = None
+    assert instance_fixture.poll() == 30
+    assert mock_client.processed == []
+
+def test_run_stops(mock_client, instance_fixture):
+    instance_fixture._poll_interval = 0
+    assert instance_fixture.run(max_polls=2) == True
+    assert len(mock_client.processed) == 1
+
+    instance_fixture.stop()
+    assert instance_fixture.run() == True
+
+def test_run_serves_metrics(mock_client, instance_fixture):
+    instance_fixture._metrics_port = 0
+    assert instance_fixture.run(max_polls=1) == True
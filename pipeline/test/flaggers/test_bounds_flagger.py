@@ -0,0 +1,57 @@
+from flaggers.flagger import flaggers, Flags
+from src.config import Config
+import json
+import pytest
+import pandas
+
+@pytest.fixture
+def bounds_flagger():
+  return [f for f in flaggers if f.name == 'Bounds'][0]
+
+@pytest.fixture
+def bounds_config(tmp_path):
+  p = tmp_path / "config.json"
+  p.write_text(json.dumps({"columns": {
+    "maximum_speed": {"max": 150, "min": 0},
+    "vehicle_number": {"max": "NA", "min": 0},
+    "service_date": {"max": "NA", "min": "1990-01-01"}}}))
+  config = Config()
+  config.load(p)
+  return config
+
+@pytest.fixture
+def frame():
+  return pandas.DataFrame({
+    "maximum_speed": [30, 200, -1, None],
+    "vehicle_number": [1, 1, -5, None],
+    "service_date": pandas.to_datetime(["2020-01-01", "1980-01-01", "2020-01-01", None])},
+    index=[10, 11, 12, 13])
+
+#Should NOT return flags, since every value is within its bounds
+def test_bounds_flagger_on_good_data(bounds_flagger, bounds_config):
+  data = {"maximum_speed": 30, "vehicle_number": 1, "service_date": "2020-01-01"}
+  assert bounds_flagger.flag(data, bounds_config) == []
+
+#Should return both flags, as one value is below its min and another above its max
+def test_bounds_flagger_on_bad_data(bounds_flagger, bounds_config):
+  data = {"maximum_speed": 200, "vehicle_number": -1, "service_date": "2020-01-01"}
+  assert sorted(bounds_flagger.flag(data, bounds_config)) == [Flags.BELOW_MIN, Flags.ABOVE_MAX]
+
+def test_bounds_flag_frame(bounds_flagger, bounds_config, frame):
+  masks = bounds_flagger.flag_frame(frame, bounds_config)
+  assert list(masks[Flags.BELOW_MIN]) == [False, True, True, False]
+  assert list(masks[Flags.ABOVE_MAX]) == [False, True, False, False]
+
+  for row_id, row in frame.iterrows():
+    flags = set(bounds_flagger.flag(row, bounds_config))
+    assert (Flags.BELOW_MIN in flags) == masks[Flags.BELOW_MIN][row_id]
+    assert (Flags.ABOVE_MAX in flags) == masks[Flags.ABOVE_MAX][row_id]
+
+def test_bounds_sql_flags(bounds_flagger, bounds_config):
+  assert bounds_flagger.sql_flags(bounds_config) == {
+    Flags.BELOW_MIN: "(maximum_speed < 0.0 OR vehicle_number < 0.0 OR service_date < '1990-01-01 00:00:00')",
+    Flags.ABOVE_MAX: "(maximum_speed > 150.0)"}
+
+def test_bounds_sql_flags_unsafe_column(bounds_flagger, bounds_config):
+  bounds_config.set_bounds("door; DROP TABLE flags", 0, 1)
+  assert bounds_flagger.sql_flags(bounds_config) is None
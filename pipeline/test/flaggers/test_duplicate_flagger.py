@@ -66,3 +66,22 @@ def test_duplicate_flagger_sad(duplicate_flagger, no_duplications):
 def test_duplicate_flagger_bad(duplicate_flagger):
     with pytest.raises(ValueError):
         duplicate_flagger.flag(pandas.DataFrame(), "config")
+
+def test_fingerprint_ignores_index(duplicate_flagger):
+    df = pandas.DataFrame({"service_date": ["2020-01-01"] * 3, "door": [1, 1, 2]},
+                          index=[10, 20, 30])
+    fingerprints = duplicate_flagger.fingerprint(df)
+    assert fingerprints.dtype == np.uint64
+    assert list(fingerprints.index) == [10, 20, 30]
+    assert fingerprints[10] == fingerprints[20] != fingerprints[30]
+
+def test_fingerprint_column_order(duplicate_flagger):
+    df = pandas.DataFrame({"service_date": ["2020-01-01"], "door": [1]})
+    assert duplicate_flagger.fingerprint(df)[0] == \
+           duplicate_flagger.fingerprint(df[["door", "service_date"]])[0]
+
+def test_duplicate_flagger_fingerprints_given(duplicate_flagger):
+    df = pandas.DataFrame({"service_date": ["2020-01-01"] * 3, "door": [1, 2, 3]})
+    fingerprints = pandas.Series([5, 5, 6], dtype=np.uint64)
+    result = duplicate_flagger.flag(df, "config", fingerprints)
+    assert list(result.index) == [0, 1]
@@ -0,0 +1,136 @@
+from flaggers.flagger import flaggers, Flags, flagger_version
+from src.config import config
+import datetime
+import pytest
+import pandas
+import numpy as np
+
+@pytest.fixture
+def config_instance():
+  config.load(read_env_data=True)
+  return config
+
+@pytest.fixture
+def frame_flaggers():
+  return [f for f in flaggers if f.name != 'Duplicate']
+
+@pytest.fixture
+def ctran_frame():
+  columns = ["service_date", "vehicle_number", "door", "location_distance",
+             "maximum_speed", "trip_id"]
+  rows = [
+    [datetime.date(2020, 1, 1), 1, 1, 0.0, 30, 1],
+    [datetime.date(2020, 1, 1), None, 0, 666.0, None, 2],
+    [None, 3, None, None, 30, None],
+    [datetime.date(2020, 1, 2), 4, 0, 50.0, np.nan, 4],
+    [datetime.date(2020, 1, 2), 5, 2, 51.0, 30, 5],
+  ]
+  df = pandas.DataFrame(rows, columns=columns, index=[10, 11, 12, 13, 14])
+  df.index.name = "row_id"
+  # Mirror Table._query_table, which hands the flaggers None instead of NaN.
+  return df.astype(object).where(df.notnull(), None)
+
+@pytest.fixture
+def typed_ctran_frame(ctran_frame):
+  # Mirror CTran_Data's typed read path, where nulls are NaN, NaT or pandas.NA.
+  return ctran_frame.astype({
+    "service_date": "datetime64[ns]",
+    "vehicle_number": "Int32",
+    "door": "Int32",
+    "location_distance": "float32",
+    "maximum_speed": "Int32",
+    "trip_id": "Int32",
+  })
+
+def _row_wise(flagger, df, config):
+  flagged = set()
+  for row_id, row in df.iterrows():
+    for flag in flagger.flag(row, config):
+      flagged.add((row_id, flag))
+  return flagged
+
+def _frame_wise(flagger, df, config):
+  flagged = set()
+  for flag, mask in flagger.flag_frame(df, config).items():
+    assert mask.index.equals(df.index)
+    for row_id in df.index[mask.values]:
+      flagged.add((row_id, flag))
+  return flagged
+
+
+def test_builtin_flaggers_implement_flag_frame(frame_flaggers, ctran_frame, config_instance):
+  for flagger in frame_flaggers:
+    assert flagger.flag_frame(ctran_frame, config_instance) is not None
+
+
+def test_flag_frame_matches_row_wise(frame_flaggers, ctran_frame, config_instance):
+  for flagger in frame_flaggers:
+    assert _frame_wise(flagger, ctran_frame, config_instance) == \
+           _row_wise(flagger, ctran_frame, config_instance)
+
+
+def test_typed_frame_matches_object_frame(frame_flaggers, ctran_frame, typed_ctran_frame, config_instance):
+  for flagger in frame_flaggers:
+    expected = _row_wise(flagger, ctran_frame, config_instance)
+    assert _row_wise(flagger, typed_ctran_frame, config_instance) == expected
+    assert _frame_wise(flagger, typed_ctran_frame, config_instance) == expected
+
+
+def test_flag_frame_expected_flags(frame_flaggers, ctran_frame, config_instance):
+  flagged = set()
+  for flagger in frame_flaggers:
+    flagged.update(_frame_wise(flagger, ctran_frame, config_instance))
+
+  assert (11, Flags.VEHICLE_NUMBER_NULL) in flagged
+  assert (11, Flags.UNOPENED_DOOR) in flagged
+  assert (11, Flags.UNOBSERVED_STOP) in flagged
+  assert (12, Flags.SERVICE_DATE_NULL) in flagged
+  assert (12, Flags.DOOR_NULL) in flagged
+  assert (12, Flags.UNOPENED_DOOR) not in flagged
+  assert (13, Flags.MAXIMUM_SPEED_NULL) in flagged
+  assert (13, Flags.UNOBSERVED_STOP) not in flagged
+  assert (14, Flags.UNOBSERVED_STOP) in flagged
+  assert not any(row_id == 10 for row_id, _ in flagged)
+
+
+def test_flag_frame_missing_columns(frame_flaggers, config_instance):
+  df = pandas.DataFrame({"other": [1, 2]})
+  for flagger in frame_flaggers:
+    masks = flagger.flag_frame(df, config_instance)
+    assert all(not mask.any() for mask in masks.values())
+
+def test_flagger_version(monkeypatch, config_instance):
+  version = flagger_version(flaggers, config_instance)
+  assert len(version) == 32
+  assert flagger_version(list(reversed(flaggers)), config_instance) == version
+
+  # A config value a flagger reads changes it; one none reads doesn't.
+  monkeypatch.setitem(config_instance._data, "metrics_port", 9999)
+  assert flagger_version(flaggers, config_instance) == version
+  monkeypatch.setitem(config_instance._data, "unobserved_stop_distance", 1)
+  assert flagger_version(flaggers, config_instance) != version
+
+  # So does a flagger's version.
+  monkeypatch.undo()
+  monkeypatch.setattr(flaggers[0], "version", flaggers[0].version + 1)
+  assert flagger_version(flaggers, config_instance) != version
+
+def test_flagger_version_location_references(config_instance):
+  from src.spatial import locations
+  def references(latitude):
+    return pandas.DataFrame({"location_id": [1], "x_coordinate": [-122.6],
+                             "y_coordinate": [latitude]})
+
+  version = flagger_version(flaggers, config_instance)
+  try:
+    # The references the GPS Outlier flagger reads change it.
+    locations.build(references(45.5), 1000)
+    loaded = flagger_version(flaggers, config_instance)
+    assert loaded != version
+    locations.build(references(45.5), 1000)
+    assert flagger_version(flaggers, config_instance) == loaded
+    locations.build(references(45.6), 1000)
+    assert flagger_version(flaggers, config_instance) not in (version, loaded)
+  finally:
+    locations.clear()
+  assert flagger_version(flaggers, config_instance) == version
@@ -0,0 +1,71 @@
+from flaggers.flagger import flaggers, Flags
+from src.spatial import locations
+import pandas
+import pytest
+
+# Feet per degree of latitude, as in src.spatial.LocationIndex.
+FEET = 364567.0
+
+@pytest.fixture
+def mock_config():
+  class Mock_Config:
+    def get_value(self, value):
+      if value == "gps_outlier_distance":
+        return 1000
+  return Mock_Config()
+
+@pytest.fixture
+def references():
+  locations.build(pandas.DataFrame({
+    "location_id": [10, 20],
+    "x_coordinate": [-122.68, -122.60],
+    "y_coordinate": [45.52, 45.60],
+  }), 1000, "degrees")
+  yield
+  locations.clear()
+
+@pytest.fixture
+def instance_fixture():
+  return [f for f in flaggers if f.name == 'GPS Outlier'][0]
+
+@pytest.fixture
+def frame():
+  # Near location 10, 2000 feet from it, at a location without a reference
+  # near location 20, at one far from everything, and without coordinates;
+  # only the second has evidence against it.
+  return pandas.DataFrame({
+    "location_id": [10, 10, 99, 98, 10],
+    "x_coordinate": [-122.68, -122.68, -122.60, -122.64, None],
+    "y_coordinate": [45.52 + 200 / FEET, 45.52 + 2000 / FEET, 45.60, 45.56, None],
+  }, index=[1, 2, 3, 4, 5]).astype({"location_id": "Int32", "x_coordinate": "float32", "y_coordinate": "float32"})
+
+def test_flag_frame(references, instance_fixture, frame, mock_config):
+  masks = instance_fixture.flag_frame(frame, mock_config)
+  assert list(masks[Flags.GPS_OUTLIER][lambda m: m].index) == [2]
+
+def test_flag_matches_frame(references, instance_fixture, frame, mock_config):
+  flagged = [row_id for row_id, row in frame.iterrows()
+             if instance_fixture.flag(row, mock_config) == [Flags.GPS_OUTLIER]]
+  assert flagged == [2]
+
+def test_without_references(instance_fixture, frame, mock_config):
+  masks = instance_fixture.flag_frame(frame, mock_config)
+  assert not masks[Flags.GPS_OUTLIER].any()
+
+def test_missing_columns(references, instance_fixture, mock_config):
+  assert instance_fixture.flag_frame(pandas.DataFrame({"location_id": [10]}), mock_config) == {}
+  assert instance_fixture.flag(pandas.Series({"location_id": 10}), mock_config) == []
+
+def test_generator_data(instance_fixture, mock_config):
+  # Rows shaped like ctran_data, in state plane feet, against references
+  # built from their own locations' medians, as --build-locations does.
+  from benchmark.generator import generate_chunks
+  data = next(generate_chunks(20000, 20000))
+  medians = data.groupby("location_id")[["x_coordinate", "y_coordinate"]].median().reset_index()
+  known = medians["location_id"] % 2 == 0
+  locations.build(medians[known], mock_config.get_value("gps_outlier_distance"))
+  try:
+    masks = instance_fixture.flag_frame(data, mock_config)
+    assert masks[Flags.GPS_OUTLIER].mean() < 0.001
+  finally:
+    locations.clear()
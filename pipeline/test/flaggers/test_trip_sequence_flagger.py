@@ -0,0 +1,84 @@
+from flaggers.flagger import flaggers, Flags, Trips
+import datetime
+import pytest
+import numpy as np
+import pandas
+
+@pytest.fixture
+def mock_config():
+  class Mock_Config:
+    def get_value(self, value):
+      if value == "max_implied_speed":
+        return 60
+  return Mock_Config()
+
+def flagger(name):
+  return [f for f in flaggers if f.name == name][0]
+
+@pytest.fixture
+def trip_frame():
+  # Two trips of vehicle 1 on the same day, shuffled; the last row has no
+  # stop_time and is not part of any trip.
+  columns = ["service_date", "vehicle_number", "trip_id", "stop_time",
+             "arrive_time", "pattern_distance", "train_mileage"]
+  rows = [
+    [datetime.date(2020, 1, 1), 1, 7, 200, 210, 5280.0, 10.5],   # trip 7, stop 2
+    [datetime.date(2020, 1, 1), 1, 8, 100, 105, 0.0, 20.0],      # trip 8, stop 1
+    [datetime.date(2020, 1, 1), 1, 7, 100, 100, 0.0, 10.0],      # trip 7, stop 1
+    [datetime.date(2020, 1, 1), 1, 7, 300, 200, 10560.0, 10.4],  # trip 7, stop 3: arrives earlier, mileage drops
+    [datetime.date(2020, 1, 1), 1, 8, 200, 165, 10560.0, 21.0],  # trip 8, stop 2: 2 miles in 60s
+    [datetime.date(2020, 1, 1), 1, 8, None, 300, 0.0, 0.0],
+  ]
+  df = pandas.DataFrame(rows, columns=columns, index=[10, 11, 12, 13, 14, 15])
+  df.index.name = "row_id"
+  return df.astype({"vehicle_number": "Int32", "trip_id": "Int32", "stop_time": "Int32",
+                    "arrive_time": "Int32", "pattern_distance": "float32"})
+
+def test_trips_order(trip_frame):
+  trips = Trips(trip_frame)
+  assert list(trip_frame.index[trips.positions]) == [12, 10, 13, 11, 14]
+  assert list(trips.first) == [True, False, False, True, False]
+  assert list(trips.column("stop_time")) == [100, 200, 300, 100, 200]
+  assert np.isnan(trips.previous("arrive_time")[[0, 3]]).all()
+  assert list(trips.diff("arrive_time")[[1, 2, 4]]) == [110, -10, 60]
+  assert np.isnan(trips.column("missing")).all()
+
+def test_trips_to_index(trip_frame):
+  trips = Trips(trip_frame)
+  mask = trips.to_index(np.array([False, False, True, False, True]))
+  assert mask.index.equals(trip_frame.index)
+  assert list(mask[mask].index) == [13, 14]
+
+def test_trips_missing_columns():
+  trips = Trips(pandas.DataFrame({"other": [1, 2]}))
+  assert len(trips) == 0
+  assert trips.apply(flagger('Mileage Regression'), None) == {}
+
+def test_arrive_time_regression(trip_frame, mock_config):
+  masks = flagger('Arrive Time Regression').flag_frame(trip_frame, mock_config)
+  assert list(masks[Flags.ARRIVE_TIME_REGRESSION][lambda m: m].index) == [13]
+
+def test_implied_speed(trip_frame, mock_config):
+  # 1 mile in 110s is ~33mph; 2 miles in 60s is 120mph.
+  masks = flagger('Implied Speed').flag_frame(trip_frame, mock_config)
+  assert list(masks[Flags.IMPLIED_SPEED][lambda m: m].index) == [14]
+
+def test_mileage_regression(trip_frame, mock_config):
+  masks = flagger('Mileage Regression').flag_frame(trip_frame, mock_config)
+  assert list(masks[Flags.MILEAGE_REGRESSION][lambda m: m].index) == [13]
+
+def test_sequence_flaggers_skip_rows(trip_frame, mock_config):
+  for name in ['Arrive Time Regression', 'Implied Speed', 'Mileage Regression']:
+    assert flagger(name).flag(trip_frame.loc[13], mock_config) == []
+
+def test_arrive_time_regression_generator_data(mock_config):
+  # The benchmark's trips only arrive earlier than at their previous stop
+  # where it injects a regression.
+  from benchmark.generator import generate_chunks
+  data = next(generate_chunks(20000, 20000, null_rate=0, duplicate_rate=0, regression_rate=0))
+  masks = flagger('Arrive Time Regression').flag_frame(data, mock_config)
+  assert not masks[Flags.ARRIVE_TIME_REGRESSION].any()
+
+  data = next(generate_chunks(20000, 20000, null_rate=0, duplicate_rate=0, regression_rate=0.01))
+  masks = flagger('Arrive Time Regression').flag_frame(data, mock_config)
+  assert 0.005 < masks[Flags.ARRIVE_TIME_REGRESSION].mean() < 0.015
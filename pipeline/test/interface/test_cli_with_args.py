@@ -1,3 +1,4 @@
+import os
 import argparse
 
 import pytest
@@ -190,3 +191,54 @@ def test_flag_with_limit_arg_succeeds(ai):
 
 def test_daily_succeeds(ai):
     ai._parse_cl_args(['--daily'])
+
+
+def test_migrate_succeeds(ai):
+    assert ai._parse_cl_args(['--migrate']).migrate == True
+
+
+def test_daemon_succeeds(ai):
+    assert ai._parse_cl_args(['--daemon']).daemon == True
+
+
+def test_profile_succeeds(ai):
+    assert ai._parse_cl_args(['--daily', '--profile']).profile == True
+
+
+def test_profile_runs_operation(monkeypatch, tmp_path, ai):
+    import sys
+    from src.profiler import Profiler
+    monkeypatch.setattr(sys.modules["src.interface.ArgInterface"], "Profiler",
+                        lambda: Profiler(str(tmp_path)))
+
+    class Mock_Client():
+        def __init__(self):
+            self.days = []
+        def process_next_day(self, restart=False):
+            self.days.append(restart)
+
+    client = Mock_Client()
+    assert ai.query_with_args(client, ['--daily', '--profile']) is None
+    assert client.days == [True]
+    files = sorted(os.listdir(str(tmp_path)))
+    assert [f.split(".")[-1] for f in files] == ["pstats", "txt"]
+    assert files[0].startswith("profile-daily-")
+
+
+def test_build_locations_runs(ai):
+    import datetime
+
+    class Mock_Client():
+        def __init__(self):
+            self.ranges = []
+        def build_location_references(self, start_date=None, end_date=None):
+            self.ranges.append((start_date, end_date))
+            return True
+
+    client = Mock_Client()
+    assert ai.query_with_args(client, ['--build-locations']) == True
+    assert ai.query_with_args(client, ['--build-locations', '--date-start=2020-01-01',
+                                       '--date-end=2020-03-31']) == True
+    assert client.ranges == [
+        (None, None),
+        (datetime.datetime(2020, 1, 1), datetime.datetime(2020, 3, 31))]
@@ -36,3 +36,72 @@ def test_prompt_hidden(monkeypatch, instance_fixture):
     monkeypatch.setattr("getpass.getpass", lambda _: expected)
     result = instance_fixture._prompt(prompt, True)
     assert result == expected
+
+def _read_log(path):
+    with open(path) as f:
+        return f.read()
+
+def test_every_record_fsyncs(monkeypatch, tmp_path, instance_fixture):
+    fsyncs = []
+    monkeypatch.setattr("os.fsync", lambda f: fsyncs.append(f))
+    instance_fixture.start(str(tmp_path / "log.txt"))
+    instance_fixture.log("one")
+    instance_fixture.log("two")
+    assert len(fsyncs) == 2
+    instance_fixture.stop()
+
+def test_buffered_stop_drains(tmp_path, instance_fixture):
+    path = str(tmp_path / "log.txt")
+    instance_fixture.configure(durability="shutdown", flush_bytes=10**9, flush_interval=60)
+    instance_fixture.start(path)
+    for i in range(1000):
+        instance_fixture.log("record " + str(i))
+    instance_fixture.stop()
+
+    lines = _read_log(path).splitlines()
+    assert len(lines) == 1001
+    assert lines[999].endswith("record 999")
+    assert "shutting down" in lines[-1]
+
+def test_buffered_fsyncs_errors_only(monkeypatch, tmp_path, instance_fixture):
+    fsyncs = []
+    monkeypatch.setattr("os.fsync", lambda f: fsyncs.append(f))
+    path = str(tmp_path / "log.txt")
+    instance_fixture.configure(durability=instance_fixture.Durability.ERRORS,
+                               flush_bytes=10**9, flush_interval=60)
+    instance_fixture.start(path)
+    instance_fixture.log("info")
+    instance_fixture.log("bad", instance_fixture.Severity.ERROR)
+    instance_fixture.log("info again")
+    instance_fixture.stop()
+
+    # One for the ERROR record, one when draining.
+    assert len(fsyncs) == 2
+    assert "[ERROR]" in _read_log(path)
+
+def test_buffered_flushes_on_size(tmp_path, instance_fixture):
+    path = str(tmp_path / "log.txt")
+    instance_fixture.configure(durability="shutdown", flush_bytes=1, flush_interval=60)
+    instance_fixture.start(path)
+    instance_fixture.log("flushed")
+    writer = instance_fixture._writer
+    for _ in range(100):
+        if "flushed" in _read_log(path):
+            break
+        writer.join(0.01)
+    assert "flushed" in _read_log(path)
+    instance_fixture.stop()
+
+def test_configure_while_started(tmp_path, instance_fixture):
+    path = str(tmp_path / "log.txt")
+    instance_fixture.start(path)
+    instance_fixture.log("before")
+    instance_fixture.configure(durability="errors")
+    assert instance_fixture._writer is not None
+    instance_fixture.log("after")
+    instance_fixture.configure(durability="every_record")
+    assert instance_fixture._writer is None
+    instance_fixture.stop()
+
+    log = _read_log(path)
+    assert "before" in log and "after" in log
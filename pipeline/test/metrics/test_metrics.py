@@ -0,0 +1,79 @@
+import urllib.request
+import urllib.error
+import pytest
+from src.metrics.metrics import _Metrics
+
+@pytest.fixture
+def instance_fixture():
+    return _Metrics()
+
+def test_render_empty(instance_fixture):
+    text = instance_fixture.render()
+    assert "# TYPE pipeline_rows_read_total counter\npipeline_rows_read_total 0\n" in text
+    assert "# TYPE pipeline_db_seconds histogram\n" in text
+    assert "pipeline_rows_flagged_total{" not in text
+
+def test_counter_labels(instance_fixture):
+    instance_fixture.inc("pipeline_rows_read_total", 10)
+    instance_fixture.inc("pipeline_rows_read_total", 5)
+    instance_fixture.inc("pipeline_rows_flagged_total", 2, flag="null-door")
+    instance_fixture.inc("pipeline_rows_flagged_total", 3, flag='a "quoted" flag')
+    text = instance_fixture.render()
+    assert "\npipeline_rows_read_total 15\n" in text
+    assert '\npipeline_rows_flagged_total{flag="null-door"} 2\n' in text
+    assert '\npipeline_rows_flagged_total{flag="a \\"quoted\\" flag"} 3\n' in text
+
+def test_unknown_metric(instance_fixture):
+    with pytest.raises(KeyError):
+        instance_fixture.inc("pipeline_unknown_total")
+
+def test_histogram(instance_fixture):
+    instance_fixture.observe("pipeline_db_seconds", 0.02, table="ctran_data", operation="query")
+    instance_fixture.observe("pipeline_db_seconds", 3.0, table="ctran_data", operation="query")
+    text = instance_fixture.render()
+    labels = 'operation="query",table="ctran_data"'
+    assert "pipeline_db_seconds_bucket{" + labels + ',le="0.01"} 0\n' in text
+    assert "pipeline_db_seconds_bucket{" + labels + ',le="0.025"} 1\n' in text
+    assert "pipeline_db_seconds_bucket{" + labels + ',le="5.0"} 2\n' in text
+    assert "pipeline_db_seconds_bucket{" + labels + ',le="+Inf"} 2\n' in text
+    assert "pipeline_db_seconds_sum{" + labels + "} 3.02\n" in text
+    assert "pipeline_db_seconds_count{" + labels + "} 2\n" in text
+
+def test_timer_records_on_error(instance_fixture):
+    with pytest.raises(ValueError):
+        with instance_fixture.timer("pipeline_flagger_seconds", flagger="Bounds"):
+            raise ValueError()
+    assert 'pipeline_flagger_seconds_count{flagger="Bounds"} 1\n' in instance_fixture.render()
+
+def test_merge(instance_fixture):
+    worker = _Metrics()
+    worker.inc("pipeline_rows_read_total", 4)
+    worker.observe("pipeline_flagger_seconds", 1.0, flagger="Bounds")
+    instance_fixture.inc("pipeline_rows_read_total", 1)
+    instance_fixture.observe("pipeline_flagger_seconds", 1.0, flagger="Bounds")
+    instance_fixture.merge(worker.snapshot())
+    instance_fixture.merge(worker.snapshot())
+    text = instance_fixture.render()
+    assert "\npipeline_rows_read_total 9\n" in text
+    assert 'pipeline_flagger_seconds_count{flagger="Bounds"} 3\n' in text
+
+def test_write(tmp_path, instance_fixture):
+    path = str(tmp_path / "output" / "metrics.prom")
+    assert instance_fixture.write(path)
+    with open(path) as f:
+        assert f.read() == instance_fixture.render()
+
+def test_serve(instance_fixture):
+    instance_fixture.inc("pipeline_rows_skipped_total", 7)
+    server = instance_fixture.serve(0, host="127.0.0.1")
+    assert server is not None
+    try:
+        url = "http://127.0.0.1:{}".format(server.server_port)
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "\npipeline_rows_skipped_total 7\n" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/")
+    finally:
+        server.shutdown()
+        server.server_close()
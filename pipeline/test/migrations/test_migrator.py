@@ -0,0 +1,152 @@
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+from src.migrations import Migrator, Migration, migrations
+from src.tables import CTran_Data
+from src.tables import Flagged_Data
+from src.tables import Fingerprints
+from src.tables import Schema_Migrations
+
+@pytest.fixture
+def tables():
+    flagged = Flagged_Data("sw23", "invalid", "localhost", "hive")
+    return {
+        "ctran": CTran_Data("sw23", "invalid", "localhost", "portal"),
+        "flagged": flagged,
+        "fingerprints": Fingerprints(engine=flagged.get_engine().url),
+    }
+
+@pytest.fixture
+def mock_connection():
+    class mock_transaction():
+        def __init__(self, con):
+            self.con = con
+        def __enter__(self):
+            self.con.in_transaction = True
+            return self
+        def __exit__(self, type, value, traceback):
+            self.con.in_transaction = False
+            return
+
+    class mock_connection():
+        def __init__(self):
+            self.sql = []
+            self.applied = []
+            self.fail_on = None
+            self.in_transaction = False
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def begin(self):
+            return mock_transaction(self)
+        def execute(self, sql):
+            if self.fail_on is not None and self.fail_on in sql:
+                raise SQLAlchemyError("failed")
+            if sql.startswith("SELECT version"):
+                return [(v,) for v in self.applied]
+            assert self.in_transaction or sql.lstrip().startswith("CREATE")
+            self.sql.append(sql)
+
+    return mock_connection()
+
+def _use(mock_connection, tables):
+    for table in tables.values():
+        table.get_engine().connect = lambda: mock_connection
+
+
+def test_index_statements(tables):
+    statements = migrations[2].statements(tables["flagged"])
+    assert statements == [
+        "CREATE INDEX IF NOT EXISTS flagged_data_flag_id_service_date_idx"
+        " ON hive.flagged_data (flag_id, service_date);"]
+
+def test_index_statements_bitmask(tables):
+    flagged = Flagged_Data(engine=tables["flagged"].get_engine().url, storage="bitmask")
+    assert migrations[2].statements(flagged) == []
+    assert migrations[3].statements(flagged) == [
+        "CREATE INDEX IF NOT EXISTS flagged_bitmask_row_id_idx"
+        " ON hive.flagged_bitmask (row_id);"]
+
+def test_versions_unique():
+    versions = [m.version for m in migrations]
+    assert versions == sorted(set(versions))
+
+def test_schemas(tables):
+    schemas = Migrator(tables, migrations)._schemas()
+    assert [record._schema for record, _ in schemas] == ["aperture", "hive"]
+    assert [m.version for m in schemas[0][1]] == [1]
+    assert [m.version for m in schemas[1][1]] == [2, 3, 4, 5]
+
+def test_migrate(mock_connection, tables):
+    _use(mock_connection, tables)
+    mock_connection.applied = [2, 3]
+    assert Migrator(tables, migrations).migrate() == True
+
+    applied = [sql for sql in mock_connection.sql if "schema_migrations (version" in sql]
+    assert [sql.split("VALUES (")[1].split(",")[0] for sql in applied] == ["1", "4", "5"]
+    assert not any("flagged_data_service_date_idx" in sql for sql in mock_connection.sql)
+    assert "CREATE INDEX IF NOT EXISTS row_fingerprints_service_date_idx" \
+           " ON hive.row_fingerprints (service_date);" in mock_connection.sql
+
+def test_migrate_stops_on_error(mock_connection, tables):
+    _use(mock_connection, tables)
+    mock_connection.fail_on = "flagged_data_service_date_idx"
+    assert Migrator(tables, migrations).migrate() == False
+    # Portal's migration is independent of Hive's.
+    assert any("ctran_data_service_date_idx" in sql for sql in mock_connection.sql)
+    assert not any("flagged_data_row_id_idx" in sql for sql in mock_connection.sql)
+
+def test_migrate_unknown_target(mock_connection, tables):
+    _use(mock_connection, tables)
+    unknown = Migration(6, "Index nothing", "nothing", lambda table: [])
+    assert Migrator(tables, migrations + [unknown]).migrate() == True
+
+def test_record_sql(tables):
+    record = Schema_Migrations(engine=tables["flagged"].get_engine().url)
+    assert record.record_sql(3, "It's") == "".join([
+        "INSERT INTO hive.schema_migrations (version, description)",
+        " VALUES (3, 'It''s') ON CONFLICT (version) DO NOTHING;"])
+
+def test_insert_flags_statements(tables):
+    from src.tables import Flags as Flags_Table
+    flags = Flags_Table(engine=tables["flagged"].get_engine().url)
+    statements = migrations[6].statements(flags)
+    assert statements == [
+        "INSERT INTO hive.flags (flag_id, description, name) VALUES"
+        " (31, 'BELOW_MIN', 'below-min'), (32, 'ABOVE_MAX', 'above-max')"
+        " ON CONFLICT (flag_id) DO NOTHING;"]
+
+def test_insert_sequence_flags_statements(tables):
+    from src.tables import Flags as Flags_Table
+    flags = Flags_Table(engine=tables["flagged"].get_engine().url)
+    assert migrations[7].statements(flags) == [
+        "INSERT INTO hive.flags (flag_id, description, name) VALUES"
+        " (33, 'ARRIVE_TIME_REGRESSION', 'arrive-time-regression'),"
+        " (34, 'IMPLIED_SPEED', 'implied-speed'),"
+        " (35, 'MILEAGE_REGRESSION', 'mileage-regression')"
+        " ON CONFLICT (flag_id) DO NOTHING;"]
+
+def test_location_references_migrations(tables):
+    from src.tables import Flags as Flags_Table, Location_References
+    references = Location_References(engine=tables["flagged"].get_engine().url)
+    assert migrations[8].statements(references) == [references._creation_sql]
+    flags = Flags_Table(engine=tables["flagged"].get_engine().url)
+    assert migrations[9].statements(flags) == [
+        "INSERT INTO hive.flags (flag_id, description, name) VALUES"
+        " (36, 'GPS_OUTLIER', 'gps-outlier')"
+        " ON CONFLICT (flag_id) DO NOTHING;"]
+
+def test_reference_stats_migration(tables):
+    from src.tables import Reference_Stats
+    stats = Reference_Stats(engine=tables["flagged"].get_engine().url)
+    assert migrations[10].statements(stats) == [stats._creation_sql]
+
+def test_checkpoint_fingerprints_migration(tables):
+    from src.tables import Checkpoints
+    checkpoints = Checkpoints(engine=tables["flagged"].get_engine().url)
+    assert migrations[11].statements(checkpoints) == [
+        "ALTER TABLE hive.processing_checkpoints"
+        " ADD COLUMN IF NOT EXISTS source_rows BIGINT,"
+        " ADD COLUMN IF NOT EXISTS max_row_id BIGINT,"
+        " ADD COLUMN IF NOT EXISTS source_hash CHAR(32),"
+        " ADD COLUMN IF NOT EXISTS flagger_version CHAR(32);"]
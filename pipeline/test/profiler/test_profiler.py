@@ -0,0 +1,55 @@
+import os
+import pstats
+import pytest
+from src.metrics import metrics
+from src.profiler import Profiler
+
+@pytest.fixture
+def instance_fixture(tmp_path):
+    return Profiler(str(tmp_path))
+
+def operation():
+    metrics.observe("pipeline_db_seconds", 0.5, table="ctran_data", operation="query")
+    metrics.observe("pipeline_db_seconds", 9.0, table="flagged_data", operation="write")
+    metrics.observe("pipeline_stage_seconds", 0.25, stage="resolve")
+    metrics.observe("pipeline_flagger_seconds", 0.125, flagger="Null")
+    metrics.observe("pipeline_flagger_seconds", 0.125, flagger="Null")
+    metrics.observe("pipeline_flagger_seconds", 1.0, flagger="Duplicate")
+    metrics.observe("pipeline_stage_seconds", 0.5, stage="stats")
+    metrics.observe("pipeline_stage_seconds", 2.0, stage="save")
+    return "result"
+
+def test_stages(instance_fixture):
+    metrics.observe("pipeline_flagger_seconds", 5.0, flagger="Null")
+    before = metrics.snapshot()
+    operation()
+    stages = instance_fixture.stages(before, metrics.snapshot())
+    assert stages == [("query", 0.5, 1),
+                      ("service-key resolution", 0.25, 1),
+                      ("flagger Null", 0.25, 2),
+                      ("duplicate check", 1.0, 1),
+                      ("reference statistics", 0.5, 1),
+                      ("save", 2.0, 1)]
+
+def test_run(tmp_path, instance_fixture):
+    assert instance_fixture.run("range", "--date-start=2020-01-01", operation) == "result"
+
+    files = sorted(os.listdir(str(tmp_path)))
+    assert len(files) == 2
+    assert files[0].startswith("profile-range-") and files[0].endswith(".pstats")
+    assert files[1] == files[0].replace(".pstats", ".txt")
+
+    stats = pstats.Stats(str(tmp_path / files[0]))
+    assert any(name == "operation" for _, _, name in stats.stats)
+    with open(str(tmp_path / files[1])) as f:
+        summary = f.read()
+    assert summary.startswith("Profile of: --date-start=2020-01-01\n")
+    assert "flagger Null                          0.250        2" in summary
+    assert "test_profiler.py" in summary
+
+def test_run_saves_on_error(tmp_path, instance_fixture):
+    def failing():
+        raise ValueError()
+    with pytest.raises(ValueError):
+        instance_fixture.run("daily", "--daily", failing)
+    assert len(os.listdir(str(tmp_path))) == 2
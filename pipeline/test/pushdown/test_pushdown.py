@@ -0,0 +1,92 @@
+import datetime
+import pytest
+import pandas
+from src.pushdown import Pushdown
+from src.tables import CTran_Data
+from src.tables import Flagged_Data
+from src.tables import Service_Periods
+from flaggers.flagger import flaggers, Flags
+
+@pytest.fixture
+def mock_config():
+    class Mock_Config:
+        def get_value(self, value):
+            if value == "unobserved_stop_distance":
+                return 60
+    return Mock_Config()
+
+@pytest.fixture
+def instance_fixture():
+    ctran = CTran_Data("sw23", "invalid", "localhost", "portal")
+    flagged = Flagged_Data("sw23", "invalid", "localhost", "hive")
+    service_periods = Service_Periods(engine=flagged.get_engine().url)
+    return Pushdown(ctran, flagged, service_periods)
+
+@pytest.fixture
+def mock_connection():
+    class mock_connection():
+        def __init__(self):
+            self.sql = None
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            self.sql = sql
+            return type('X', (object,), dict(rowcount=0))
+
+    return mock_connection()
+
+START = datetime.date(2020, 1, 1)
+END = datetime.date(2020, 1, 2)
+
+
+def test_compile(instance_fixture, mock_config):
+    expressions = dict(instance_fixture.compile(flaggers, mock_config))
+    assert expressions[int(Flags.UNOPENED_DOOR)] == "door = 0"
+    assert expressions[int(Flags.UNOBSERVED_STOP)] == "location_distance > 60.0"
+    assert expressions[int(Flags.DOOR_NULL)] == "door IS NULL"
+    # Duplicate is not a simple predicate.
+    assert int(Flags.DUPLICATE) not in expressions
+
+def test_flags_sql(instance_fixture):
+    expected = "".join([
+        "SELECT row_id, f.flag_id, service_date FROM aperture.ctran_data",
+        " CROSS JOIN LATERAL (VALUES (1, (door = 0)), (2, (door IS NULL)))",
+        " AS f(flag_id, flagged)",
+        " WHERE service_date BETWEEN '2020-01-01' AND '2020-01-02' AND f.flagged"])
+    expressions = [(1, "door = 0"), (2, "door IS NULL")]
+    assert instance_fixture._flags_sql(START, END, expressions) == expected
+
+def test_insert_date_range(mock_connection, instance_fixture):
+    instance_fixture._flagged.get_engine().connect = lambda: mock_connection
+    expressions = [(1, "door = 0")]
+    assert instance_fixture.insert_date_range(START, END, expressions) == True
+    assert mock_connection.sql == "".join([
+        "INSERT INTO hive.flagged_data (row_id, service_key, flag_id, service_date)",
+        " SELECT c.row_id, sp.service_key, c.flag_id, c.service_date FROM (",
+        instance_fixture._flags_sql(START, END, expressions), ") AS c",
+        " JOIN hive.service_periods AS sp",
+        " ON c.service_date BETWEEN sp.start_date AND sp.end_date",
+        " ON CONFLICT (row_id, flag_id, service_key) DO NOTHING;"])
+
+def test_insert_date_range_sqlalchemy_error(instance_fixture):
+    # Since the default engine is already terrible, no changes are needed.
+    assert instance_fixture.insert_date_range(START, END, [(1, "door = 0")]) == False
+
+def test_query_date_range(monkeypatch, instance_fixture):
+    expected = pandas.DataFrame({"row_id": [1], "flag_id": [2], "service_date": [START]})
+    def read_sql(sql, engine):
+        assert sql == instance_fixture._flags_sql(START, END, [(2, "door = 0")]) + ";"
+        assert engine is instance_fixture._ctran.get_engine()
+        return expected
+    monkeypatch.setattr("pandas.read_sql", read_sql)
+    assert instance_fixture.query_date_range(START, END, [(2, "door = 0")]) is expected
+
+def test_query_date_range_sqlalchemy_error(instance_fixture):
+    assert instance_fixture.query_date_range(START, END, [(1, "door = 0")]) is None
+
+def test_same_database(instance_fixture):
+    assert instance_fixture.same_database() == False
+    instance_fixture._ctran = CTran_Data("other", "invalid", "localhost", "hive")
+    assert instance_fixture.same_database() == True
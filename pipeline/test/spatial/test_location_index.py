@@ -0,0 +1,103 @@
+import numpy as np
+import pandas
+import pytest
+from src.spatial import LocationIndex
+
+# Feet per degree of latitude, as in LocationIndex.
+FEET = 364567.0
+
+@pytest.fixture
+def references():
+    return pandas.DataFrame({
+        "location_id": [30, 10, 20],
+        "x_coordinate": [-122.60, -122.68, -122.67],
+        "y_coordinate": [45.60, 45.52, 45.52],
+        "observations": [8, 12, 5],
+    })
+
+@pytest.fixture
+def instance_fixture(references):
+    index = LocationIndex()
+    index.build(references, 1000, "degrees")
+    return index
+
+def test_empty():
+    index = LocationIndex()
+    assert not index.loaded and len(index) == 0
+    assert np.isnan(index.reference_distance([10], [-122.68], [45.52])).all()
+    assert np.isinf(index.nearest_distance([-122.68], [45.52])).all()
+
+def test_build(instance_fixture):
+    assert instance_fixture.loaded and len(instance_fixture) == 3
+    assert list(instance_fixture._ids) == [10, 20, 30]
+
+def test_reference_distance(instance_fixture):
+    # 500 feet north of location 10, then location 20's own position, a
+    # location without a reference and a missing coordinate.
+    distance = instance_fixture.reference_distance(
+        pandas.Series([10, 20, 99, 10], dtype="Int32"),
+        pandas.Series([-122.68, -122.67, -122.68, None], dtype="float32"),
+        [45.52 + 500 / FEET, 45.52, 45.52, 45.52])
+    assert distance[0] == pytest.approx(500, rel=1e-3)
+    assert distance[1] == pytest.approx(0, abs=1)
+    assert np.isnan(distance[2:]).all()
+
+def test_nearest_distance(instance_fixture):
+    distance = instance_fixture.nearest_distance(
+        [-122.68, -122.67, -122.60, -122.64, None],
+        [45.52 + 300 / FEET, 45.52 - 900 / FEET, 45.60, 45.56, 45.56])
+    assert distance[0] == pytest.approx(300, rel=1e-3)
+    assert distance[1] == pytest.approx(900, rel=1e-3)
+    assert distance[2] == pytest.approx(0, abs=1)
+    # Miles from every reference.
+    assert np.isinf(distance[3])
+    assert np.isnan(distance[4])
+
+def test_nearest_distance_matches_brute_force():
+    rng = np.random.default_rng(7)
+    references = pandas.DataFrame({
+        "location_id": np.arange(500),
+        "x_coordinate": -122.6 + rng.uniform(-0.05, 0.05, 500),
+        "y_coordinate": 45.6 + rng.uniform(-0.05, 0.05, 500),
+    })
+    index = LocationIndex()
+    index.build(references, 1000, "degrees")
+    x = -122.6 + rng.uniform(-0.06, 0.06, 2000)
+    y = 45.6 + rng.uniform(-0.06, 0.06, 2000)
+
+    px, py = index._project(x, y)
+    brute = np.hypot(px[:, None] - index._x[None, :], py[:, None] - index._y[None, :]).min(axis=1)
+    brute[brute > 1000] = np.inf
+    assert np.allclose(index.nearest_distance(x, y), brute)
+
+def test_load(references):
+    class Mock_Table():
+        def __init__(self, references):
+            self.references = references
+        def query_references(self):
+            return self.references
+
+    index = LocationIndex()
+    assert index.load(Mock_Table(None), 1000) == False
+    assert not index.loaded
+    assert index.load(Mock_Table(references), 1000, "degrees") == True
+    assert len(index) == 3
+    assert index.reference_distance([10], [-122.68], [45.52 + 500 / FEET])[0] == pytest.approx(500, rel=1e-3)
+
+def test_build_feet():
+    # State plane feet are used as they are.
+    index = LocationIndex()
+    index.build(pandas.DataFrame({
+        "location_id": [10, 20],
+        "x_coordinate": [1100000.0, 1150000.0],
+        "y_coordinate": [100000.0, 150000.0],
+    }), 1000)
+    distance = index.reference_distance([10, 20], [1100300.0, 1150000.0], [100400.0, 150000.0])
+    assert distance == pytest.approx([500, 0])
+    assert index.nearest_distance([1100000.0], [100900.0])[0] == pytest.approx(900)
+
+def test_build_units():
+    with pytest.raises(ValueError):
+        LocationIndex().build(pandas.DataFrame({
+            "location_id": [10], "x_coordinate": [1.0], "y_coordinate": [1.0],
+        }), 1000, "meters")
@@ -0,0 +1,78 @@
+import time
+import pytest
+from src.stages import Stages
+
+@pytest.fixture
+def instance_fixture():
+    return Stages(queue_size=2)
+
+
+def test_read_and_write_in_order(instance_fixture):
+    written = []
+    write = instance_fixture.writer(lambda item, scale=1: written.append(item * scale))
+    for item in instance_fixture.read(range(10)):
+        write(item, scale=2)
+    assert instance_fixture.close() == True
+    assert written == [2 * i for i in range(10)]
+
+    stats = instance_fixture.stats()
+    assert [stats[stage]["items"] for stage in ["read", "flag", "write"]] == [10, 10, 10]
+
+def test_queues_are_bounded(instance_fixture):
+    # A slow writer backs up the flagging stage, and in turn the reader.
+    write = instance_fixture.writer(lambda item: time.sleep(0.01))
+    for item in instance_fixture.read(range(20)):
+        write(item)
+    assert instance_fixture.close() == True
+
+    stats = instance_fixture.stats()
+    assert stats["read"]["max_depth"] <= 2
+    assert stats["write"]["max_depth"] <= 2
+    assert stats["flag"]["wait"] > 0
+    assert stats["write"]["busy"] >= 0.2
+
+def test_read_error(instance_fixture):
+    def chunks():
+        yield 1
+        raise ValueError("lost connection")
+
+    assert list(instance_fixture.read(chunks())) == [1, None]
+    assert instance_fixture.close() == False
+
+def test_write_error_drops_later_writes(instance_fixture):
+    written = []
+    def write(item):
+        if item == 1:
+            raise ValueError("failed")
+        written.append(item)
+
+    queue_write = instance_fixture.writer(write)
+    for item in range(4):
+        queue_write(item)
+    assert instance_fixture.close() == False
+    assert written == [0]
+
+def test_write_returning_false_drops_later_writes(instance_fixture):
+    written = []
+    def write(item):
+        if item == 1:
+            return False
+        written.append(item)
+        return True
+
+    queue_write = instance_fixture.writer(write)
+    assert queue_write(0) == True
+    assert queue_write(1) == True
+    deadline = time.time() + 5
+    while instance_fixture._error is None and time.time() < deadline:
+        time.sleep(0.01)
+    # Once the failure is known, the caller is told to stop.
+    assert queue_write(2) == False
+    assert instance_fixture.close() == False
+    assert written == [0]
+
+def test_close_stops_blocked_reader(instance_fixture):
+    for item in instance_fixture.read(range(100)):
+        break
+    assert instance_fixture.close() == True
+    assert not instance_fixture._reader.is_alive()
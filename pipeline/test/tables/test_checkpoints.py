@@ -0,0 +1,108 @@
+import datetime
+import pytest
+from src.tables import Checkpoints, CTran_Data
+
+@pytest.fixture
+def instance_fixture():
+    return Checkpoints("sw23", "invalid", "localhost", "aperture")
+
+@pytest.fixture
+def mock_connection():
+    class mock_result():
+        def __init__(self, row):
+            self.row = row
+        def first(self):
+            return self.row
+        def __iter__(self):
+            return iter(self.row)
+
+    class mock_connection():
+        def __init__(self):
+            self.sql = None
+            self.row = None
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            self.sql = sql
+            return mock_result(self.row)
+
+    return mock_connection()
+
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "processing_checkpoints"
+
+def test_creation_sql(instance_fixture):
+    assert "service_date DATE PRIMARY KEY" in instance_fixture._creation_sql
+
+def test_write_sql(instance_fixture):
+    rows = [
+        [datetime.date(2020, 1, 1), "complete", 10, 0, 3,
+         datetime.datetime(2020, 1, 2, 3, 4, 5), datetime.datetime(2020, 1, 2, 3, 4, 6),
+         10, 42, "0123456789abcdef0123456789abcdef", "fedcba9876543210fedcba9876543210"],
+        [datetime.date(2020, 1, 2), "no_data", 0, 0, None, None, None, None, None, None, None],
+    ]
+    assert instance_fixture.write_sql(rows) == "".join([
+        "INSERT INTO hive.processing_checkpoints (service_date, status, ctran_rows,",
+        " skipped_rows, flag_rows, started_at, finished_at, source_rows, max_row_id,",
+        " source_hash, flagger_version) VALUES",
+        " ('2020-01-01', 'complete', 10, 0, 3, '2020-01-02 03:04:05', '2020-01-02 03:04:06',",
+        " 10, 42, '0123456789abcdef0123456789abcdef', 'fedcba9876543210fedcba9876543210'),",
+        " ('2020-01-02', 'no_data', 0, 0, NULL, NULL, NULL, NULL, NULL, NULL, NULL)",
+        " ON CONFLICT (service_date) DO UPDATE SET status = EXCLUDED.status,",
+        " ctran_rows = EXCLUDED.ctran_rows, skipped_rows = EXCLUDED.skipped_rows,",
+        " flag_rows = EXCLUDED.flag_rows, started_at = EXCLUDED.started_at,",
+        " finished_at = EXCLUDED.finished_at, source_rows = EXCLUDED.source_rows,",
+        " max_row_id = EXCLUDED.max_row_id, source_hash = EXCLUDED.source_hash,",
+        " flagger_version = EXCLUDED.flagger_version",
+        " WHERE hive.processing_checkpoints.status <> 'complete'",
+        " OR EXCLUDED.status = 'complete';"])
+
+def test_get_latest_day(mock_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_connection
+    assert instance_fixture.get_latest_day() is None
+    mock_connection.row = (datetime.date(2020, 1, 1),)
+    assert instance_fixture.get_latest_day() == datetime.date(2020, 1, 1)
+    assert mock_connection.sql == "".join([
+        "SELECT service_date FROM hive.processing_checkpoints",
+        " WHERE status = 'complete' ORDER BY service_date DESC LIMIT 1;"])
+
+def test_get_latest_day_sqlalchemy_error(instance_fixture):
+    assert instance_fixture.get_latest_day() is None
+
+def test_delete_date_range(mock_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_connection
+    assert instance_fixture.delete_date_range(datetime.date(2020, 1, 1), None) == True
+    assert mock_connection.sql == \
+        "DELETE FROM hive.processing_checkpoints WHERE service_date >= '2020-01-01';"
+
+def test_query_date_range(mock_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_connection
+    mock_connection.row = [(datetime.date(2020, 1, 1), "complete", 10, 0, 3, None, None,
+                            10, 42, "0123456789abcdef0123456789abcdef", "fedcba9876543210fedcba9876543210")]
+    stored = instance_fixture.query_date_range(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2))
+    assert mock_connection.sql == "".join([
+        "SELECT service_date, status, ctran_rows, skipped_rows, flag_rows, started_at,",
+        " finished_at, source_rows, max_row_id, source_hash, flagger_version",
+        " FROM hive.processing_checkpoints",
+        " WHERE service_date BETWEEN '2020-01-01' AND '2020-01-02';"])
+    assert list(stored) == [datetime.date(2020, 1, 1)]
+    assert stored[datetime.date(2020, 1, 1)]["status"] == "complete"
+    assert stored[datetime.date(2020, 1, 1)]["max_row_id"] == 42
+    assert stored[datetime.date(2020, 1, 1)]["flagger_version"] == "fedcba9876543210fedcba9876543210"
+
+def test_query_date_range_sqlalchemy_error(instance_fixture):
+    assert instance_fixture.query_date_range(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)) is None
+
+def test_fingerprint_date_range(mock_connection):
+    ctran = CTran_Data("sw23", "invalid", "localhost", "aperture")
+    ctran._engine.connect = lambda: mock_connection
+    mock_connection.row = [(datetime.date(2020, 1, 1), 10, 42, "0123456789abcdef0123456789abcdef")]
+    fingerprints = ctran.fingerprint_date_range(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2))
+    assert mock_connection.sql == "".join([
+        "SELECT service_date, COUNT(*), MAX(row_id),",
+        " md5(string_agg(md5(c::text), '' ORDER BY row_id)) FROM aperture.ctran_data AS c",
+        " WHERE service_date BETWEEN '2020-01-01' AND '2020-01-02' GROUP BY service_date;"])
+    assert fingerprints == {datetime.date(2020, 1, 1): (10, 42, "0123456789abcdef0123456789abcdef")}
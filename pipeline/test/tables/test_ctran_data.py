@@ -27,6 +27,10 @@ def dummy_engine():
 @pytest.fixture
 def custom_connect():
     class custom_connect():
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
         def execute(self, sql):
             global g_is_valid
             global g_expected
@@ -174,3 +178,33 @@ def test_create_table_helper_sqlalchemy_fail(custom_connect, instance_fixture):
     instance_fixture._engine.connect = custom_connect
     instance_fixture.create_schema = lambda: True
     assert instance_fixture.create_table() == False
+
+def test_dtypes_cover_expected_cols(instance_fixture):
+    assert sorted(instance_fixture._dtypes) == sorted(instance_fixture._expected_cols)
+
+def test_convert_types(instance_fixture):
+    df = pandas.read_csv("assets/ctran_ete_test.csv", parse_dates=["service_date"])
+    typed = instance_fixture._convert_types(df)
+    assert str(typed["door"].dtype) == "Int32"
+    assert str(typed["direction"].dtype) == "Int16"
+    assert str(typed["location_distance"].dtype) == "float32"
+    assert str(typed["service_key"].dtype) == "category"
+    assert typed["door"].isna().sum() == df["door"].isna().sum()
+    assert typed.memory_usage(deep=True).sum() < \
+           df.astype(object).memory_usage(deep=True).sum()
+
+def test_convert_types_falls_back(instance_fixture):
+    df = pandas.DataFrame({"door": ["not a number", None], "other": [1, 2]})
+    converted = instance_fixture._convert_types(df)
+    assert converted["door"].tolist() == ["not a number", None]
+
+def test_query_date_range_chunks_order(monkeypatch, instance_fixture):
+    import datetime
+    queried = []
+    monkeypatch.setattr(instance_fixture, "_query_table_chunks",
+                        lambda sql, chunksize: queried.append(sql))
+    instance_fixture.query_date_range_chunks(
+        datetime.date(2020, 1, 1), datetime.date(2020, 1, 2), 100)
+    assert queried == ["SELECT * FROM aperture.ctran_data"
+                       " WHERE service_date BETWEEN '2020-01-01' AND '2020-01-02'"
+                       " ORDER BY service_date, vehicle_number, trip_id, stop_time, row_id;"]
@@ -0,0 +1,133 @@
+import datetime
+import pytest
+import pandas
+import numpy as np
+from src.tables import Fingerprints
+
+@pytest.fixture
+def instance_fixture():
+    instance = Fingerprints("sw23", "invalid", "localhost", "aperture")
+    return instance
+
+@pytest.fixture
+def mock_raw_connection():
+    class mock_cursor():
+        def __init__(self, con):
+            self.con = con
+        def execute(self, sql):
+            self.con.sql.append(sql)
+        def copy_expert(self, sql, stream):
+            self.con.sql.append(sql)
+            self.con.copied = stream.read()
+        def fetchall(self):
+            return self.con.rows
+
+    class mock_raw_connection():
+        def __init__(self):
+            self.sql = []
+            self.copied = ""
+            self.rows = []
+            self.committed = False
+            self.closed = False
+        def cursor(self):
+            return mock_cursor(self)
+        def commit(self):
+            self.committed = True
+        def rollback(self):
+            return
+        def close(self):
+            self.closed = True
+
+    return mock_raw_connection()
+
+@pytest.fixture
+def fingerprints():
+    return pandas.Series(np.array([1, 2**64 - 1], dtype=np.uint64), index=[7, 8])
+
+@pytest.fixture
+def service_dates():
+    return pandas.Series(pandas.to_datetime(["2020-01-01", "2020-01-02"]), index=[7, 8])
+
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "row_fingerprints"
+
+def test_expected_cols(instance_fixture):
+    assert instance_fixture._expected_cols == ["fingerprint", "row_id", "service_date"]
+
+def test_creation_sql(instance_fixture):
+    assert "PRIMARY KEY (fingerprint, row_id)" in instance_fixture._creation_sql
+
+@pytest.fixture
+def frame(fingerprints, service_dates, instance_fixture):
+    return instance_fixture.frame(fingerprints, service_dates)
+
+def _stage_sql():
+    target = "hive.row_fingerprints"
+    staging = "staging_row_fingerprints"
+    return [
+        "".join(["CREATE TEMP TABLE ", staging, " (LIKE ", target, ") ON COMMIT DROP;"]),
+        "".join(["COPY ", staging, " (fingerprint, row_id, service_date) FROM STDIN WITH (FORMAT csv);"]),
+    ]
+
+def _merge_sql():
+    return "".join(["INSERT INTO hive.row_fingerprints (fingerprint, row_id, service_date) SELECT ",
+                    "fingerprint, row_id, service_date FROM staging_row_fingerprints",
+                    " ON CONFLICT (fingerprint, row_id) DO NOTHING;"])
+
+def test_frame(frame):
+    assert frame.columns.tolist() == ["fingerprint", "row_id", "service_date"]
+    # uint64 fingerprints are stored bit for bit as signed BIGINTs.
+    assert frame.values.tolist() == [[1, 7, datetime.date(2020, 1, 1)],
+                                     [-1, 8, datetime.date(2020, 1, 2)]]
+
+def test_match(mock_raw_connection, frame, instance_fixture):
+    mock_raw_connection.rows = [(3, datetime.date(2019, 12, 31), 7)]
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    matches = instance_fixture.match(frame)
+    assert matches.values.tolist() == [[3, datetime.date(2019, 12, 31), 7]]
+
+    # The rows are only looked up; they are indexed with their flags.
+    assert mock_raw_connection.sql == _stage_sql() + [
+        "".join(["SELECT i.row_id, i.service_date, s.row_id FROM hive.row_fingerprints AS i JOIN ",
+                 "staging_row_fingerprints AS s ON i.fingerprint = s.fingerprint WHERE i.row_id <> s.row_id;"]),
+    ]
+    assert mock_raw_connection.copied == "1,7,2020-01-01\n-1,8,2020-01-02\n"
+    assert mock_raw_connection.committed and mock_raw_connection.closed
+
+def test_match_bad_engine(frame, instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture.match(frame) is None
+
+def test_match_sqlalchemy_error(frame, instance_fixture):
+    # Since the default engine is already terrible, no changes are needed.
+    assert instance_fixture.match(frame) is None
+
+def test_merge_statement(mock_raw_connection, frame, instance_fixture):
+    statement = instance_fixture.merge_statement(frame)
+    assert mock_raw_connection.sql == []
+
+    statement(mock_raw_connection.cursor())
+    assert mock_raw_connection.sql == _stage_sql() + [_merge_sql()]
+    assert mock_raw_connection.copied == "1,7,2020-01-01\n-1,8,2020-01-02\n"
+    # Committing is left to the write the statement is part of.
+    assert not mock_raw_connection.committed
+
+def test_merge(mock_raw_connection, frame, instance_fixture):
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+    assert instance_fixture.merge(frame) == True
+    assert mock_raw_connection.sql == _stage_sql() + [_merge_sql()]
+    assert mock_raw_connection.committed and mock_raw_connection.closed
+
+def test_merge_bad_engine(frame, instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture.merge(frame) == False
+
+def test_merge_sqlalchemy_error(frame, instance_fixture):
+    assert instance_fixture.merge(frame) == False
+
+def test_delete_date_range_bad_engine(instance_fixture):
+    instance_fixture._engine = None
+    day = datetime.date(2020, 1, 1)
+    assert instance_fixture.delete_date_range(day, day) == False
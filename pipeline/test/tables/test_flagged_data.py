@@ -118,6 +118,16 @@ def test_process_dates(instance_fixture):
     assert instance_fixture._process_dates(datetime.datetime(2019, 12, 31, 0, 0)) == \
         (datetime.datetime(2019, 12, 31, 0, 0), datetime.datetime(2019, 12, 31, 0, 0))
 
+    assert instance_fixture._process_dates(datetime.date(2020, 1, 3), datetime.date(2020, 1, 2)) == \
+        (datetime.datetime(2020, 1, 2, 0, 0), datetime.datetime(2020, 1, 3, 0, 0))
+
+    assert instance_fixture._process_dates(datetime.date(2020, 1, 1), 20200101) == (None, None)
+
+def test_delete_date_range_dates(mock_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_connection
+    assert instance_fixture.delete_date_range(datetime.date(2020, 1, 2), datetime.date(2020, 1, 3)) == True
+    assert mock_connection.sql.endswith(" WHERE service_date BETWEEN '2020-01-02' AND '2020-01-03';")
+
 def test_create_view(monkeypatch, instance_fixture):
     class mock_connection():
         def __enter__(self):
@@ -141,3 +151,203 @@ def test_create_view(monkeypatch, instance_fixture):
     ])
     instance_fixture.create_view_for_flag(mock_flag.test)
     assert mock.sql == expected
+
+def test_write_table_uses_copy(instance_fixture):
+    calls = []
+    instance_fixture._copy_table = lambda df, conflict_columns, after_sql=None: calls.append("copy") or True
+    instance_fixture._write_table = lambda df, conflict_columns, after_sql=None: calls.append("insert") or True
+    data = [[1, 1, 1, "2020/1/1"]]
+
+    assert instance_fixture.write_table(data) == True
+    assert instance_fixture.write_table(data, use_copy=False) == True
+    assert calls == ["copy", "insert"]
+
+@pytest.fixture
+def bitmask_fixture():
+    return Flagged_Data("sw23", "invalid", "localhost", "aperture", storage="bitmask")
+
+def test_bitmask_table_name(bitmask_fixture):
+    assert bitmask_fixture._table_name == "flagged_bitmask"
+    assert bitmask_fixture._expected_cols == ["row_id", "service_key", "flags", "service_date"]
+
+def test_bitmask_create_table(bitmask_fixture):
+    executed = []
+    bitmask_fixture.create_schema = lambda: True
+
+    class mock_connection():
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            executed.append(sql)
+
+    bitmask_fixture._engine.connect = mock_connection
+    assert bitmask_fixture.create_table() == True
+    assert executed == [bitmask_fixture._creation_sql, bitmask_fixture._view_sql]
+    assert "VIEW hive.flagged_data AS" in bitmask_fixture._view_sql
+
+def test_bitmask_write_table(bitmask_fixture):
+    written = []
+    def custom_copy_table(df, conflict_columns, conflict_update, after_sql=None):
+        written.append((df, conflict_columns, conflict_update))
+        return True
+    bitmask_fixture._copy_table = custom_copy_table
+    data = [
+        [1, 1, 1, "2020/1/1"],
+        [1, 1, 3, "2020/1/1"],
+        [1, 1, 3, "2020/1/1"],
+        [2, 1, 30, "2020/1/1"],
+    ]
+
+    assert bitmask_fixture.write_table(data) == True
+    df, conflict_columns, conflict_update = written[0]
+    assert df.values.tolist() == [[1, 1, 0b101, "2020/1/1"], [2, 1, 1 << 29, "2020/1/1"]]
+    assert conflict_columns == ["service_key", "row_id"]
+    assert conflict_update == "flags = flagged_bitmask.flags | EXCLUDED.flags"
+
+def test_bitmask_reads_use_view(monkeypatch, bitmask_fixture):
+    import src.tables.table
+    sql = []
+    def read_sql(query, engine, index_col=None):
+        sql.append(query)
+        return pandas.DataFrame({"row_id": [1], "service_key": [1], "flag_id": [3],
+                                 "service_date": ["2020-01-01"]})
+    monkeypatch.setattr(src.tables.table.pandas, "read_sql", read_sql)
+
+    # The view's columns are checked, not the bitmask table's.
+    df = bitmask_fixture.query_by_flag_id(3, 10)
+    assert sql == ["SELECT * FROM hive.flagged_data WHERE flag_id = '3' LIMIT '10';"]
+    assert df is not None and df["flag_id"].tolist() == [3]
+    df = bitmask_fixture.query_by_row_id("service_periods", "1", "2020", "1")
+    assert sql[1].startswith("SELECT fd.* FROM hive.flagged_data AS fd, hive.service_periods AS sp WHERE")
+    assert df is not None and df["row_id"].tolist() == [1]
+
+def test_bitmask_delete_table(bitmask_fixture, recording_connection):
+    bitmask_fixture._engine.connect = lambda: recording_connection
+    assert bitmask_fixture.delete_table() == True
+    assert recording_connection.sql == ["DROP VIEW IF EXISTS hive.flagged_data;",
+                                        "DROP TABLE IF EXISTS hive.flagged_bitmask;"]
+
+def test_insert_select_sql(instance_fixture, bitmask_fixture):
+    select = "SELECT row_id, service_key, flag_id, service_date FROM x"
+    assert instance_fixture.insert_select_sql(select) == "".join([
+        "INSERT INTO hive.flagged_data (row_id, service_key, flag_id, service_date) ",
+        select, " ON CONFLICT (row_id, flag_id, service_key) DO NOTHING;"])
+    sql = bitmask_fixture.insert_select_sql(select)
+    assert sql.startswith("INSERT INTO hive.flagged_bitmask (row_id, service_key, flags, service_date)")
+    assert "bit_or(1::BIGINT << (flag_id - 1))" in sql
+    assert sql.endswith("DO UPDATE SET flags = flagged_bitmask.flags | EXCLUDED.flags;")
+
+@pytest.fixture
+def partitioned_fixture():
+    return Flagged_Data("sw23", "invalid", "localhost", "aperture", partitioning="month")
+
+@pytest.fixture
+def recording_connection():
+    class recording_connection():
+        def __init__(self):
+            self.sql = []
+            self.partitions = []
+            self.max_dates = {}
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def begin(self):
+            return self
+        def execute(self, sql):
+            self.sql.append(sql)
+            if sql.startswith("SELECT c.relname"):
+                return [(name,) for name in self.partitions]
+            if sql.startswith("SELECT MAX"):
+                value = self.max_dates.get(sql.split(".")[1].rstrip(";"))
+                return namedtuple("result", "first")(lambda: (value,))
+
+    return recording_connection()
+
+def test_partitioned_creation_sql(partitioned_fixture):
+    sql = partitioned_fixture._creation_sql
+    assert "PRIMARY KEY (flag_id, service_key, row_id, service_date)" in sql
+    assert sql.endswith(") PARTITION BY RANGE (service_date);")
+    assert partitioned_fixture._conflict_cols == ["row_id", "flag_id", "service_key", "service_date"]
+
+def test_partition_bounds(partitioned_fixture):
+    assert partitioned_fixture._partition_bounds(datetime.date(2020, 12, 15)) == \
+        ("flagged_data_p202012", datetime.date(2020, 12, 1), datetime.date(2021, 1, 1))
+    partitioned_fixture._partitioning = "day"
+    assert partitioned_fixture._partition_bounds(datetime.date(2020, 2, 29)) == \
+        ("flagged_data_p20200229", datetime.date(2020, 2, 29), datetime.date(2020, 3, 1))
+
+def test_create_partitions(recording_connection, partitioned_fixture):
+    partitioned_fixture._engine.connect = lambda: recording_connection
+    dates = ["2020/1/1", "2020/1/31", "2020/2/1"]
+
+    assert partitioned_fixture.create_partitions(dates) == True
+    assert recording_connection.sql == [
+        "CREATE TABLE IF NOT EXISTS hive.flagged_data_p202001 PARTITION OF hive.flagged_data"
+        " FOR VALUES FROM ('2020-01-01') TO ('2020-02-01');",
+        "CREATE TABLE IF NOT EXISTS hive.flagged_data_p202002 PARTITION OF hive.flagged_data"
+        " FOR VALUES FROM ('2020-02-01') TO ('2020-03-01');",
+    ]
+
+    # Partitions may have been dropped by another process since, so they
+    # are always created if they don't exist.
+    assert partitioned_fixture.create_partitions(dates) == True
+    assert recording_connection.sql[2:] == recording_connection.sql[:2]
+
+def test_create_partitions_unpartitioned(instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture.create_partitions(["2020/1/1"]) == True
+
+def test_delete_partitioned_range(recording_connection, partitioned_fixture):
+    recording_connection.partitions = [
+        "flagged_data_p202002", "flagged_data_p202001", "flagged_data_p202003", "other"]
+    partitioned_fixture._engine.connect = lambda: recording_connection
+
+    assert partitioned_fixture.delete_date_range("2020/1/1", "2020/2/10") == True
+    assert recording_connection.sql[1:] == [
+        "DROP TABLE hive.flagged_data_p202001;",
+        "DELETE FROM hive.flagged_data_p202002 WHERE service_date BETWEEN '2020-01-01' AND '2020-02-10';",
+    ]
+
+def test_get_latest_partitioned_day(recording_connection, partitioned_fixture):
+    recording_connection.partitions = ["flagged_data_p202001", "flagged_data_p202002"]
+    recording_connection.max_dates = {"flagged_data_p202001": datetime.date(2020, 1, 20)}
+    partitioned_fixture._engine.connect = lambda: recording_connection
+
+    assert partitioned_fixture.get_latest_day() == datetime.date(2020, 1, 20)
+    assert recording_connection.sql[1:] == [
+        "SELECT MAX(service_date) FROM hive.flagged_data_p202002;",
+        "SELECT MAX(service_date) FROM hive.flagged_data_p202001;",
+    ]
+
+def test_write_parquet(tmp_path, instance_fixture):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    rows = [[1, 1, 2, "2020/1/1"], [2, 1, 3, "2020/1/1"], [3, 2, 2, "2020/1/2"]]
+    assert instance_fixture.write_parquet(str(tmp_path), rows)
+    assert instance_fixture.write_parquet(str(tmp_path), [[4, 2, 5, "2020/1/2"]], append=True)
+
+    root = tmp_path / "flagged_data"
+    assert sorted(p.name for p in root.iterdir()) == [
+        "service_date=2020-01-01", "service_date=2020-01-02"]
+    assert len(list((root / "service_date=2020-01-02").iterdir())) == 2
+
+    df = pandas.read_parquet(str(root / "service_date=2020-01-02"))
+    assert sorted(df["row_id"]) == [3, 4]
+    part = next((root / "service_date=2020-01-01").iterdir())
+    columns = parquet.ParquetFile(str(part)).metadata.row_group(0)
+    encodings = dict((columns.column(i).path_in_schema, columns.column(i).encodings)
+                     for i in range(columns.num_columns))
+    assert "RLE_DICTIONARY" in encodings["flag_id"]
+    assert "RLE_DICTIONARY" not in encodings["row_id"]
+
+def test_write_parquet_replaces_partitions(tmp_path, instance_fixture):
+    pytest.importorskip("pyarrow")
+    assert instance_fixture.write_parquet(str(tmp_path), [[1, 1, 2, "2020/1/1"], [2, 1, 2, "2020/1/2"]])
+    assert instance_fixture.write_parquet(str(tmp_path), [[5, 1, 3, "2020/1/1"]])
+
+    df = pandas.read_parquet(str(tmp_path / "flagged_data"))
+    df = df.sort_values("row_id")
+    assert list(df["row_id"]) == [2, 5]
+    assert [str(date) for date in df["service_date"]] == ["2020-01-02", "2020-01-01"]
@@ -0,0 +1,67 @@
+import datetime
+import pandas
+import pytest
+from src.tables import Location_References, CTran_Data
+
+@pytest.fixture
+def instance_fixture():
+    return Location_References("sw23", "invalid", "localhost", "aperture")
+
+@pytest.fixture
+def mock_connection():
+    class mock_result():
+        def __init__(self, rows):
+            self.rows = rows
+        def fetchall(self):
+            return self.rows
+
+    class mock_connection():
+        def __init__(self):
+            self.sql = None
+            self.rows = []
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            self.sql = sql
+            return mock_result(self.rows)
+
+    return mock_connection()
+
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "location_references"
+
+def test_creation_sql(instance_fixture):
+    assert "location_id INTEGER PRIMARY KEY" in instance_fixture._creation_sql
+
+def test_write_table(monkeypatch, instance_fixture):
+    calls = []
+    monkeypatch.setattr(instance_fixture, "_copy_table",
+                        lambda *args: calls.append(args) or True)
+    references = pandas.DataFrame({"location_id": [1], "x_coordinate": [-122.6],
+                                   "y_coordinate": [45.6], "observations": [9]})
+    assert instance_fixture.write_table(references) == True
+    assert calls[0][1:] == (["location_id"],
+        "x_coordinate = EXCLUDED.x_coordinate, y_coordinate = EXCLUDED.y_coordinate,"
+        " observations = EXCLUDED.observations")
+
+def test_query_references(mock_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_connection
+    mock_connection.rows = [(1, -122.6, 45.6, 9)]
+    references = instance_fixture.query_references()
+    assert mock_connection.sql == "".join([
+        "SELECT location_id, x_coordinate, y_coordinate, observations",
+        " FROM hive.location_references;"])
+    assert references.values.tolist() == [[1, -122.6, 45.6, 9]]
+
+def test_query_location_references(mock_connection):
+    ctran = CTran_Data("sw23", "invalid", "localhost", "aperture")
+    ctran._engine.connect = lambda: mock_connection
+    mock_connection.rows = [(1, -122.6, 45.6, 9)]
+    references = ctran.query_location_references(
+        datetime.date(2020, 1, 1), datetime.date(2020, 3, 31), min_rows=3)
+    assert "WHERE service_date BETWEEN '2020-01-01' AND '2020-03-31'" in mock_connection.sql
+    assert mock_connection.sql.endswith(" GROUP BY location_id HAVING COUNT(*) >= 3;")
+    assert list(references.columns) == ["location_id", "x_coordinate", "y_coordinate", "observations"]
@@ -0,0 +1,64 @@
+import datetime
+import pandas
+import pytest
+from src.tables import Reference_Stats
+
+@pytest.fixture
+def instance_fixture():
+    return Reference_Stats("sw23", "invalid", "localhost", "aperture")
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "reference_stats"
+
+def test_creation_sql(instance_fixture):
+    assert "PRIMARY KEY (key_type, key_value, metric)" in instance_fixture._creation_sql
+    assert "hive.reference_stats_days" in instance_fixture._creation_sql
+
+def test_days_sql(instance_fixture):
+    days = [datetime.date(2020, 1, 1), pandas.Timestamp("2020-01-03")]
+    assert instance_fixture.days_sql(days) == "".join([
+        "INSERT INTO hive.reference_stats_days (service_date)",
+        " VALUES ('2020-01-01'), ('2020-01-03') ON CONFLICT (service_date) DO NOTHING;"])
+
+def test_merge_sql(instance_fixture):
+    assert instance_fixture.merge_sql() == "".join([
+        "observations = (hive.reference_stats.observations + EXCLUDED.observations),",
+        " mean = hive.reference_stats.mean + (EXCLUDED.mean - hive.reference_stats.mean)",
+        " * EXCLUDED.observations::float8",
+        " / (hive.reference_stats.observations + EXCLUDED.observations),",
+        " m2 = hive.reference_stats.m2 + EXCLUDED.m2",
+        " + (EXCLUDED.mean - hive.reference_stats.mean) * (EXCLUDED.mean - hive.reference_stats.mean)",
+        " * hive.reference_stats.observations::float8 * EXCLUDED.observations",
+        " / (hive.reference_stats.observations + EXCLUDED.observations),",
+        " sketch = ARRAY(SELECT COALESCE(a, 0) + COALESCE(b, 0)",
+        " FROM unnest(hive.reference_stats.sketch, EXCLUDED.sketch) AS s(a, b)),",
+        " last_date = GREATEST(hive.reference_stats.last_date, EXCLUDED.last_date)"])
+
+def test_write_table(monkeypatch, instance_fixture):
+    calls = []
+    monkeypatch.setattr(instance_fixture, "_copy_table",
+                        lambda *args: calls.append(args) or True)
+    stats = pandas.DataFrame({
+        "key_type": ["location_id"], "key_value": [1], "metric": ["dwell"],
+        "observations": [2], "mean": [15.0], "m2": [50.0],
+        "sketch": [[0, 2, 0]], "last_date": [pandas.Timestamp("2020-01-02")]})
+    assert instance_fixture.write_table(stats) == True
+    df, conflict_columns, update, after_sql = calls[0]
+    assert after_sql is None
+    assert df["sketch"].tolist() == ["{0,2,0}"]
+    assert str(df["last_date"][0]) == "2020-01-02"
+    assert conflict_columns == ["key_type", "key_value", "metric"]
+    assert update == instance_fixture.merge_sql()
+
+    # The days are recorded in the transaction of the stats.
+    days = [datetime.date(2020, 1, 2)]
+    assert instance_fixture.write_table(stats, days) == True
+    assert calls[1][3] == [instance_fixture.days_sql(days)]
+
+def test_query_days_bad_engine(instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture.query_days() is None
+
+def test_delete_table_bad_engine(instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture.delete_table() == False
@@ -102,3 +102,68 @@ def test_insert_one(instance_fixture):
                         " VALUES ('2019-01-10', '2019-05-09') RETURNING service_key;"])
 
     assert instance_fixture.insert_one(datetime(2019, 3, 1)) == expected
+
+@pytest.fixture
+def resolve_connection():
+    class mock_connection():
+        def __init__(self):
+            self.sql = []
+            self.periods = [(1, date(2019, 1, 10), date(2019, 5, 9))]
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            self.sql.append(sql)
+            if sql.startswith("SELECT"):
+                return list(self.periods)
+            inserted = (2, date(2019, 5, 10), date(2019, 9, 9))
+            self.periods.append(inserted)
+            return [inserted]
+
+    return mock_connection()
+
+def test_resolve(resolve_connection, instance_fixture):
+    instance_fixture.clear_cache()
+    instance_fixture._engine.connect = lambda: resolve_connection
+    dates = pandas.Series([date(2019, 3, 1), date(2019, 3, 1), None,
+                           datetime(2019, 6, 1), date(2019, 3, 2)],
+                          index=[5, 6, 7, 8, 9])
+
+    result = instance_fixture.resolve(dates)
+    assert list(result.index) == [5, 6, 7, 8, 9]
+    assert result[5] == 1 and result[6] == 1 and result[9] == 1
+    assert result[8] == 2
+    assert pandas.isna(result[7])
+
+    # One bulk SELECT and one bulk INSERT for all of the dates.
+    assert len(resolve_connection.sql) == 2
+    assert resolve_connection.sql[0] == "".join([
+        "SELECT service_key, start_date, end_date FROM ",
+        instance_fixture._schema, ".", instance_fixture._table_name,
+        " WHERE start_date <= '2019-06-01' AND end_date >= '2019-03-01';"])
+    assert resolve_connection.sql[1] == "".join([
+        "INSERT INTO ", instance_fixture._schema, ".", instance_fixture._table_name,
+        " (start_date, end_date) VALUES ('2019-05-10', '2019-09-09')",
+        " ON CONFLICT (start_date, end_date) DO NOTHING",
+        " RETURNING service_key, start_date, end_date;"])
+
+def test_resolve_is_cached(resolve_connection, instance_fixture):
+    instance_fixture.clear_cache()
+    instance_fixture._engine.connect = lambda: resolve_connection
+    dates = pandas.Series([date(2019, 3, 1)])
+    assert instance_fixture.resolve(dates)[0] == 1
+    assert len(resolve_connection.sql) == 1
+
+    # The cache is shared with other instances on the same database.
+    other = Service_Periods("sw23", "invalid", "localhost", "aperture")
+    other._engine.connect = lambda: resolve_connection
+    assert other.resolve(dates)[0] == 1
+    assert len(resolve_connection.sql) == 1
+    instance_fixture.clear_cache()
+
+def test_resolve_sqlalchemy_error(instance_fixture):
+    # Since the default engine is already terrible, no changes are needed.
+    instance_fixture.clear_cache()
+    result = instance_fixture.resolve(pandas.Series([date(2019, 3, 1)]))
+    assert result.isna().all()
@@ -72,6 +72,10 @@ def custom_read_sql(sample_df, instance_fixture):
 @pytest.fixture
 def custom_connect():
     class custom_connect():
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
         def execute(self, sql):
             global g_is_valid
             global g_expected
@@ -273,3 +277,151 @@ def test_write_table(monkeypatch, instance_fixture):
 
     instance_fixture._write_table(df, conflict_columns=conflict_columns)
     assert mock.sql == expected
+
+@pytest.fixture
+def mock_raw_connection():
+    class mock_cursor():
+        def __init__(self, con):
+            self.con = con
+        def execute(self, sql):
+            self.con.sql.append(sql)
+        def copy_expert(self, sql, stream):
+            self.con.sql.append(sql)
+            data = stream.read(7)
+            while data:
+                self.con.copied += data
+                data = stream.read(7)
+
+    class mock_raw_connection():
+        def __init__(self):
+            self.sql = []
+            self.copied = ""
+            self.committed = False
+            self.closed = False
+        def cursor(self):
+            return mock_cursor(self)
+        def commit(self):
+            self.committed = True
+        def rollback(self):
+            return
+        def close(self):
+            self.closed = True
+
+    return mock_raw_connection()
+
+def test_copy_table(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1", "col2"]
+    instance_fixture._copy_chunksize = 1
+    df = pandas.DataFrame([[1, 2], [3, None]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    assert instance_fixture._copy_table(df, conflict_columns=["col1"]) == True
+
+    target = "".join([instance_fixture._schema, ".", instance_fixture._table_name])
+    staging = "".join(["staging_", instance_fixture._table_name])
+    assert mock_raw_connection.sql == [
+        "".join(["CREATE TEMP TABLE ", staging, " (LIKE ", target,
+                 " INCLUDING DEFAULTS) ON COMMIT DROP;"]),
+        "".join(["COPY ", staging, " (col1, col2) FROM STDIN WITH (FORMAT csv);"]),
+        "".join(["INSERT INTO ", target, " (col1, col2) SELECT col1, col2 FROM ",
+                 staging, " ON CONFLICT (col1) DO NOTHING;"]),
+    ]
+    assert mock_raw_connection.copied == "1,2.0\n3,\n"
+    assert mock_raw_connection.committed and mock_raw_connection.closed
+
+def test_copy_table_after_sql(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1"]
+    df = pandas.DataFrame([[1]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    assert instance_fixture._copy_table(df, after_sql=["SELECT 1;"]) == True
+    assert mock_raw_connection.sql[-1] == "SELECT 1;"
+    assert mock_raw_connection.committed
+
+def test_copy_table_after_sql_function(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1"]
+    df = pandas.DataFrame([[1]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    def after(cursor):
+        assert not mock_raw_connection.committed
+        cursor.execute("SELECT 2;")
+
+    assert instance_fixture._copy_table(df, after_sql=["SELECT 1;", after]) == True
+    assert mock_raw_connection.sql[-2:] == ["SELECT 1;", "SELECT 2;"]
+    assert mock_raw_connection.committed
+
+def test_copy_table_after_sql_function_error(mock_raw_connection, instance_fixture):
+    import psycopg2
+    instance_fixture._expected_cols = ["col1"]
+    df = pandas.DataFrame([[1]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    def after(cursor):
+        raise psycopg2.Error("failed")
+
+    # The rows are only committed with the work of every after_sql function.
+    assert instance_fixture._copy_table(df, after_sql=[after]) == False
+    assert not mock_raw_connection.committed
+
+def test_copy_table_no_conflict_columns(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1"]
+    df = pandas.DataFrame([[1]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    assert instance_fixture._copy_table(df) == True
+    assert mock_raw_connection.sql[-1].endswith(" FROM staging_fake;")
+
+def test_copy_table_bad_engine(sample_df, instance_fixture):
+    instance_fixture._engine = None
+    assert instance_fixture._copy_table(sample_df) == False
+
+def test_copy_table_sqlalchemy_error(sample_df, instance_fixture):
+    # Since the default engine is already terrible, no changes are needed.
+    assert instance_fixture._copy_table(sample_df) == False
+
+@pytest.fixture
+def mock_stream_connection():
+    class mock_connection():
+        def __init__(self):
+            self.options = None
+            self.closed = False
+        def execution_options(self, **options):
+            self.options = options
+            return self
+        def close(self):
+            self.closed = True
+
+    return mock_connection()
+
+def test_query_table_chunks(monkeypatch, sample_df, mock_stream_connection, instance_fixture):
+    def read_sql(sql, con, index_col, chunksize):
+        assert con.options == {"stream_results": True}
+        return iter([sample_df, sample_df])
+
+    mock = mock_stream_connection
+    instance_fixture._engine.connect = lambda: mock
+    monkeypatch.setattr("pandas.read_sql", read_sql)
+
+    chunks = list(instance_fixture._query_table_chunks("SELECT", 1))
+    assert len(chunks) == 2
+    assert all(isinstance(chunk, pandas.DataFrame) for chunk in chunks)
+    assert mock.closed
+
+def test_query_table_chunks_mismatch_cols(monkeypatch, sample_df, mock_stream_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_stream_connection
+    monkeypatch.setattr("pandas.read_sql",
+                        lambda sql, con, index_col, chunksize: iter([sample_df]))
+    instance_fixture._expected_cols = ["other"]
+    assert list(instance_fixture._query_table_chunks("SELECT", 1)) == [None]
+    assert mock_stream_connection.closed
+
+def test_query_table_chunks_sqlalchemy_error(instance_fixture):
+    # Since the default engine is already terrible, no changes are needed.
+    assert list(instance_fixture._query_table_chunks("SELECT", 1)) == [None]
+
+def test_conflict_sql(instance_fixture):
+    assert instance_fixture._conflict_sql(None) == ";"
+    assert instance_fixture._conflict_sql(["a", "b"]) == " ON CONFLICT (a, b) DO NOTHING;"
+    assert instance_fixture._conflict_sql(["a"], "b = EXCLUDED.b") == \
+        " ON CONFLICT (a) DO UPDATE SET b = EXCLUDED.b;"
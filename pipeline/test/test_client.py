@@ -1,5 +1,8 @@
+import datetime
 import pytest
+import pandas
 from src.client import _Client
+from src.tables import Flagged_Data
 
 @pytest.fixture
 def mock_config():
@@ -28,8 +31,16 @@ def mock_config():
 
 @pytest.fixture
 def instance_fixture(mock_config):
+    class Mock_Migrator():
+        def __init__(self):
+            self.runs = 0
+        def migrate(self):
+            self.runs += 1
+            return True
+
     client_instance = _Client(read_env_data=False)
     client_instance.config = mock_config
+    client_instance.migrator = Mock_Migrator()
     return client_instance
 
 
@@ -50,5 +61,818 @@ def test_create_hive(instance_fixture):
     instance_fixture.flags = custom
     instance_fixture.service_periods = custom
     instance_fixture.flagged = custom
+    instance_fixture.fingerprints = custom
+    instance_fixture.checkpoints = custom
+    instance_fixture.location_references = custom
+    instance_fixture.reference_stats = custom
     instance_fixture.create_hive()
-    assert custom.value == 3
+    assert custom.value == 7
+
+def test_flag_data_matches_row_wise(instance_fixture):
+    import datetime
+    import pandas
+    from flaggers.flagger import flaggers
+
+    columns = ["service_date", "vehicle_number", "door", "location_distance"]
+    rows = [
+        [datetime.date(2020, 1, 1), 1, 1, 0.0],
+        [datetime.date(2020, 1, 1), None, 0, 666.0],
+        [datetime.date(2020, 1, 2), 3, None, None],
+    ]
+    df = pandas.DataFrame(rows, columns=columns, index=[7, 8, 9])
+    df = df.astype(object).where(df.notnull(), None)
+    service_keys = pandas.Series([1, 1, 2], index=df.index)
+
+    frame_rows, duplicate = instance_fixture._flag_data(df, service_keys)
+    assert duplicate is not None and duplicate.name == "Duplicate"
+
+    dates = pandas.Series(["2020/1/1", "2020/1/1", "2020/1/2"], index=df.index)
+    row_flaggers = [f for f in flaggers if f.name != "Duplicate"]
+    legacy_rows = instance_fixture._flag_rows(df, service_keys, dates, row_flaggers)
+
+    assert len(frame_rows) > 0
+    assert sorted(map(tuple, frame_rows)) == sorted(map(tuple, legacy_rows))
+
+@pytest.fixture
+def chunked_client(monkeypatch, instance_fixture):
+    import datetime
+    import pandas
+    from src.config import config
+
+    def make_chunk(index, door):
+        df = pandas.DataFrame({
+            "service_date": [datetime.date(2020, 1, 1)] * len(index),
+            "door": door,
+        }, index=index)
+        return df.astype(object)
+
+    class Mock_CTran():
+        def __init__(self):
+            self.chunks = [make_chunk([1, 2], [0, 1]), make_chunk([3], [0])]
+        def query_date_range_chunks(self, start_date, end_date, chunksize):
+            for chunk in self.chunks:
+                yield chunk
+        def fingerprint_date_range(self, date_from, date_to):
+            return {datetime.date(2020, 1, 1): (3, 3, "0123456789abcdef0123456789abcdef")}
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1, index=dates.index)
+
+    saved = []
+    instance_fixture.saved_checkpoints = []
+    # The numbers of the saves that fail.
+    instance_fixture.failed_saves = set()
+    def save_output(rows, keys, append=False, checkpoint=None, fingerprints=None):
+        if len(saved) in instance_fixture.failed_saves:
+            saved.append(None)
+            return False
+        saved.append((list(rows), append))
+        if checkpoint is not None:
+            instance_fixture.saved_checkpoints.append(checkpoint)
+        return True
+
+    monkeypatch.setitem(config._data, "chunksize", 2)
+    instance_fixture.ctran = Mock_CTran()
+    instance_fixture.service_periods = Mock_Service_Periods()
+    instance_fixture._save_output = save_output
+    return instance_fixture, saved
+
+def test_process_data_chunks(monkeypatch, chunked_client):
+    from flaggers.flagger import Flags, flaggers, flagger_version
+    from src.config import config
+    client, saved = chunked_client
+    monkeypatch.setitem(config._data, "day_fingerprints", True)
+
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    assert [append for _, append in saved] == [False, True]
+    first, second = [rows for rows, _ in saved]
+    assert [1, 1, int(Flags.UNOPENED_DOOR), "2020/1/1"] in first
+    assert not any(row[0] == 2 for row in first)
+    assert [3, 1, int(Flags.UNOPENED_DOOR), "2020/1/1"] in second
+
+    # Only the last chunk carries the checkpoint, counting both chunks.
+    assert len(client.saved_checkpoints) == 1
+    [[date, status, ctran_rows, skipped_rows, flag_rows, _, _,
+      source_rows, max_row_id, source_hash, version]] = client.saved_checkpoints[0]
+    assert (date, status, ctran_rows, skipped_rows) == (datetime.date(2020, 1, 1), "complete", 3, 0)
+    assert flag_rows == len(first) + len(second)
+    # With the fingerprint of the day's rows taken before they were read.
+    assert (source_rows, max_row_id, source_hash) == (3, 3, "0123456789abcdef0123456789abcdef")
+    assert version == flagger_version(flaggers, config)
+
+def test_process_data_chunk_error(chunked_client):
+    client, saved = chunked_client
+    client.ctran.chunks.append(None)
+    assert client.process_data("2020/01/01", "2020/01/01") == False
+    # The chunks read are still saved, without a complete checkpoint.
+    assert [append for _, append in saved] == [False, True, True]
+    assert [row[1] for row in client.saved_checkpoints[0]] == ["failed"]
+
+def test_process_data_save_error(chunked_client):
+    client, saved = chunked_client
+    client.failed_saves = set([0])
+    assert client.process_data("2020/01/01", "2020/01/01") == False
+    # Once the first chunk's flags fail to save, the last chunk is not saved
+    # with a complete checkpoint; the day is checkpointed as failed.
+    assert saved == [None, ([], True)]
+    assert [row[1] for row in client.saved_checkpoints[0]] == ["failed"]
+
+def test_process_data_staged_save_error(monkeypatch, chunked_client):
+    from src.config import config
+    client, saved = chunked_client
+    monkeypatch.setitem(config._data, "staged_pipeline", True)
+    client.failed_saves = set([0])
+    assert client.process_data("2020/01/01", "2020/01/01") == False
+    # The writer drops the saves after the failed one, as in the sequential
+    # mode, and the day is checkpointed as failed.
+    assert saved == [None, ([], True)]
+    assert [row[1] for row in client.saved_checkpoints[0]] == ["failed"]
+
+def test_process_data_staged(monkeypatch, chunked_client):
+    from src.config import config
+    client, saved = chunked_client
+    monkeypatch.setitem(config._data, "staged_pipeline", True)
+    monkeypatch.setitem(config._data, "stage_queue_size", 1)
+
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    staged = list(saved)
+    del saved[:]
+    monkeypatch.setitem(config._data, "staged_pipeline", False)
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    # The same saves, in the same order, as the sequential mode.
+    assert staged == saved
+    assert client.stage_stats["read"]["items"] == 2
+    assert client.stage_stats["write"]["items"] == 2
+
+def test_process_data_migrates_once(chunked_client):
+    client, saved = chunked_client
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    assert client.migrator.runs == 1
+
+def test_process_data_migration_error(chunked_client):
+    client, saved = chunked_client
+    client.migrator.migrate = lambda: False
+    # Nothing is flagged into a Hive that cannot take the checkpoints.
+    assert client.process_data("2020/01/01", "2020/01/01") == False
+    assert client.reprocess("2020/01/01", "2020/01/01") == False
+    assert saved == []
+
+def test_process_data_trip_across_chunks(chunked_client):
+    import datetime
+    import pandas
+    from flaggers.flagger import Flags
+    client, saved = chunked_client
+
+    # Read in trip order: trip 8 starts in the first chunk and, at its
+    # second stop in the next one, arrives before its first.
+    def make_chunk(index, trip_ids, stop_times, arrive_times):
+        return pandas.DataFrame({
+            "service_date": [datetime.date(2020, 1, 1)] * len(index),
+            "vehicle_number": [1] * len(index),
+            "trip_id": trip_ids,
+            "stop_time": stop_times,
+            "arrive_time": arrive_times,
+        }, index=index)
+    client.ctran.chunks = [make_chunk([1, 2], [7, 8], [100, 300], [100, 310]),
+                           make_chunk([3, 4], [8, 8], [400, 500], [290, 500])]
+
+    assert client.process_data("2020/01/01", "2020/01/01") == True
+    regressions = [row[0] for rows, _ in saved for row in rows
+                   if row[2] == int(Flags.ARRIVE_TIME_REGRESSION)]
+    assert regressions == [3]
+    # Trip 8 is flagged whole with the second chunk.
+    assert [append for _, append in saved] == [False, True]
+    assert client.saved_checkpoints[0][0][2] == 4
+
+def test_whole_trips(instance_fixture):
+    import pandas
+
+    def make_chunk(index, trip_ids):
+        return pandas.DataFrame({
+            "service_date": pandas.to_datetime(["2020-01-01"] * len(index)),
+            "vehicle_number": [1] * len(index),
+            "trip_id": trip_ids,
+        }, index=index)
+    chunks = [make_chunk([1, 2], [7, 8]), make_chunk([3, 4], [8, 8]),
+              make_chunk([5, 6], [8, None]), make_chunk([7], [None])]
+    regrouped = [list(df.index) for df in instance_fixture._whole_trips(chunks)]
+    assert regrouped == [[1], [2, 3, 4, 5], [6, 7]]
+
+    chunks = [make_chunk([1, 2], [7, 8]), None]
+    regrouped = list(instance_fixture._whole_trips(chunks))
+    assert list(regrouped[0].index) == [1] and regrouped[1] is None
+
+def test_process_data_checkpoints_empty_days(chunked_client):
+    client, saved = chunked_client
+    client.ctran.chunks = [client.ctran.chunks[0].assign(door=[1, 2])]
+    assert client.process_data("2020/01/01", "2020/01/02") == True
+    # No flags still completes a day with rows; a day without rows is not.
+    statuses = [(row[0], row[1], row[4]) for row in client.saved_checkpoints[0]]
+    assert statuses == [(datetime.date(2020, 1, 1), "complete", 0),
+                        (datetime.date(2020, 1, 2), "no_data", 0)]
+
+def test_save_output_checkpoint(instance_fixture):
+    writes = []
+    class Mock_Flagged():
+        def write_table(self, rows, after_sql=None):
+            writes.append(("flagged", rows, after_sql))
+            return rows != "fail"
+    class Mock_Checkpoints():
+        def write_sql(self, rows):
+            return "checkpoint sql"
+        def write_table(self, rows):
+            writes.append(("checkpoints", rows, None))
+            return True
+
+    instance_fixture._output_type = "aperture"
+    instance_fixture.flagged = Mock_Flagged()
+    instance_fixture.checkpoints = Mock_Checkpoints()
+    checkpoint = [[datetime.date(2020, 1, 1), "complete", 1, 0, 0, None, None]]
+    assert instance_fixture._save_output([[1, 1, 1, "2020/1/1"]], [], checkpoint=checkpoint) == True
+    assert instance_fixture._save_output([], [], append=True, checkpoint=checkpoint) == True
+    assert instance_fixture._save_output([], [], append=True) == True
+    assert writes == [("flagged", [[1, 1, 1, "2020/1/1"]], ["checkpoint sql"]),
+                      ("checkpoints", checkpoint, None)]
+    assert instance_fixture._save_output("fail", [], append=True, checkpoint=checkpoint) == False
+
+def test_get_latest_day(instance_fixture):
+    class Mock_Table():
+        def __init__(self, day):
+            self.day = day
+        def get_latest_day(self):
+            return self.day
+
+    instance_fixture.checkpoints = Mock_Table(datetime.date(2020, 1, 2))
+    instance_fixture.flagged = Mock_Table(datetime.date(2020, 1, 1))
+    assert instance_fixture._get_latest_day() == datetime.date(2020, 1, 2)
+    instance_fixture.checkpoints = Mock_Table(None)
+    assert instance_fixture._get_latest_day() == datetime.date(2020, 1, 1)
+
+@pytest.fixture
+def backfill_client(monkeypatch, instance_fixture):
+    import src.client
+
+    class Mock_Future():
+        def __init__(self, fn, args):
+            self.fn = fn
+            self.args = args
+            self.cancelled = False
+        def result(self):
+            return self.fn(*self.args)
+        def cancel(self):
+            self.cancelled = True
+
+    class Mock_Executor():
+        def __init__(self, **kwargs):
+            self.submitted = []
+        def submit(self, fn, *args):
+            self.submitted.append(args[0])
+            return Mock_Future(fn, args)
+        def shutdown(self, wait=True):
+            return
+
+    # Day 3 fails; every other day has one flag for row_id == day.
+    def backfill_day(date):
+        if date.day == 3:
+            return None, [], {}, None
+        return 1, [([[date.day, 1, 1, str(date)]], [], None, None)], {}, None
+
+    saved = []
+    monkeypatch.setattr(src.client, "ProcessPoolExecutor", Mock_Executor)
+    monkeypatch.setattr(src.client, "_backfill_day", backfill_day)
+    instance_fixture._save_output = lambda rows, keys, append=False, checkpoint=None, fingerprints=None: \
+        saved.extend(row[0] for row in rows) or True
+    return instance_fixture, saved
+
+def test_parallel_backfill(backfill_client):
+    import datetime
+    client, saved = backfill_client
+    start_date = datetime.date(2020, 1, 4)
+    end_date = datetime.date(2020, 1, 8)
+    assert client._parallel_backfill(start_date, end_date, 2) == True
+    assert saved == [4, 5, 6, 7, 8]
+
+def test_parallel_backfill_save_error(backfill_client):
+    import datetime
+    client, saved = backfill_client
+    save_output = client._save_output
+    client._save_output = lambda rows, keys, append=False, checkpoint=None, fingerprints=None: \
+        rows[0][0] != 5 and save_output(rows, keys, append, checkpoint)
+    assert client._parallel_backfill(datetime.date(2020, 1, 4), datetime.date(2020, 1, 8), 2) == False
+    assert saved == [4]
+
+def test_parallel_backfill_skipped(backfill_client):
+    import datetime
+    client, saved = backfill_client
+    start_date = datetime.date(2020, 1, 4)
+    end_date = datetime.date(2020, 1, 8)
+    skipped = set([datetime.date(2020, 1, 5), datetime.date(2020, 1, 6)])
+    assert client._parallel_backfill(start_date, end_date, 2, skipped) == True
+    assert saved == [4, 7, 8]
+
+def test_parallel_backfill_stops_at_failure(backfill_client):
+    import datetime
+    client, saved = backfill_client
+    start_date = datetime.date(2020, 1, 1)
+    end_date = datetime.date(2020, 1, 6)
+    assert client._parallel_backfill(start_date, end_date, 2) == False
+    # Days after the failed one are never saved, even if they finished.
+    assert saved == [1, 2]
+
+def test_process_range_pushdown(monkeypatch, chunked_client):
+    import datetime
+    import pandas
+    from src.config import config
+    from flaggers.flagger import Flags
+    client, saved = chunked_client
+
+    class Mock_Pushdown():
+        def compile(self, flagger_list, config):
+            return [(int(Flags.UNOPENED_DOOR), "door = 0")]
+        def same_database(self):
+            return False
+        def query_date_range(self, start_date, end_date, expressions):
+            return pandas.DataFrame({
+                "row_id": [1, 3],
+                "flag_id": [int(Flags.UNOPENED_DOOR)] * 2,
+                "service_date": [datetime.date(2020, 1, 1)] * 2})
+
+    monkeypatch.setitem(config._data, "sql_pushdown", True)
+    # Rows 1 and 3 would be duplicates across the chunks.
+    monkeypatch.setitem(config._data, "duplicate_index", False)
+    client.pushdown = Mock_Pushdown()
+    start_date = datetime.date(2020, 1, 1)
+
+    assert client._process_range(start_date, start_date, False, client._save_output) == 3
+    # The pushed down flags are saved first, then only the flaggers that
+    # can't be pushed down (Duplicate) run over the chunks.
+    pushed, append = saved[0]
+    assert append == False
+    assert pushed == [[1, 1, int(Flags.UNOPENED_DOOR), "2020/1/1"],
+                      [3, 1, int(Flags.UNOPENED_DOOR), "2020/1/1"]]
+    assert all(rows == [] for rows, _ in saved[1:])
+    assert all(append for _, append in saved[1:])
+
+def test_flag_duplicates_across_runs(monkeypatch, instance_fixture):
+    import datetime
+    import pandas
+    from src.config import config
+    from flaggers.flagger import flaggers, Flags
+
+    class Mock_Fingerprints():
+        def __init__(self):
+            self.seen = {}
+        def frame(self, fingerprints, service_dates):
+            return pandas.DataFrame({
+                "fingerprint": fingerprints.values.view("int64"),
+                "row_id": fingerprints.index,
+                "service_date": pandas.to_datetime(service_dates).dt.date.values})
+        def match(self, df):
+            rows = [[row_id, date, match_row_id]
+                    for match_row_id, fingerprint in zip(df["row_id"], df["fingerprint"])
+                    for row_id, (seen, date) in self.seen.items()
+                    if seen == fingerprint and row_id != match_row_id]
+            return pandas.DataFrame(rows, columns=["row_id", "service_date", "match_row_id"])
+        def merge(self, df):
+            for row in df.itertuples():
+                self.seen[row.row_id] = (row.fingerprint, row.service_date)
+            return True
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1, index=dates.index)
+
+    def make_day(index, day, doors):
+        df = pandas.DataFrame({
+            "service_date": pandas.Timestamp(day),
+            "door": pandas.array(doors, dtype="Int32"),
+        }, index=index)
+        df.index.name = "row_id"
+        return df
+
+    monkeypatch.setitem(config._data, "duplicate_index", True)
+    instance_fixture.fingerprints = Mock_Fingerprints()
+    instance_fixture.service_periods = Mock_Service_Periods()
+    duplicate = [f for f in flaggers if f.name == "Duplicate"][0]
+
+    first, first_indexed = instance_fixture._flag_duplicates(
+        make_day([1, 2], datetime.date(2020, 1, 1), [3, 4]), duplicate)
+    assert first == []
+    assert sorted(first_indexed["row_id"]) == [1, 2]
+
+    # Row 3 duplicates row 1 of the previous chunk, which is not saved, so not
+    # in the index, yet; rows 4 and 5 duplicate each other.
+    second, second_indexed = instance_fixture._flag_duplicates(
+        make_day([3, 4, 5], datetime.date(2020, 1, 1), [3, 5, 5]), duplicate)
+    assert instance_fixture.fingerprints.seen == {}
+    assert sorted(row[0] for row in second) == [1, 3, 4, 5]
+    assert all(row[2] == Flags.DUPLICATE and row[3] == "2020/1/1" for row in second)
+
+    # Once saved, the chunks are found in the index by later runs.
+    for indexed in [first_indexed, second_indexed]:
+        instance_fixture.fingerprints.merge(indexed)
+        instance_fixture._unsaved_fingerprints.remove(indexed)
+    assert instance_fixture._unsaved_fingerprints.frames() == []
+    third, _ = instance_fixture._flag_duplicates(
+        make_day([6], datetime.date(2020, 1, 1), [4]), duplicate)
+    assert sorted(row[0] for row in third) == [2, 6]
+
+def test_flag_duplicates_index_unavailable(monkeypatch, instance_fixture):
+    import pandas
+    from src.config import config
+    from flaggers.flagger import flaggers
+
+    class Mock_Fingerprints():
+        def frame(self, fingerprints, service_dates):
+            return pandas.DataFrame({
+                "fingerprint": fingerprints.values.view("int64"),
+                "row_id": fingerprints.index,
+                "service_date": pandas.to_datetime(service_dates).dt.date.values})
+        def match(self, df):
+            return None
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1, index=dates.index)
+
+    monkeypatch.setitem(config._data, "duplicate_index", True)
+    instance_fixture.fingerprints = Mock_Fingerprints()
+    instance_fixture.service_periods = Mock_Service_Periods()
+    duplicate = [f for f in flaggers if f.name == "Duplicate"][0]
+    df = pandas.DataFrame({"service_date": pandas.Timestamp("2020-01-01"),
+                           "door": [1, 1, 2]}, index=[1, 2, 3])
+
+    rows, _ = instance_fixture._flag_duplicates(df, duplicate)
+    assert sorted(row[0] for row in rows) == [1, 2]
+
+def test_save_output_indexes_fingerprints_with_flags(instance_fixture):
+    class Mock_Flagged():
+        def __init__(self):
+            self.result = False
+            self.after_sql = None
+        def write_table(self, rows, after_sql=None):
+            self.after_sql = after_sql
+            return self.result
+
+    class Mock_Fingerprints():
+        def merge_statement(self, df):
+            return "merge"
+        def merge(self, df):
+            return True
+
+    indexed = pandas.DataFrame({"fingerprint": [1], "row_id": [1],
+                                "service_date": [datetime.date(2020, 1, 1)]})
+    instance_fixture._output_type = "aperture"
+    instance_fixture.flagged = Mock_Flagged()
+    instance_fixture.fingerprints = Mock_Fingerprints()
+    instance_fixture._unsaved_fingerprints.add(indexed)
+    rows = [[1, 1, 1, "2020/1/1"]]
+
+    # A chunk that failed to save stays unsaved, and out of the index.
+    assert not instance_fixture._save_output(rows, [], fingerprints=indexed)
+    assert instance_fixture.flagged.after_sql == ["merge"]
+    assert len(instance_fixture._unsaved_fingerprints.frames()) == 1
+
+    instance_fixture.flagged.result = True
+    assert instance_fixture._save_output(rows, [], fingerprints=indexed)
+    assert instance_fixture._unsaved_fingerprints.frames() == []
+
+def test_parallel_backfill_index_duplicates(backfill_client):
+    client, saved = backfill_client
+
+    # The rows of a day are looked up in the index by the parent, just before
+    # the day is saved.
+    class Mock_Fingerprints():
+        def match(self, df):
+            matched = []
+            if list(df["row_id"]) == [5]:
+                matched = [[4, datetime.date(2020, 1, 4), 5]]
+            return pandas.DataFrame(matched, columns=["row_id", "service_date", "match_row_id"])
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1, index=dates.index)
+
+    import src.client
+    def backfill_day(date):
+        indexed = pandas.DataFrame({"fingerprint": [7], "row_id": [date.day], "service_date": [date]})
+        return 1, [([], [], None, indexed)], {}, None
+    src.client._backfill_day = backfill_day
+    client.fingerprints = Mock_Fingerprints()
+    client.service_periods = Mock_Service_Periods()
+
+    assert client._parallel_backfill(datetime.date(2020, 1, 4), datetime.date(2020, 1, 5), 2) == True
+    assert saved == [5, 4]
+
+def test_save_output_parquet(tmp_path, instance_fixture):
+    pytest.importorskip("pyarrow")
+    instance_fixture._output_type = "parquet"
+    instance_fixture._output_path = str(tmp_path)
+    instance_fixture._save_output([[1, 1, 1, "2020/1/1"]], [])
+    instance_fixture._save_output([], [], append=True, checkpoint=[])
+
+    assert (tmp_path / "flags.parquet").exists()
+    df = pandas.read_parquet(str(tmp_path / "flagged_data"))
+    assert list(df["row_id"]) == [1]
+
+def test_process_chunk_metrics(instance_fixture):
+    import pandas
+    from src.metrics import metrics
+    from flaggers.flagger import Flagger, Flags
+
+    class Door_Flagger(Flagger):
+        name = "Door"
+        def flag(self, data, config):
+            return []
+        def flag_frame(self, df, config):
+            return {Flags.UNOPENED_DOOR: df["door"] == 0}
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series([1.0, 1.0, None], index=dates.index)
+
+    metrics.reset()
+    instance_fixture.service_periods = Mock_Service_Periods()
+    df = pandas.DataFrame({
+        "service_date": pandas.to_datetime(["2020-01-01"] * 3),
+        "door": [0, 1, 0]}, index=[1, 2, 3])
+    instance_fixture._process_chunk(df, [Door_Flagger()])
+
+    text = metrics.render()
+    assert "\npipeline_rows_read_total 3\n" in text
+    assert "\npipeline_rows_skipped_total 1\n" in text
+    assert 'pipeline_rows_flagged_total{flag="unopened-door"} 1\n' in text
+    assert 'pipeline_flagger_seconds_count{flagger="Door"} 1\n' in text
+
+def test_process_chunk_drops_duplicate_flags(instance_fixture):
+    import pandas
+    from flaggers.flagger import Flagger, Flags
+
+    # The same flag from a frame flagger and a row flagger.
+    class Frame_Flagger(Flagger):
+        name = "Frame Door"
+        def flag(self, data, config):
+            return []
+        def flag_frame(self, data, config):
+            return {Flags.UNOPENED_DOOR: data["door"] == 0}
+    class Row_Flagger(Flagger):
+        name = "Row Door"
+        def flag(self, data, config):
+            return [Flags.UNOPENED_DOOR] if data["door"] == 0 else []
+
+    class Mock_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1, index=dates.index)
+    instance_fixture.service_periods = Mock_Service_Periods()
+
+    df = pandas.DataFrame({
+        "service_date": pandas.to_datetime(["2020-01-01"] * 3),
+        "door": [0, 1, 0]}, index=[1, 2, 3])
+    flagged_rows, _, _ = instance_fixture._process_chunk(df, [Frame_Flagger(), Row_Flagger()])
+    assert sorted(row[0] for row in flagged_rows) == [1, 3]
+
+def test_flag_data_sorts_trips_once(monkeypatch, instance_fixture):
+    import pandas
+    import src.client
+    from flaggers.flagger import flaggers, Flags, Trips
+
+    built = []
+    def counting_trips(df):
+        built.append(df)
+        return Trips(df)
+    monkeypatch.setattr(src.client, "Trips", counting_trips)
+
+    sequence_flaggers = [f for f in flaggers if f.name in
+                         ["Arrive Time Regression", "Implied Speed", "Mileage Regression"]]
+    df = pandas.DataFrame({
+        "service_date": pandas.to_datetime(["2020-01-01"] * 2),
+        "vehicle_number": [1, 1], "trip_id": [1, 1], "stop_time": [100, 200],
+        "arrive_time": [100, 90], "pattern_distance": [0.0, 100.0],
+        "train_mileage": [5.0, 4.0]}, index=[1, 2])
+    flagged_rows, _ = instance_fixture._flag_data(
+        df, pandas.Series([1, 1], index=df.index), sequence_flaggers)
+
+    assert len(built) == 1
+    assert sorted(row[2] for row in flagged_rows) == sorted(
+        [int(Flags.ARRIVE_TIME_REGRESSION), int(Flags.MILEAGE_REGRESSION)])
+    assert all(row[0] == 2 for row in flagged_rows)
+
+def test_build_location_references(instance_fixture):
+    import datetime
+    import pandas
+    from src.spatial import locations
+
+    references = pandas.DataFrame({"location_id": [1], "x_coordinate": [-122.6],
+                                   "y_coordinate": [45.6], "observations": [9]})
+    class Mock_CTran():
+        def get_latest_day(self):
+            return datetime.date(2020, 3, 31)
+        def query_location_references(self, start_date, end_date):
+            self.range = (start_date, end_date)
+            return references
+
+    class Mock_References():
+        def __init__(self):
+            self.written = []
+        def write_table(self, df):
+            self.written.append(df)
+            return True
+        def query_references(self):
+            return references
+
+    instance_fixture.ctran = Mock_CTran()
+    instance_fixture.location_references = Mock_References()
+    try:
+        assert instance_fixture.build_location_references() == True
+        assert instance_fixture.ctran.range == (datetime.date(2020, 1, 2), datetime.date(2020, 3, 31))
+        assert len(instance_fixture.location_references.written) == 1
+        assert len(locations) == 1
+
+        # Loaded already, so a run doesn't load them again.
+        instance_fixture.location_references = None
+        instance_fixture._load_locations(flaggers_named("GPS Outlier"))
+    finally:
+        locations.clear()
+
+def flaggers_named(name):
+    from flaggers.flagger import flaggers
+    return [f for f in flaggers if f.name == name]
+
+def test_process_data_saves_reference_stats(monkeypatch, chunked_client):
+    import datetime
+    import pandas
+    from src.config import config
+    from src.baselines import baselines
+    client, saved = chunked_client
+
+    for chunk in client.ctran.chunks:
+        chunk["location_id"] = 1
+        chunk["dwell"] = 10
+
+    class Mock_Reference_Stats():
+        def __init__(self):
+            self.written = []
+            self.days = []
+        def write_table(self, stats, days=()):
+            self.written.append(stats)
+            self.days.extend(days)
+            return True
+        def query_stats(self):
+            return self.written[-1] if self.written else None
+        def query_days(self):
+            return self.days
+
+    monkeypatch.setitem(config._data, "reference_stats", True)
+    monkeypatch.setitem(config._data, "sql_pushdown", False)
+    client.reference_stats = Mock_Reference_Stats()
+    client._write_metrics = lambda: None
+    try:
+        date = datetime.date(2020, 1, 1)
+        assert client.process_data(date, date) == True
+        assert len(client.reference_stats.written) == 1
+        stats = client.reference_stats.written[0]
+        assert stats[["key_type", "key_value", "metric", "observations"]].values.tolist() == [
+            ["location_id", 1, "dwell", 3]]
+        assert [str(day) for day in client.reference_stats.days] == ["2020-01-01"]
+        assert baselines.get("location_id", "dwell", 1).mean == 10.0
+
+        # The day is counted already, so processing it again adds nothing.
+        assert client.process_data(date, date) == True
+        assert len(client.reference_stats.written) == 1
+    finally:
+        baselines.clear()
+
+@pytest.fixture
+def reprocess_client(monkeypatch, instance_fixture):
+    from src.config import config
+    from flaggers.flagger import flaggers, flagger_version
+
+    monkeypatch.setitem(config._data, "day_fingerprints", True)
+    monkeypatch.setitem(config._data, "duplicate_index", False)
+    version = flagger_version(flaggers, config)
+    def day(n):
+        return datetime.date(2020, 1, n)
+    def checkpoint(status, n, version):
+        return {"status": status, "source_rows": n, "max_row_id": 10 * n,
+                "source_hash": str(n) * 32, "flagger_version": version}
+
+    class Mock_Checkpoints():
+        def __init__(self):
+            # Day 2's rows changed since, day 3 was never processed, day 5
+            # was flagged by other flaggers and day 6 failed.
+            self.stored = {day(1): checkpoint("complete", 1, version),
+                           day(2): checkpoint("complete", 2, version),
+                           day(4): checkpoint("complete", 4, version),
+                           day(5): checkpoint("complete", 5, "0" * 32),
+                           day(6): checkpoint("failed", 6, version)}
+            self.deleted = []
+        def query_date_range(self, start_date, end_date):
+            return self.stored
+        def delete_date_range(self, start_date, end_date):
+            self.deleted.append((start_date, end_date))
+            return True
+
+    class Mock_CTran():
+        def fingerprint_date_range(self, date_from, date_to):
+            fingerprints = dict((day(n), (n, 10 * n, str(n) * 32)) for n in range(1, 7))
+            fingerprints[day(2)] = (3, 20, "2" * 32)
+            return fingerprints
+
+    # A real Flagged_Data, so that the run bounds go through its date
+    # handling; only the statements are recorded.
+    class Mock_Connection():
+        def __init__(self):
+            self.deleted = []
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def execute(self, sql):
+            self.deleted.append(tuple(
+                datetime.datetime.strptime(date, "%Y-%m-%d").date()
+                for date in sql.split("'")[1:4:2]))
+
+    processed = []
+    def process_data(start_date, end_date):
+        processed.append((start_date, end_date))
+        return True
+
+    flagged = Flagged_Data("sw23", "invalid", "localhost", "aperture")
+    connection = Mock_Connection()
+    flagged._engine.connect = lambda: connection
+    flagged.deleted = connection.deleted
+    instance_fixture.checkpoints = Mock_Checkpoints()
+    instance_fixture.flagged = flagged
+    instance_fixture.ctran = Mock_CTran()
+    instance_fixture.process_data = process_data
+    return instance_fixture, processed
+
+def test_reprocess_skips_unchanged_days(reprocess_client):
+    client, processed = reprocess_client
+    day = lambda n: datetime.date(2020, 1, n)
+
+    assert client.reprocess("2020/01/01", "2020/01/06") == True
+    assert client.day_report == {"skipped": [day(1), day(4)],
+                                 "processed": [day(2), day(3), day(5), day(6)]}
+    # Only the changed days are deleted and processed, run by run.
+    assert processed == [(day(2), day(3)), (day(5), day(6))]
+    assert client.checkpoints.deleted == processed
+    assert client.flagged.deleted == processed
+
+def test_reprocess_unchanged_range(reprocess_client):
+    client, processed = reprocess_client
+    assert client.reprocess("2020/01/04", "2020/01/04") == True
+    assert client.day_report == {"skipped": [datetime.date(2020, 1, 4)], "processed": []}
+    assert processed == []
+    assert client.flagged.deleted == []
+
+def test_reprocess_after_location_references_change(reprocess_client):
+    import pandas
+    from src.spatial import locations
+    client, processed = reprocess_client
+
+    class Mock_Location_References():
+        def query_references(self):
+            return pandas.DataFrame({"location_id": [1], "x_coordinate": [-122.6],
+                                     "y_coordinate": [45.5]})
+
+    # The days were flagged without these references, so none is unchanged.
+    client.location_references = Mock_Location_References()
+    try:
+        assert client.reprocess("2020/01/01", "2020/01/06") == True
+        assert client.day_report["skipped"] == []
+        assert processed == [(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))]
+    finally:
+        locations.clear()
+
+def test_reprocess_delete_error(reprocess_client):
+    client, processed = reprocess_client
+    client.flagged.delete_date_range = lambda start_date, end_date: False
+    assert client.reprocess("2020/01/01", "2020/01/06") == False
+    # Nothing else of the run is deleted without its flags.
+    assert client.checkpoints.deleted == []
+    assert processed == []
+
+def test_reprocess_without_day_fingerprints(monkeypatch, reprocess_client):
+    from src.config import config
+    client, processed = reprocess_client
+    monkeypatch.setitem(config._data, "day_fingerprints", False)
+    assert client.reprocess("2020/01/01", "2020/01/06") == True
+    assert processed == [(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))]
+
+def test_reprocess_fingerprint_error(reprocess_client):
+    client, processed = reprocess_client
+    client.ctran.fingerprint_date_range = lambda date_from, date_to: None
+    assert client.reprocess("2020/01/01", "2020/01/06") == True
+    assert client.day_report["skipped"] == []
+    assert processed == [(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))]
+
+def test_process_since_checkpoint_skips_unchanged_days(reprocess_client):
+    client, processed = reprocess_client
+    client.checkpoints.get_latest_day = lambda: datetime.date(2019, 12, 31)
+    client.flagged.get_latest_day = lambda: None
+    assert client.process_since_checkpoint(workers=1, end_date=datetime.date(2020, 1, 6)) == True
+    assert processed == [(datetime.date(2020, 1, 2), datetime.date(2020, 1, 3)),
+                         (datetime.date(2020, 1, 5), datetime.date(2020, 1, 6))]
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
 import sys
 import os
 import json
@@ -43,6 +43,19 @@ def log():
         except FileNotFoundError:
                 return 'Log file not found for {}.'.format(today)
 
+@app.route('/metrics')
+def metrics():
+        # The pipeline saves its metrics to metrics_file after every run.
+        with open('../assets/config.json') as f:
+                metrics_file = json.load(f).get('metrics_file') or 'output/metrics.prom'
+
+        try:
+                with open('../' + metrics_file) as f:
+                        return Response(f.read(), mimetype='text/plain; version=0.0.4')
+
+        except FileNotFoundError:
+                return Response('', mimetype='text/plain; version=0.0.4')
+
 @app.route('/shutdown')
 def shutdown_ui():
         print('Shutting down StopSpot UI...')